@@ -3,8 +3,12 @@ import streamlit as st
 import os
 import sys 
 import datetime # For logging
+import time
+import uuid
 
+SCRIPT_RUN_STARTED_AT = time.perf_counter() # For the per-rerun render timing in Diagnostics
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+CHAT_RENDER_WINDOW = int(os.getenv("CHAT_RENDER_WINDOW", "30")) # Most recent messages rendered; older ones load on demand
 if PROJECT_ROOT not in sys.path: sys.path.insert(0, PROJECT_ROOT)
 
 # --- Logging Helper (can be shared if you make a utils.py for logging) ---
@@ -12,10 +16,21 @@ def log_app_message(message: str):
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"APP LOG [{timestamp}]: {message}")
 
+# langchain, the OpenAI client stack and pinecone are not imported here: core modules load them on first use
+# (core.startup_profiler.lazy_import). Run with STARTUP_PROFILE=1 to print an import/init-time breakdown.
 try:
-    from core import story_manager 
-    from core.narration import VOICE_OPTIONS_MAP, initialize_pinecone
-    from core.story_engine import build_agent_context_for_prompt 
+    from core.startup_profiler import profile_stage, report_startup_profile
+    with profile_stage("core.story_manager", kind="import"): from core import story_manager 
+    with profile_stage("core.narration", kind="import"):
+        from core.narration import VOICE_OPTIONS_MAP, initialize_style_store, prefetch_voice_styles, invalidate_style_cache, get_style_cache_stats, find_similar_styles
+        from core.narration import get_style_backend_health, STYLE_BACKEND_PROBE_SECONDS
+    with profile_stage("core.story_engine, core.llm_clients, core.style_library, core.embedding_utils, core.speculation, core.tracing", kind="import"):
+        from core.story_engine import build_agent_context_for_prompt 
+        from core.llm_clients import get_llm_client_stats
+        from core.style_library import list_author_styles
+        from core.embedding_utils import get_embedding_model_stats, warm_up_embedding_model
+        from core.speculation import get_speculation_stats, SPECULATIVE_SLIDES_DEFAULT
+        from core.tracing import get_recent_spans, get_tracing_stats
 except ImportError as e:
     st.error(f"CRITICAL IMPORT ERROR: {e}. Check structure & __init__.py files."); st.stop() 
 
@@ -46,20 +61,36 @@ else:
     log_app_message("xAI API Key configured successfully.")
 
 
-# --- Initialize Pinecone --- (Same as before)
-if 'pinecone_initialized_app' not in st.session_state:
-    log_app_message("Initializing Pinecone for narration styles...")
-    st.session_state.pinecone_initialized_app = initialize_pinecone() 
-    if not st.session_state.pinecone_initialized_app:
-        log_app_message("Pinecone initialization FAILED.")
-        st.warning("Pinecone for narration could not be initialized. Some styles may use fallbacks.")
-    else:
-        log_app_message("Pinecone initialized successfully.")
+# --- Initialize Narration Style Store (Pinecone or local snapshot) ---
+# Once per process, shared by every browser session: the store's client/index handle and the prefetched style cache.
+@st.cache_resource(show_spinner="Connecting to the narration style store...")
+def initialize_narration_resources() -> bool:
+    log_app_message("Initializing style store for narration styles...")
+    with profile_stage("style store"): initialized = initialize_style_store()
+    if initialized:
+        log_app_message("Style store initialized successfully.")
+        with profile_stage("style cache prefetch"): prefetch_voice_styles() # One batched fetch; later style lookups are served from memory
+        warm_up_embedding_model(background=True) # So the first "find similar styles" search doesn't pay the model load
+    return initialized
+
+if 'style_store_initialized_app' not in st.session_state:
+    st.session_state.style_store_initialized_app = initialize_narration_resources()
+    if not st.session_state.style_store_initialized_app:
+        initialize_narration_resources.clear() # Failures aren't cached: the next new session retries
+        log_app_message("Style store initialization FAILED.")
+        st.warning("The narration style store (Pinecone or local snapshot) could not be initialized. Some styles may use fallbacks.")
 
 # --- Page and Session State Setup --- (Same as before)
 st.set_page_config(page_title="Story Weaver (Langchain Edition)", layout="wide")
 st.title("📖 AI Story Weaver (Powered by Langchain & xAI/Grok)")
 
+if 'story_state_object' not in st.session_state and st.query_params.get("session"):
+    with profile_stage("session resume"): resumed_state = story_manager.resume_story_state(st.query_params.get("session")) # ?session=<id> survives refreshes and restarts
+    if resumed_state is not None:
+        st.session_state.story_state_object = resumed_state
+        st.session_state.session_id = st.query_params.get("session")
+        log_app_message(f"Resumed story session '{st.session_state.session_id}' ({len(resumed_state.messages)} messages).")
+
 if 'story_state_object' not in st.session_state:
     log_app_message("Session state 'story_state_object' not found. Initializing.")
     initial_state_dict = story_manager.initialize_story_state()
@@ -78,10 +109,17 @@ else:
     log_app_message("Found existing 'story_state_object' in session state.")
 
 
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if st.query_params.get("session") != st.session_state.session_id:
+    st.query_params["session"] = st.session_state.session_id # Bookmarkable: reopening the URL resumes this story
+
 def get_current_story_state_with_ui_inputs() -> story_manager.StoryState: # Same as before
     s_obj = st.session_state.story_state_object
     ui_inputs = {
         "xai_api_key": XAI_API_KEY_FOR_CHAINS, 
+        "session_id": st.session_state.session_id,
+        "speculative_slides": st.session_state.get("speculative_slides_toggle_key", SPECULATIVE_SLIDES_DEFAULT),
         "new_char_name_val": st.session_state.get("new_char_name_input_sidebar_ui_key", ""),
         "new_char_role_val": st.session_state.get("new_char_role_input_sidebar_ui_key", ""),
         "custom_author_name_val": st.session_state.get("custom_author_name_input_ui_key", "")
@@ -91,6 +129,7 @@ def get_current_story_state_with_ui_inputs() -> story_manager.StoryState: # Same
 
 def update_session_state_from_story_manager(returned_story_state: story_manager.StoryState): # Same as before
     st.session_state.story_state_object = returned_story_state
+    story_manager.persist_story_state(returned_story_state, st.session_state.session_id) # Journals only what changed
     if returned_story_state.ui_inputs.get("clear_char_inputs"):
         st.session_state.new_char_name_input_sidebar_ui_key = "" 
         st.session_state.new_char_role_input_sidebar_ui_key = "" 
@@ -100,9 +139,10 @@ def update_session_state_from_story_manager(returned_story_state: story_manager.
         returned_story_state.ui_inputs["clear_author_input"] = False 
 
 # --- Sidebar UI ---
-with st.sidebar: # Logging added for button clicks and important selections
-    st.caption(f"Using xAI Grok via Langchain")
-    st.markdown("---")
+# Each sidebar section is a fragment: typing, toggling or selecting reruns only that section instead of
+# the whole page. Actions that change the story call st.rerun(), which still reruns the full app.
+@st.fragment
+def render_story_elements_sidebar():
     st.header("🛠️ Story Elements")
     
     current_s_state_for_ui_defaults = st.session_state.story_state_object
@@ -116,16 +156,22 @@ with st.sidebar: # Logging added for button clicks and important selections
         new_s_state, updated, status = story_manager.handle_story_details_update(s_state_for_handler, genre_val.strip(), setting_val.strip(), tone_val.strip())
         update_session_state_from_story_manager(new_s_state)
         if updated: st.rerun()
-        else: st.sidebar.info(status)
+        else: st.info(status)
 
-    st.markdown("---")
+@st.fragment
+def render_narration_voice_sidebar():
     st.header("🎤 Narration Voice")
+    style_backend_health = get_style_backend_health()
+    if style_backend_health["state"] != "closed":
+        st.warning(f"Style store unreachable ({style_backend_health['state'].replace('_', '-')} circuit): using the last known styles. "
+                   f"Retrying in the background every {STYLE_BACKEND_PROBE_SECONDS:.0f}s.", icon="📡")
+    current_s_state_for_ui_defaults = st.session_state.story_state_object
     voice_options_keys = list(VOICE_OPTIONS_MAP.keys())
     try:
         current_style_id_in_state = current_s_state_for_ui_defaults.narration_voice_id
-        if current_style_id_in_state.startswith("custom_"): 
+        if current_style_id_in_state not in VOICE_OPTIONS_MAP.values(): # Emulated author or a style picked via search
             current_selectbox_idx = 0 
-            st.sidebar.caption(f"Current: Emulating {current_s_state_for_ui_defaults.story_config.get('narration_style',{}).get('name_display','Unknown Author')}")
+            st.caption(f"Current: {current_s_state_for_ui_defaults.story_config.get('narration_style',{}).get('name_display','Unknown Style')}")
         else:
             selected_display_name = [k for k, v in VOICE_OPTIONS_MAP.items() if v == current_style_id_in_state][0]
             current_selectbox_idx = voice_options_keys.index(selected_display_name)
@@ -133,8 +179,12 @@ with st.sidebar: # Logging added for button clicks and important selections
         
     selected_display = st.selectbox("Pre-defined Style:", options=voice_options_keys, index=current_selectbox_idx, key="narration_voice_selectbox_key")
     selected_style_id = VOICE_OPTIONS_MAP[selected_display]
+    # React only to the user changing the selectbox, so styles applied elsewhere (author emulation,
+    # style search) aren't reverted to the selectbox's stale value on the next rerun.
+    previous_selected_display = st.session_state.get("narration_voice_selectbox_previous", selected_display)
+    st.session_state.narration_voice_selectbox_previous = selected_display
 
-    if selected_style_id != current_s_state_for_ui_defaults.narration_voice_id:
+    if selected_display != previous_selected_display and selected_style_id != current_s_state_for_ui_defaults.narration_voice_id:
         log_app_message(f"Sidebar Selectbox Change: Narration style to '{selected_display}' (ID: '{selected_style_id}')")
         s_state_for_handler = get_current_story_state_with_ui_inputs()
         if s_state_for_handler.narration_voice_id != selected_style_id: 
@@ -142,20 +192,62 @@ with st.sidebar: # Logging added for button clicks and important selections
             update_session_state_from_story_manager(new_s_state)
             if updated: st.rerun()
 
+    has_slide_to_preview = bool(current_s_state_for_ui_defaults.last_story_slide_text)
+    if st.button("🎭 Preview slide in all styles", disabled=not has_slide_to_preview,
+                 help="Re-narrate the last story slide in every voice and saved author style at once, side by side."):
+        log_app_message("Sidebar Button Click: 'Preview slide in all styles'.")
+        st.session_state.style_preview_requested = True
+        st.rerun() # The preview is rendered in the main area
+
+    st.markdown("##### Or, Find a Style Like This:")
+    style_search_text = st.text_area("Paste a passage or describe a voice", key="style_search_text_key", height=100)
+    if st.button("🔎 Find Similar Styles"):
+        log_app_message(f"Sidebar Button Click: 'Find Similar Styles'. Query length={len(style_search_text.strip())}")
+        if style_search_text.strip():
+            with st.spinner("Searching styles..."):
+                st.session_state.style_search_results = find_similar_styles(style_search_text.strip(), top_k=3)
+            if not st.session_state.style_search_results: st.info("No matching styles found (is the style store initialized?).")
+        else: st.warning("Please paste a passage or describe a voice.")
+    for result_idx, result in enumerate(st.session_state.get("style_search_results", [])):
+        result_col, use_col = st.columns([3, 1])
+        result_col.markdown(f"**{result['name_display']}**  \n{result['score']:.2f} similarity")
+        is_current_style = result["voice_id"] == current_s_state_for_ui_defaults.narration_voice_id
+        if use_col.button("Use", key=f"use_searched_style_{result_idx}_{result['voice_id']}", disabled=is_current_style):
+            log_app_message(f"Sidebar Button Click: 'Use' searched style '{result['voice_id']}' (score {result['score']:.3f})")
+            s_state_for_handler = get_current_story_state_with_ui_inputs()
+            new_s_state, updated = story_manager.handle_narration_voice_change(s_state_for_handler, result["voice_id"])
+            update_session_state_from_story_manager(new_s_state)
+            if updated: st.rerun()
+
     st.markdown("##### Or, Emulate an Author:")
     author_name_val = st.text_input("Author's Full Name", key="custom_author_name_input_ui_key", value=st.session_state.story_state_object.ui_inputs.get("custom_author_name_val", ""))
+    force_refresh_author = st.checkbox("Regenerate even if saved", key="force_refresh_author_style_key")
     if st.button("✨ Emulate Author Style"):
-        log_app_message(f"Sidebar Button Click: 'Emulate Author Style'. Author='{author_name_val}'")
+        log_app_message(f"Sidebar Button Click: 'Emulate Author Style'. Author='{author_name_val}', Force refresh={force_refresh_author}")
         if author_name_val.strip():
             s_state_for_handler = get_current_story_state_with_ui_inputs()
-            new_s_state, success = story_manager.handle_custom_author_style_change(s_state_for_handler, author_name_val.strip())
+            new_s_state, success = story_manager.handle_custom_author_style_change(s_state_for_handler, author_name_val.strip(), force_refresh=force_refresh_author)
             new_s_state.ui_inputs["clear_author_input"] = success 
             update_session_state_from_story_manager(new_s_state)
             if success: st.rerun()
         else: st.warning("Please enter an author's name.")
-            
-    st.markdown("---")
+
+    saved_author_styles = list_author_styles()
+    if saved_author_styles:
+        saved_author_labels = {f"{entry['author_name']} (used {entry.get('uses', 0)}×)": entry for entry in saved_author_styles}
+        selected_saved_author = st.selectbox("Saved Author Styles:", options=list(saved_author_labels.keys()), key="saved_author_style_selectbox_key")
+        if st.button("📚 Use Saved Author Style"):
+            saved_entry = saved_author_labels[selected_saved_author]
+            log_app_message(f"Sidebar Button Click: 'Use Saved Author Style'. Author='{saved_entry['author_name']}'")
+            s_state_for_handler = get_current_story_state_with_ui_inputs()
+            new_s_state, success = story_manager.handle_custom_author_style_change(s_state_for_handler, saved_entry["author_name"])
+            update_session_state_from_story_manager(new_s_state)
+            if success: st.rerun()
+
+@st.fragment
+def render_characters_sidebar():
     st.header("👥 Characters")
+    current_s_state_for_ui_defaults = st.session_state.story_state_object
     char_name_val = st.text_input("Name", key="new_char_name_input_sidebar_ui_key", value=st.session_state.story_state_object.ui_inputs.get("new_char_name_val", ""))
     char_role_val = st.text_input("Role/Archetype", key="new_char_role_input_sidebar_ui_key", value=st.session_state.story_state_object.ui_inputs.get("new_char_role_val", ""))
     if st.button("➕ Add Character"):
@@ -170,13 +262,196 @@ with st.sidebar: # Logging added for button clicks and important selections
         st.write("Current Characters:")
         for agent in current_s_state_for_ui_defaults.agents: st.write(f"- **{agent['name']}** ({agent.get('role', 'N/A')})")
 
+def render_trace_panel():
+    session_spans = get_recent_spans(limit=300, session_id=st.session_state.session_id)
+    tracing_stats = get_tracing_stats()
+    st.caption(f"Tracing: {tracing_stats['spans']} spans ({tracing_stats['errors']} errors) this process"
+               f"{', exported to ' + tracing_stats['trace_file'] if tracing_stats['trace_file'] else ''}.")
+    if not session_spans: st.caption("No spans recorded for this session yet."); return
+    spans_by_id = {record["span_id"]: record for record in session_spans}
+    def depth(record: dict) -> int:
+        level = 0
+        while record["parent_id"] in spans_by_id: record = spans_by_id[record["parent_id"]]; level += 1
+        return level
+    rows = []
+    for record in reversed(session_spans): # Newest first; children finish before their parents, so they are listed above them
+        attributes = record["attributes"]
+        tokens = attributes.get("prompt_tokens", 0) + attributes.get("completion_tokens", 0)
+        rows.append({"span": "  " * depth(record) + record["name"], "kind": record["kind"], "ms": record["duration_ms"],
+                     "tokens": tokens or None, "status": record["error"] or record["status"],
+                     "at": datetime.datetime.fromtimestamp(record["started_at"]).strftime("%H:%M:%S")})
+    st.dataframe(rows, hide_index=True, width="stretch")
+
+@st.fragment
+def render_settings_sidebar():
+    st.toggle("⚡ Stream responses", value=True, key="stream_responses_toggle_key", help="Show the AI's reply token by token as it is generated.")
+    st.toggle("🔮 Pre-generate next slide", value=SPECULATIVE_SLIDES_DEFAULT, key="speculative_slides_toggle_key",
+              help="After each story slide, generate the next one in the background so 'continue' is answered instantly. Uses extra API calls.")
+    st.toggle("🧵 Compile in background", value=True, key="compile_in_background_toggle_key", help="Run full-story compilation as a background job you can follow and cancel.")
+    if st.toggle("🧭 Show trace panel", value=False, key="trace_panel_toggle_key", help="Timing spans of this session's handlers, chain stages, LLM calls, style lookups and embeddings."):
+        render_trace_panel()
+    with st.expander("⚙️ Diagnostics"):
+        llm_stats = get_llm_client_stats()
+        st.caption(f"LLM clients: {llm_stats['active_clients']} pooled, reuse rate {llm_stats['reuse_rate']:.0%} "
+                   f"({llm_stats['hits']}/{llm_stats['requests']}), HTTP/2: {'on' if llm_stats['http2'] else 'off'}")
+        style_stats = get_style_cache_stats()
+        st.caption(f"Style cache: {style_stats['entries']} entries, hit rate {style_stats['hit_rate']:.0%} "
+                   f"({style_stats['hits']} hits / {style_stats['misses']} misses, {style_stats['prefetched']} prefetched)")
+        backend_stats = get_style_backend_health()
+        st.caption(f"Style backend ({backend_stats['backend'] or 'none'}): circuit {backend_stats['state'].replace('_', '-')}, "
+                   f"{backend_stats['failures']} failures ({backend_stats['timeouts']} timeouts), {backend_stats['rejected']} lookups served "
+                   f"without a call, {style_stats['stale_served']} last-known-good styles served"
+                   f"{', last error: ' + backend_stats['last_error'] if backend_stats['last_error'] else ''}")
+        prompt_compiler = sys.modules.get("core.prompt_compiler") # Imported with the chains; until then nothing was compiled
+        prompt_stats = prompt_compiler.get_prompt_compiler_stats().values() if prompt_compiler else []
+        st.caption(f"Prompt compiler: {sum(p['calls'] for p in prompt_stats)} prompts, ~{sum(p['tokens_saved'] for p in prompt_stats)} tokens "
+                   f"({sum(p['bytes_saved'] for p in prompt_stats)} bytes) saved by omitting empty sections")
+        history_stats = st.session_state.story_state_object.history_window.stats()
+        summary_stats = st.session_state.story_state_object.summary_memory.stats()
+        st.caption(f"Chat history window: {history_stats['entries']} entries, {history_stats['tokens']}/{history_stats['token_budget']} tokens. "
+                   f"Story synopsis: {summary_stats['summary_words']} words covering {summary_stats['summarized_segments']} slides"
+                   f"{', updating…' if summary_stats['updating'] else ''}{', ' + str(summary_stats['pending_segments']) + ' pending' if summary_stats['pending_segments'] else ''}")
+        tracing_stats = get_tracing_stats()
+        st.caption(f"Tracing: {'on' if tracing_stats['enabled'] else 'off'}, {tracing_stats['spans']} spans, {tracing_stats['errors']} errors, "
+                   f"{tracing_stats['buffered']} in memory, trace file: {tracing_stats['trace_file'] or 'none'}")
+        dedup_stats = story_manager.get_request_dedup_stats()
+        st.caption(f"Request dedup: {dedup_stats['shared_inflight'] + dedup_stats['shared_recent']} duplicate sidebar requests served without a new call "
+                   f"({dedup_stats['shared_inflight']} joined in flight, {dedup_stats['shared_recent']} just finished) of {dedup_stats['calls']}")
+        renarration_stats = st.session_state.story_state_object.renarration_cache.stats()
+        st.caption(f"Re-narration cache (this session): {renarration_stats['entries']} renditions, {renarration_stats['bytes'] // 1024}/"
+                   f"{renarration_stats['max_bytes'] // 1024} KiB, hit rate {renarration_stats['hit_rate']:.0%}, {renarration_stats['evictions']} evictions")
+        speculation_stats = get_speculation_stats()
+        session_speculation = st.session_state.story_state_object.speculation.stats()
+        st.caption(f"Speculative slides: hit rate {speculation_stats['hit_rate']:.0%} ({speculation_stats['hits']} hits, "
+                   f"{speculation_stats['hits_waited']} still in flight, {speculation_stats['misses']} misses), "
+                   f"~{speculation_stats['wasted_tokens_last_hour']} tokens discarded in the last hour, {speculation_stats['skipped_budget']} skipped by limits. "
+                   f"This session: {session_speculation['hits']} hits, misses {session_speculation['misses']}{', paused' if session_speculation['paused'] else ''}")
+        embedding_stats = get_embedding_model_stats()
+        if embedding_stats["loaded"]:
+            st.caption(f"Embedding model: loaded on {embedding_stats['device']} in {embedding_stats['load_seconds']}s, "
+                       f"RSS {embedding_stats['rss_before_mb'] or 0:.0f} → {embedding_stats['rss_after_mb'] or 0:.0f} MB")
+        else:
+            st.caption(f"Embedding model: not loaded{' (error: ' + embedding_stats['error'] + ')' if embedding_stats['error'] else ''}")
+        render_timings = st.session_state.get("render_timings", [])
+        if render_timings:
+            last_timing = render_timings[-1]
+            st.caption(f"Last rerun: rendered {last_timing['rendered']} of {last_timing['messages']} messages in {last_timing['chat_render_ms']} ms "
+                       f"(full script {last_timing['script_run_ms']} ms)")
+            st.line_chart(render_timings, x="messages", y=["chat_render_ms", "script_run_ms"], height=150)
+        if st.button("🔄 Reload narration styles"):
+            log_app_message("Sidebar Button Click: 'Reload narration styles'.")
+            invalidate_style_cache()
+            prefetch_voice_styles()
+
+with st.sidebar: # Logging added for button clicks and important selections
+    st.caption(f"Using xAI Grok via Langchain")
+    st.markdown("---")
+    render_story_elements_sidebar()
+    st.markdown("---")
+    render_narration_voice_sidebar()
+    st.markdown("---")
+    render_characters_sidebar()
+    st.markdown("---")
+    render_settings_sidebar()
+
 # --- Main Chat Area ---
+# Windowed: only the last chat_render_limit visible messages are rendered on each rerun.
+def load_older_messages():
+    st.session_state.chat_render_limit = st.session_state.get("chat_render_limit", CHAT_RENDER_WINDOW) + CHAT_RENDER_WINDOW
+
 chat_container = st.container()
 active_story_state = st.session_state.story_state_object
-for msg_idx, msg in enumerate(active_story_state.messages): # Added index for potential debug
+chat_render_started_at = time.perf_counter()
+chat_render_limit = st.session_state.get("chat_render_limit", CHAT_RENDER_WINDOW)
+visible_msg_indices, older_messages_hidden = [], False
+for msg_idx in range(len(active_story_state.messages) - 1, -1, -1): # Newest first; stops at the window edge
+    msg = active_story_state.messages[msg_idx]
     if msg["role"] == "system" and not msg["content"].startswith("System Update:"): continue 
+    if len(visible_msg_indices) == chat_render_limit: older_messages_hidden = True; break
+    visible_msg_indices.append(msg_idx)
+if older_messages_hidden:
+    chat_container.button(f"⬆️ Load {CHAT_RENDER_WINDOW} older messages", key="load_older_messages_button_key", on_click=load_older_messages)
+for msg_idx in reversed(visible_msg_indices):
+    msg = active_story_state.messages[msg_idx]
     with chat_container.chat_message(msg["role"]):
         st.markdown(msg["content"])
+chat_render_ms = (time.perf_counter() - chat_render_started_at) * 1000
+
+# --- Background Compile Job Status ---
+if 'compile_job_id' not in st.session_state and st.query_params.get("compile_job"):
+    st.session_state.compile_job_id = st.query_params.get("compile_job") # Re-attach after a browser refresh
+
+@st.fragment(run_every=2)
+def render_compile_job_status():
+    job_id = st.session_state.get("compile_job_id")
+    if not job_id: return
+    s_state, job_status = story_manager.poll_compile_job(st.session_state.story_state_object, job_id)
+    if job_status is None or job_status["status"] in story_manager.FINISHED_JOB_STATUSES:
+        log_app_message(f"Compile job {job_id} finished with status: {job_status['status'] if job_status else 'missing'}")
+        del st.session_state.compile_job_id
+        st.query_params.pop("compile_job", None)
+        update_session_state_from_story_manager(s_state)
+        st.rerun() # Full rerun so the chat shows the compiled story
+    stages = job_status["stages"]
+    progress = len(job_status["completed_stages"]) / len(stages) if stages else 0.0
+    current_label = story_manager.compile_stage_label(job_status["current_stage"]) if job_status["current_stage"] else "Waiting for a worker"
+    compiling_what = "novel" if job_status["stages"] == list(story_manager.NOVEL_COMPILE_STAGE_LABELS) else "story"
+    with st.container(border=True):
+        st.progress(progress, text=f"📜 Compiling {compiling_what}: {current_label} ({job_status['stage_chars'].get(job_status['current_stage'], 0)} chars, {job_status['elapsed_seconds']}s)")
+        if job_status["cancel_requested"]: st.caption("Cancelling...")
+        elif st.button("🛑 Cancel compilation", key="cancel_compile_job_button_key"):
+            story_manager.cancel_compile_job(job_id)
+
+if st.session_state.get("compile_job_id"):
+    render_compile_job_status()
+
+# --- Style Preview ---
+# The last slide re-narrated in every style, filled in as the concurrent calls complete. Kept for later
+# reruns while that slide is still the latest one.
+STYLE_PREVIEW_COLUMNS = 3
+
+def render_style_preview_variant(slot, variant: dict):
+    with slot.container(border=True):
+        st.markdown(f"**{variant['name_display']}**{' · current' if variant['source'] == 'current' else ''}")
+        if variant["error"]: st.caption(f"⚠️ Could not re-narrate: {variant['error']}"); return
+        st.markdown(variant["text"])
+        if variant["source"] != "current" and st.button("Use this style", key=f"use_preview_style_{variant['style_id']}"):
+            log_app_message(f"Style Preview Click: 'Use this style' '{variant['style_id']}'")
+            s_state_for_handler = get_current_story_state_with_ui_inputs()
+            new_s_state, updated = story_manager.handle_preview_style_choice(s_state_for_handler, variant["style_id"])
+            update_session_state_from_story_manager(new_s_state)
+            if updated: st.rerun()
+
+def render_style_preview():
+    s_state = st.session_state.story_state_object
+    preview = st.session_state.get("style_preview")
+    run_preview = st.session_state.pop("style_preview_requested", False) and s_state.last_story_slide_text
+    if not run_preview and (not preview or preview["source_text"] != s_state.last_story_slide_text): return
+    with st.container(border=True):
+        header_col, close_col = st.columns([5, 1])
+        header_col.markdown("#### 🎭 Last slide in every style")
+        if close_col.button("Close", key="close_style_preview_key"):
+            st.session_state.pop("style_preview", None); st.rerun()
+        if run_preview:
+            preview_styles = story_manager.list_preview_styles()
+            style_order = [style_id for style_id, _ in preview_styles]
+        else: style_order = preview["order"]
+        columns = st.columns(STYLE_PREVIEW_COLUMNS)
+        slots = {style_id: columns[i % STYLE_PREVIEW_COLUMNS].empty() for i, style_id in enumerate(style_order)}
+        if not run_preview:
+            for style_id in style_order:
+                if style_id in preview["variants"]: render_style_preview_variant(slots[style_id], preview["variants"][style_id])
+                else: slots[style_id].caption("Interrupted: preview again to fill in.")
+            return
+        for style_id in style_order: slots[style_id].caption("⏳ Re-narrating...")
+        preview = st.session_state.style_preview = {"source_text": s_state.last_story_slide_text, "order": style_order, "variants": {}}
+        started_at = time.perf_counter()
+        for variant in story_manager.preview_last_slide_in_styles(get_current_story_state_with_ui_inputs(), preview_styles):
+            preview["variants"][variant["style_id"]] = variant
+            render_style_preview_variant(slots[variant["style_id"]], variant)
+        log_app_message(f"Style preview: {len(preview['variants'])} styles in {time.perf_counter() - started_at:.1f}s.")
+
+render_style_preview()
 
 user_chat_input = st.chat_input("Your turn to shape the story...")
 if user_chat_input:
@@ -184,24 +459,72 @@ if user_chat_input:
     if not story_manager.XAI_API_KEY_CONFIGURED: st.error("API key missing."); st.stop()
     
     s_state_for_handler = get_current_story_state_with_ui_inputs()
-    s_state_for_handler.messages.append({"role": "user", "content": user_chat_input}) # Add user message
+    s_state_for_handler.add_message("user", user_chat_input) # Add user message
     s_state_for_handler.last_story_slide_text = None 
     
     processed_state = None
     input_lower = user_chat_input.lower().strip()
     compile_kw = ["compile story", "full story", "write the story"]
+    compile_novel_kw = ["compile novel", "write the novel", "full novel"]
+
+    stream_responses = st.session_state.get("stream_responses_toggle_key", True)
+    compile_in_background = st.session_state.get("compile_in_background_toggle_key", True)
+    if stream_responses and "add character:" not in input_lower:
+        with chat_container.chat_message("user"):
+            st.markdown(user_chat_input)
 
-    if any(kw in input_lower for kw in compile_kw):
-        log_app_message(f"User command: Compile full story.")
-        st.info("📜 Compiling full story with Langchain agents...")
-        processed_state = story_manager.handle_compile_full_story(s_state_for_handler)
+    if any(kw in input_lower for kw in compile_novel_kw): # Always a background job: minutes of generation
+        log_app_message("User command: Compile novel.")
+        processed_state, job_id = story_manager.submit_compile_novel_job(s_state_for_handler)
+        if job_id:
+            st.session_state.compile_job_id = job_id
+            st.query_params["compile_job"] = job_id
+    elif any(kw in input_lower for kw in compile_kw):
+        log_app_message(f"User command: Compile full story. Background: {compile_in_background}, Streaming: {stream_responses}")
+        if compile_in_background:
+            processed_state, job_id = story_manager.submit_compile_full_story_job(s_state_for_handler)
+            if job_id:
+                st.session_state.compile_job_id = job_id
+                st.query_params["compile_job"] = job_id # Survives a browser refresh
+        elif stream_responses:
+            # Render each pipeline stage (outline -> draft -> refined story) as its tokens arrive.
+            with chat_container.chat_message("assistant"):
+                current_stage, stage_placeholder, stage_text = None, None, ""
+                for stage_key, chunk in story_manager.handle_compile_full_story_stream(s_state_for_handler):
+                    if stage_key != current_stage:
+                        if stage_placeholder is not None: stage_placeholder.markdown(stage_text)
+                        current_stage, stage_text = stage_key, ""
+                        st.markdown(f"**{story_manager.COMPILE_STAGE_LABELS.get(stage_key, stage_key)}**")
+                        stage_placeholder = st.empty()
+                    stage_text += chunk
+                    stage_placeholder.markdown(stage_text + "▌")
+                if stage_placeholder is not None: stage_placeholder.markdown(stage_text)
+            processed_state = s_state_for_handler
+        else:
+            st.info("📜 Compiling full story with Langchain agents...")
+            processed_state = story_manager.handle_compile_full_story(s_state_for_handler)
     elif "add character:" in input_lower:
         log_app_message(f"User command: Add character via chat.")
         processed_state, _ = story_manager.handle_add_character_chat(s_state_for_handler, user_chat_input)
     else:
-        log_app_message(f"User command: Regular chat input for story continuation.")
-        processed_state = story_manager.handle_regular_chat_input(s_state_for_handler, user_chat_input) # Pass full user_chat_input
+        log_app_message(f"User command: Regular chat input for story continuation. Streaming: {stream_responses}")
+        if stream_responses:
+            with chat_container.chat_message("assistant"):
+                st.write_stream(story_manager.handle_regular_chat_input_stream(s_state_for_handler, user_chat_input))
+            processed_state = s_state_for_handler
+        else:
+            processed_state = story_manager.handle_regular_chat_input(s_state_for_handler, user_chat_input) # Pass full user_chat_input
     
     if processed_state:
         update_session_state_from_story_manager(processed_state)
-        st.rerun()
\ No newline at end of file
+        st.rerun()
+
+# --- Render Timing (reruns that end in st.rerun() above don't reach this point) ---
+script_run_ms = (time.perf_counter() - SCRIPT_RUN_STARTED_AT) * 1000
+render_timings = st.session_state.setdefault("render_timings", [])
+render_timings.append({"messages": len(active_story_state.messages), "rendered": len(visible_msg_indices),
+                       "chat_render_ms": round(chat_render_ms, 1), "script_run_ms": round(script_run_ms, 1)})
+del render_timings[:-50] # Keep the last 50 reruns
+log_app_message(f"Rerun rendered {len(visible_msg_indices)}/{len(active_story_state.messages)} messages: "
+                f"chat {chat_render_ms:.1f} ms, full script {script_run_ms:.1f} ms")
+report_startup_profile() # Once per process, if STARTUP_PROFILE=1
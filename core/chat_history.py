@@ -0,0 +1,112 @@
+# core/chat_history.py
+# Token-budgeted chat-history window for the slide chain.
+# The window is kept on the StoryState and synced incrementally: each turn only the messages
+# appended since the last sync are tokenized, oversized entries (e.g. compiled stories) are
+# clipped, and the oldest entries are evicted once the token budget is exceeded. Evicted message
+# indices are handed to the rolling summary memory (core/story_summary.py).
+import os
+import threading
+from collections import deque
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_MAX_ENTRY_TOKENS = int(os.getenv("HISTORY_MAX_ENTRY_TOKENS", "600"))
+HISTORY_MAX_COMPILED_TOKENS = int(os.getenv("HISTORY_MAX_COMPILED_TOKENS", "200"))
+HISTORY_TOKENIZER_ENCODING = os.getenv("HISTORY_TOKENIZER_ENCODING", "cl100k_base")
+COMPILED_STORY_MESSAGE_PREFIX = "✨ Langchain story compilation complete!"
+COMPILED_NOVEL_MESSAGE_PREFIX = "📚 Novel compilation complete!"
+CHARS_PER_TOKEN = 4 # Fallback estimate when tiktoken is unavailable
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        with _encoder_lock:
+            if not _encoder_loaded:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.get_encoding(HISTORY_TOKENIZER_ENCODING)
+                except Exception as e: # Not installed, or the encoding file can't be downloaded
+                    print(f"Chat History: tiktoken unavailable ({e}). Estimating {CHARS_PER_TOKEN} chars per token.")
+                _encoder_loaded = True
+    return _encoder
+
+def estimate_tokens(text: str) -> int:
+    if not text: return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def clip_text(text: str, text_tokens: int, max_tokens: int) -> str:
+    """Keeps the head and tail of an oversized text (2/3 and 1/3 of the allowance) around an omission marker."""
+    if text_tokens <= max_tokens: return text
+    keep_chars = max(1, len(text) * max_tokens // text_tokens)
+    head_chars, tail_chars = keep_chars * 2 // 3, keep_chars // 3
+    tail = text[-tail_chars:] if tail_chars else ""
+    return f"{text[:head_chars]}\n[... {text_tokens - max_tokens} tokens omitted ...]\n{tail}"
+
+
+class HistoryWindow:
+    """Running window of 'role: content' history entries, bounded by a token budget."""
+    def __init__(self, token_budget: int = HISTORY_TOKEN_BUDGET, max_entry_tokens: int = HISTORY_MAX_ENTRY_TOKENS,
+                 max_compiled_tokens: int = HISTORY_MAX_COMPILED_TOKENS):
+        self.token_budget = token_budget
+        self.max_entry_tokens = max_entry_tokens
+        self.max_compiled_tokens = max_compiled_tokens
+        self._entries = deque() # (message index, role, formatted text, tokens)
+        self._total_tokens = 0
+        self._synced_count = 0
+        self._evicted_indices = []
+        self.evicted_count = 0
+        self.clipped_count = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self._total_tokens
+
+    def reset(self):
+        self._entries.clear()
+        self._total_tokens = 0
+        self._synced_count = 0
+        self._evicted_indices = []
+
+    def sync(self, messages: list):
+        """Appends the messages added since the last sync. A shorter list than before means a new story: rebuild."""
+        if len(messages) < self._synced_count: self.reset()
+        for message_index in range(self._synced_count, len(messages)):
+            self._append(message_index, messages[message_index])
+        self._synced_count = len(messages)
+
+    def _append(self, message_index: int, message: dict):
+        content = message.get("content") or ""
+        content_tokens = message.token_count if hasattr(message, "token_count") else estimate_tokens(content) # MessageRecords cache it
+        max_tokens = self.max_compiled_tokens if content.startswith((COMPILED_STORY_MESSAGE_PREFIX, COMPILED_NOVEL_MESSAGE_PREFIX)) else self.max_entry_tokens
+        if content_tokens > max_tokens:
+            content = clip_text(content, content_tokens, max_tokens)
+            content_tokens = estimate_tokens(content)
+            self.clipped_count += 1
+        text = f"{message['role']}: {content}"
+        tokens = content_tokens + 2 # Role label and separator
+        self._entries.append((message_index, message["role"], text, tokens))
+        self._total_tokens += tokens
+        while self._total_tokens > self.token_budget and len(self._entries) > 1:
+            evicted_index, _, _, evicted_tokens = self._entries.popleft()
+            self._total_tokens -= evicted_tokens
+            self._evicted_indices.append(evicted_index)
+            self.evicted_count += 1
+
+    def pop_evicted_indices(self) -> list[int]:
+        """Message indices evicted since the last call, oldest first."""
+        evicted_indices, self._evicted_indices = self._evicted_indices, []
+        return evicted_indices
+
+    def format(self, exclude_message_index: int = None) -> str:
+        return "\n".join(text for message_index, _, text, _ in self._entries if message_index != exclude_message_index)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "tokens": self._total_tokens, "token_budget": self.token_budget,
+                "evicted": self.evicted_count, "clipped": self.clipped_count}
@@ -0,0 +1,139 @@
+# core/circuit_breaker.py
+# Circuit breaker for remote backends (the Pinecone style store).
+# Calls run with an explicit timeout. After failure_threshold consecutive failures or timeouts the
+# circuit opens: calls are rejected immediately with CircuitOpenError (callers serve cached data) and a
+# background thread probes the backend every probe_interval seconds. A probe runs in the half-open
+# state; success closes the circuit, failure re-opens it. Without a probe function, the first call
+# after probe_interval is let through as the half-open trial instead.
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the backend while the circuit is open."""
+
+
+class CircuitTimeoutError(TimeoutError):
+    """The backend call did not finish within the breaker's timeout (it is abandoned, not cancelled)."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 3, call_timeout: float = 5.0, probe_interval: float = 30.0,
+                 probe=None, max_workers: int = 4):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.call_timeout = call_timeout
+        self.probe_interval = probe_interval
+        self.probe = probe # Callable that raises if the backend is still unhealthy
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"breaker-{name}")
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._probing = False # A _probe_loop thread is running
+        self._stats = {"calls": 0, "successes": 0, "failures": 0, "timeouts": 0, "rejected": 0,
+                       "opened": 0, "probes": 0, "probe_failures": 0}
+        self.last_error = None
+        self.last_state_change = time.time()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _set_state(self, state: str):
+        if state == self._state: return
+        print(f"Circuit Breaker '{self.name}': {self._state} -> {state}"
+              f"{' (' + self.last_error + ')' if state == STATE_OPEN and self.last_error else ''}")
+        self._state = state
+        self.last_state_change = time.time()
+        if state == STATE_OPEN:
+            self._opened_at = time.monotonic()
+            self._stats["opened"] += 1
+            if self.probe is not None and not self._probing:
+                self._probing = True
+                threading.Thread(target=self._probe_loop, name=f"breaker-{self.name}-probe", daemon=True).start()
+        elif state == STATE_CLOSED:
+            self._consecutive_failures = 0; self._opened_at = None
+
+    def _allow(self) -> bool:
+        with self._lock:
+            if self._state == STATE_CLOSED: return True
+            if (self._state == STATE_OPEN and self.probe is None and not self._trial_in_flight
+                    and time.monotonic() - self._opened_at >= self.probe_interval):
+                self._set_state(STATE_HALF_OPEN)
+                self._trial_in_flight = True
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def _record(self, error: Exception = None):
+        with self._lock:
+            self._trial_in_flight = False
+            if error is None:
+                self._stats["successes"] += 1
+                self._consecutive_failures = 0
+                self._set_state(STATE_CLOSED)
+                return
+            self._stats["failures"] += 1
+            if isinstance(error, CircuitTimeoutError): self._stats["timeouts"] += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            self._consecutive_failures += 1
+            if self._state == STATE_HALF_OPEN: # Failed trial or probe: back to open; the running probe thread keeps probing
+                self._state = STATE_OPEN; self._opened_at = time.monotonic(); self.last_state_change = time.time()
+            elif self._state == STATE_CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._set_state(STATE_OPEN)
+
+    def _run_with_timeout(self, fn, args, kwargs, timeout: float):
+        future = self._executor.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise CircuitTimeoutError(f"'{self.name}' call exceeded {timeout:.1f}s") from None
+
+    def call(self, fn, *args, timeout: float = None, **kwargs):
+        """Runs fn(*args, **kwargs) with the timeout. Raises CircuitOpenError without calling fn while the circuit is open."""
+        if not self._allow(): raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        with self._lock: self._stats["calls"] += 1
+        try:
+            result = self._run_with_timeout(fn, args, kwargs, timeout or self.call_timeout)
+        except Exception as e:
+            self._record(e)
+            raise
+        self._record()
+        return result
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                if self._state != STATE_OPEN: self._probing = False; return
+                self._set_state(STATE_HALF_OPEN)
+                self._stats["probes"] += 1
+            try:
+                self._run_with_timeout(self.probe, (), {}, self.call_timeout)
+            except Exception as e:
+                with self._lock: self._stats["probe_failures"] += 1
+                self._record(e)
+                continue
+            with self._lock: self._probing = False
+            self._record()
+            print(f"Circuit Breaker '{self.name}': Probe succeeded, backend is healthy again.")
+            return
+
+    def reset(self):
+        """Closes the circuit by hand (e.g. after the backend configuration was fixed)."""
+        with self._lock: self._set_state(STATE_CLOSED)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(name=self.name, state=self._state, consecutive_failures=self._consecutive_failures,
+                         last_error=self.last_error, last_state_change=self.last_state_change,
+                         open_seconds=round(time.monotonic() - self._opened_at, 1) if self._opened_at is not None else None)
+        return stats
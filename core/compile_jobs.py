@@ -0,0 +1,154 @@
+# core/compile_jobs.py
+# Background job subsystem for long-running generations (full-story compilation).
+# Jobs run on a process-wide worker pool, off the Streamlit script-runner thread, and
+# report per-stage progress that the UI polls. Jobs can be cancelled between chunks/stages.
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .tracing import span
+
+COMPILE_JOB_WORKERS = int(os.getenv("COMPILE_JOB_WORKERS", "4")) # Novel jobs fan out further (see novel_compiler.NOVEL_MAX_INFLIGHT_CALLS)
+COMPILE_JOB_RETENTION_SECONDS = float(os.getenv("COMPILE_JOB_RETENTION_SECONDS", "3600"))
+# A job nobody has polled for this long is treated as abandoned (closed tab) and cancelled.
+COMPILE_JOB_ABANDON_SECONDS = float(os.getenv("COMPILE_JOB_ABANDON_SECONDS", "180"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_JOB_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class CompileJob:
+    def __init__(self, job_id: str, stages: list, session_id: str = None):
+        self.job_id = job_id
+        self.session_id = session_id
+        self.stages = list(stages)
+        self.status = JOB_QUEUED
+        self.current_stage = None
+        self.completed_stages = []
+        self.stage_chars = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.last_polled_at = time.time()
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    # --- Called from the worker ---
+    def check_cancelled(self):
+        if not self._cancel_event.is_set() and time.time() - self.last_polled_at > COMPILE_JOB_ABANDON_SECONDS:
+            print(f"Compile Jobs: Job {self.job_id} has not been polled for {COMPILE_JOB_ABANDON_SECONDS:.0f}s. Cancelling.")
+            self._cancel_event.set()
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.job_id)
+
+    def start_stage(self, stage_key: str):
+        self.check_cancelled()
+        with self._lock:
+            if self.current_stage and self.current_stage not in self.completed_stages:
+                self.completed_stages.append(self.current_stage)
+            self.current_stage = stage_key
+            self.stage_chars.setdefault(stage_key, 0)
+
+    def record_progress(self, stage_key: str, n_chars: int):
+        with self._lock:
+            self.stage_chars[stage_key] = self.stage_chars.get(stage_key, 0) + n_chars
+
+    # --- Called from the UI ---
+    def touch(self):
+        self.last_polled_at = time.time()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id, "status": self.status, "stages": list(self.stages),
+                "current_stage": self.current_stage, "completed_stages": list(self.completed_stages),
+                "stage_chars": dict(self.stage_chars), "result": self.result, "error": self.error,
+                "cancel_requested": self._cancel_event.is_set(),
+                "elapsed_seconds": round((self.finished_at or time.time()) - (self.started_at or self.created_at), 1),
+            }
+
+
+class CompileJobManager:
+    def __init__(self, max_workers: int = COMPILE_JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="compile-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, target, stages: list, session_id: str = None) -> str:
+        """Queues target(job) on the worker pool and returns the job id. target's return value becomes job.result."""
+        self._prune()
+        job = CompileJob(uuid.uuid4().hex[:12], stages, session_id)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._executor.submit(contextvars.copy_context().run, self._run, job, target) # The job's spans join the submitting trace
+        print(f"Compile Jobs: Submitted job {job.job_id} (session: {session_id}).")
+        return job.job_id
+
+    def _run(self, job: CompileJob, target):
+        try:
+            job.check_cancelled()  # Cancelled while still queued
+            job.status, job.started_at = JOB_RUNNING, time.time()
+            with span("compile_job", kind="job", session_id=job.session_id, job_id=job.job_id, stages=list(job.stages)):
+                job.result = target(job)
+            if job.current_stage and job.current_stage not in job.completed_stages:
+                job.completed_stages.append(job.current_stage)
+            job.status = JOB_COMPLETED
+        except JobCancelled:
+            job.status = JOB_CANCELLED
+            print(f"Compile Jobs: Job {job.job_id} cancelled during stage '{job.current_stage}'.")
+        except Exception as e:
+            job.status, job.error = JOB_FAILED, str(e)
+            print(f"Compile Jobs: Job {job.job_id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        if job is None: return None
+        job.touch()
+        return job.snapshot()
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED_JOB_STATUSES: return False
+        job.cancel()
+        return True
+
+    def _prune(self):
+        cutoff = time.time() - COMPILE_JOB_RETENTION_SECONDS
+        with self._lock:
+            for job_id in [j_id for j_id, j in self._jobs.items() if j.finished_at and j.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_compile_job_manager() -> CompileJobManager:
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = CompileJobManager()
+    return _manager
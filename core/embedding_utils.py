@@ -1,29 +1,164 @@
 # core/embedding_utils.py
-from sentence_transformers import SentenceTransformer
-
-MODEL_NAME = 'all-MiniLM-L6-v2' 
-try:
-    embedding_model = SentenceTransformer(MODEL_NAME)
-    EMBEDDING_DIMENSION = embedding_model.get_sentence_embedding_dimension()
-    print(f"Sentence Transformer model '{MODEL_NAME}' loaded. Dimension: {EMBEDDING_DIMENSION}")
-except Exception as e:
-    print(f"Error loading Sentence Transformer model '{MODEL_NAME}': {e}")
-    embedding_model = None
-    EMBEDDING_DIMENSION = 384 
+# The sentence-transformers model is loaded lazily, on first use (or by an explicit background
+# warm-up), instead of at import time: importing torch and the model costs seconds and hundreds of MB.
+import os
+import threading
+import time
 
-def get_embedding(text: str) -> list[float] | None:
-    if not embedding_model:
-        print("Embedding model not loaded. Cannot generate embedding.")
+from .tracing import span
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+DEFAULT_EMBEDDING_DIMENSION = 384 # all-MiniLM-L6-v2; known without loading the model
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE") or None # e.g. "cpu", "cuda", "mps"; None lets sentence-transformers decide
+EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", "0")) # 0 keeps torch's default
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# MiniLM truncates input at 256 word pieces (~190 words), so long texts are embedded as overlapping chunks.
+CHUNK_WORDS = 160
+CHUNK_OVERLAP_WORDS = 40
+
+
+def _get_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm", "r") as f: # Linux: current resident set size
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        pass
+    try:
+        import resource # Unix fallback: peak RSS (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+    except Exception:
         return None
+
+
+class EmbeddingModelHolder:
+    """Thread-safe, lazily initialized holder for the shared SentenceTransformer model."""
+    def __init__(self, model_name: str = MODEL_NAME, device: str = EMBEDDING_DEVICE, num_threads: int = EMBEDDING_NUM_THREADS):
+        self.model_name = model_name
+        self.device = device
+        self.num_threads = num_threads
+        self._model = None
+        self._load_failed = False
+        self._lock = threading.Lock()
+        self._warmup_thread = None
+        self._stats = {"loads": 0, "unloads": 0, "load_seconds": None, "rss_before_mb": None, "rss_after_mb": None, "error": None}
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def get_model(self):
+        if self._model is not None: return self._model
+        with self._lock:
+            if self._model is None and not self._load_failed:
+                self._load()
+        return self._model
+
+    def _load(self):
+        rss_before = _get_rss_mb()
+        started_at = time.perf_counter()
+        try:
+            if self.num_threads > 0:
+                import torch
+                torch.set_num_threads(self.num_threads)
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device=self.device)
+            load_seconds = time.perf_counter() - started_at
+            self._stats.update({"loads": self._stats["loads"] + 1, "load_seconds": round(load_seconds, 3),
+                                "rss_before_mb": rss_before, "rss_after_mb": _get_rss_mb(), "error": None})
+            print(f"Sentence Transformer model '{self.model_name}' loaded in {load_seconds:.2f}s on device '{self._model.device}'. "
+                  f"Dimension: {self._model.get_sentence_embedding_dimension()}. "
+                  f"RSS: {rss_before or 0:.0f} MB -> {self._stats['rss_after_mb'] or 0:.0f} MB")
+        except Exception as e:
+            print(f"Error loading Sentence Transformer model '{self.model_name}': {e}")
+            self._load_failed = True # Don't retry (and re-pay the import) on every call
+            self._stats["error"] = str(e)
+
+    def warm_up(self, background: bool = True):
+        """Loads the model now, optionally on a daemon thread so startup isn't blocked."""
+        if self.is_loaded: return
+        if not background:
+            self.get_model(); return
+        if self._warmup_thread is None or not self._warmup_thread.is_alive():
+            self._warmup_thread = threading.Thread(target=self.get_model, name="embedding-warmup", daemon=True)
+            self._warmup_thread.start()
+
+    def unload(self):
+        with self._lock:
+            if self._model is None: return
+            self._model = None
+            self._load_failed = False
+            self._stats["unloads"] += 1
+        import gc; gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available(): torch.cuda.empty_cache()
+        except Exception:
+            pass
+        print(f"Sentence Transformer model '{self.model_name}' unloaded.")
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats.update({"model_name": self.model_name, "loaded": self.is_loaded, "device": str(self._model.device) if self._model is not None else self.device})
+        return stats
+
+
+embedding_model_holder = EmbeddingModelHolder()
+
+def warm_up_embedding_model(background: bool = True):
+    embedding_model_holder.warm_up(background=background)
+
+def unload_embedding_model():
+    embedding_model_holder.unload()
+
+def get_embedding_model_stats() -> dict:
+    return embedding_model_holder.stats()
+
+def get_embedding(text: str) -> list[float] | None:
     if not text or not isinstance(text, str):
         print("Invalid text provided for embedding.")
         return None
+    embedding_model = embedding_model_holder.get_model()
+    if not embedding_model:
+        print("Embedding model not loaded. Cannot generate embedding.")
+        return None
     try:
-        embedding = embedding_model.encode(text, convert_to_tensor=False) 
-        return embedding.tolist() 
+        with span("embedding.encode", kind="embedding", model=embedding_model_holder.model_name, texts=1, chars=len(text)):
+            embedding = embedding_model.encode(text, convert_to_tensor=False)
+        return embedding.tolist()
     except Exception as e:
         print(f"Error generating embedding for text: '{text[:50]}...': {e}")
         return None
 
+def get_embeddings(texts: list[str]) -> list[list[float]] | None:
+    """Batch-encodes many texts in a single encode() call."""
+    if not texts or not all(isinstance(t, str) and t for t in texts):
+        print("Invalid texts provided for batch embedding.")
+        return None
+    embedding_model = embedding_model_holder.get_model()
+    if not embedding_model:
+        print("Embedding model not loaded. Cannot generate embeddings.")
+        return None
+    try:
+        with span("embedding.encode", kind="embedding", model=embedding_model_holder.model_name, texts=len(texts), chars=sum(len(t) for t in texts)):
+            embeddings = embedding_model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True)
+        return embeddings.tolist()
+    except Exception as e:
+        print(f"Error generating batch embeddings for {len(texts)} texts: {e}")
+        return None
+
+def chunk_text(text: str, chunk_words: int = CHUNK_WORDS, overlap_words: int = CHUNK_OVERLAP_WORDS) -> list[str]:
+    """Splits text into overlapping word windows that each fit within the model's token limit."""
+    words = (text or "").split()
+    if not words: return []
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words): break
+    return chunks
+
 def get_embedding_dimension() -> int:
-    return EMBEDDING_DIMENSION
\ No newline at end of file
+    if embedding_model_holder.is_loaded:
+        return embedding_model_holder.get_model().get_sentence_embedding_dimension()
+    return DEFAULT_EMBEDDING_DIMENSION
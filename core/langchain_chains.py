@@ -1,11 +1,78 @@
 # core/langchain_chains.py
 import os
-from langchain_openai import ChatOpenAI
+import threading
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain, SequentialChain
+from langchain_core.callbacks import BaseCallbackHandler
 
 # Import the Bennet specific prompt from core.prompts
 from core.prompts import BENNET_STYLE_INITIAL_SCENE_PROMPT 
+from core.llm_clients import get_llm_client_registry
+from core.prompt_compiler import CompiledPromptTemplate, PromptSection, TIER_STATIC, TIER_STYLE, TIER_SESSION, TIER_TURN
+from core.chat_history import estimate_tokens
+from core.tracing import tracer, span
+
+# --- Tracing ---
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Opens a span (core/tracing.py) per chain run and per LLM call, nested through LangChain's run ids.
+    Runs without a traced parent become children of the current span (e.g. the story_manager handler).
+    LLM spans carry the provider's token usage when it is reported, otherwise estimates.
+    """
+    def __init__(self):
+        self._spans = {} # run_id -> open Span
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, parent_run_id, name: str, kind: str, **attributes):
+        with self._lock: parent = self._spans.get(parent_run_id)
+        run_span = tracer.start_span(name, kind, parent=parent, **attributes)
+        with self._lock: self._spans[run_id] = run_span
+        return run_span
+
+    def _pop(self, run_id):
+        with self._lock: return self._spans.pop(run_id, None)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start(run_id, parent_run_id, f"chain.{(metadata or {}).get('trace_stage') or kwargs.get('name') or 'chain'}", "chain")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        run_span = self._pop(run_id)
+        if run_span is None: return
+        if isinstance(outputs, dict): run_span.set(output_chars=sum(len(v) for v in outputs.values() if isinstance(v, str)))
+        tracer.finish_span(run_span)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        run_span = self._pop(run_id)
+        if run_span is not None: tracer.finish_span(run_span, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        prompt_text = "".join(str(message.content) for batch in messages for message in batch)
+        self._start(run_id, parent_run_id, "llm.call", "llm", model=(kwargs.get("invocation_params") or {}).get("model_name"),
+                    estimated_prompt_tokens=estimate_tokens(prompt_text))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm.call", "llm", model=(kwargs.get("invocation_params") or {}).get("model_name"),
+                    estimated_prompt_tokens=estimate_tokens("".join(prompts)))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run_span = self._pop(run_id)
+        if run_span is None: return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        completion_text = "".join(generation.text for generations in response.generations for generation in generations)
+        run_span.add_tokens(usage.get("prompt_tokens") or run_span.attributes.pop("estimated_prompt_tokens", 0),
+                            usage.get("completion_tokens") or estimate_tokens(completion_text))
+        run_span.set(token_usage="reported" if usage else "estimated", output_chars=len(completion_text))
+        tracer.finish_span(run_span)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run_span = self._pop(run_id)
+        if run_span is not None: tracer.finish_span(run_span, error)
+
+
+TRACING_CALLBACKS = [TracingCallbackHandler()] # Shared by every chain and pooled LLM client
+
+def _llm_chain(llm, prompt, output_key: str) -> LLMChain:
+    return LLMChain(llm=llm, prompt=prompt, output_key=output_key, callbacks=TRACING_CALLBACKS, metadata={"trace_stage": output_key})
 
 # --- Configuration for Grok/xAI LLM ---
 XAI_BASE_URL = "https://api.x.ai/v1" 
@@ -14,11 +81,13 @@ XAI_MODEL_NAME = "grok-3-mini"
 def get_grok_llm(api_key: str, temperature: float = 0.7):
     if not api_key:
         raise ValueError("xAI API key not provided for Langchain LLM initialization.")
-    return ChatOpenAI(
-        model_name=XAI_MODEL_NAME,
-        openai_api_key=api_key, 
-        openai_api_base=XAI_BASE_URL,
+    # Pooled: the same ChatOpenAI (and its keep-alive HTTP connections) is reused across turns and sessions.
+    return get_llm_client_registry().get(
+        api_key=api_key,
+        model=XAI_MODEL_NAME,
         temperature=temperature,
+        base_url=XAI_BASE_URL,
+        callbacks=TRACING_CALLBACKS,
     )
 
 # --- Prompt Templates ---
@@ -62,15 +131,18 @@ PLOT_OUTLINE_PROMPT = PromptTemplate(
 )
 
 # Agent 4: Story Draft Generator (Uses more explicit data unpacking instructions)
-story_draft_template = """
+# Compiled prompt: static instructions first, then the style guide, story setup and the per-call plot outline.
+STORY_DRAFT_PROMPT = CompiledPromptTemplate(
+    prompt_name="story_draft",
+    sections=[
+        PromptSection("instructions", """
 You are a masterful and meticulous storyteller AI.
 
-IMPORTANT SCENARIO DIRECTIVE:
-{initial_scene_directive_draft} 
-If the above directive is not empty, it is MANDATORY for shaping the opening of your story. You MUST use the protagonist type, setting, themes, and opening moment described. This directive OVERRIDES any conflicting generic genre/setting/character information if it's provided for an initial scene.
-
-Your primary task is to write a complete and cohesive story based ONLY on the following parameters and plot outline.
-
+Your primary task is to write a complete and cohesive story (approx. 1000-1500 words) based ONLY on the parameters and plot outline below.
+If an IMPORTANT SCENARIO DIRECTIVE is given below, it is MANDATORY for shaping the opening of your story. You MUST use the protagonist type, setting, themes, and opening moment described. This directive OVERRIDES any conflicting generic genre/setting/character information for the opening.
+Begin the story directly. No preambles, meta-commentary, or questions to the user.
+""", TIER_STATIC),
+        PromptSection("narration_style", """
 --- NARRATION STYLE GUIDE (CRITICAL - ADHERE STRICTLY FOR THE ENTIRE STORY) ---
 Style Persona: '{narration_name_display}'
 Core Characteristics & Specific Writing Guidelines: 
@@ -79,7 +151,12 @@ Literary Inspiration: '{narration_inspired_by}'
 Source Text Snippet for Stylistic Emulation (Study this carefully for voice, sentence structure, and tone):
 {narration_style_snippet_instruction} 
 --- END NARRATION STYLE GUIDE ---
-
+""", TIER_STYLE),
+        PromptSection("scenario_directive", """
+IMPORTANT SCENARIO DIRECTIVE:
+{initial_scene_directive_draft} 
+""", TIER_SESSION, optional_variables=("initial_scene_directive_draft",)),
+        PromptSection("story_parameters", """
 FINAL STORY PARAMETERS (Use these if not overridden by the SCENARIO DIRECTIVE for the opening):
 - Genre: {genre}
 - Setting: {setting}
@@ -87,34 +164,36 @@ FINAL STORY PARAMETERS (Use these if not overridden by the SCENARIO DIRECTIVE fo
 
 FINAL CHARACTERS (Use these if not overridden by the SCENARIO DIRECTIVE for the opening, or adapt them to fit):
 {characters_full_profiles}
-
+""", TIER_SESSION),
+        PromptSection("plot_outline", """
 CRITICAL PLOT OUTLINE TO FOLLOW (Expand these beats into a narrative, infused with the above Narration Style):
 {plot_outline}
 
-Based ONLY on ALL the above details, write the full story (approx. 1000-1500 words).
-Begin the story directly. No preambles, meta-commentary, or questions to the user.
-"""
-STORY_DRAFT_PROMPT = PromptTemplate(
-    input_variables=[
-        "initial_scene_directive_draft", 
-        "genre", "setting", "tone",
-        "narration_name_display", "narration_tone", "narration_inspired_by", "narration_style_snippet_instruction",
-        "characters_full_profiles",
-        "plot_outline", # Output from plot_outline_chain
+Based ONLY on ALL the above details, write the full story now.
+""", TIER_TURN),
     ],
-    template=story_draft_template
 )
 
 # Agent 5: Story Refinement Generator (CORRECTED to use {plot_outline})
-story_refinement_template = """
-You are an expert story editor with an impeccable eye for detail. Review the following story draft:
-
---- STORY DRAFT START ---
-{story_draft}
---- STORY DRAFT END ---
+# Compiled prompt: the refinement task and style guide lead; the (per-call) draft comes last.
+STORY_REFINEMENT_PROMPT = CompiledPromptTemplate(
+    prompt_name="story_refinement",
+    sections=[
+        PromptSection("instructions", """
+You are an expert story editor with an impeccable eye for detail. You will review the story draft given at the end.
 
-The story MUST be refined to strictly adhere to ALL of the following:
+*** YOUR REFINEMENT TASK ***
+Meticulously rewrite and polish the draft. Your primary focus is:
+1.  **Absolute Adherence to the Narration Style Guide below.** This is paramount.
+2.  **Faithful Adherence to Plot Outline and Initial Scene Directives (if applicable).**
+3.  **Deep Character Consistency** based on their provided profiles.
+4.  Enhanced Imagery, Sensory Details, Pacing, Flow, Emotional Impact.
+5.  Elimination of Clichés, Awkward Phrasing, and anything "AI-generated." Ensure Chekhov's Gun principle is respected if noted in guidelines.
+6.  Cohesion and compelling language.
 
+Do NOT add new major plot points or fundamentally change the story's core events from the draft. Elevate the existing material based on ALL the provided directives.
+""", TIER_STATIC),
+        PromptSection("narration_style", """
 --- NARRATION STYLE GUIDE (MANDATORY ADHERENCE) ---
 Style Persona: '{narration_name_display}'
 Core Characteristics & Specific Writing Guidelines for this Style: 
@@ -123,15 +202,8 @@ Literary Inspiration: '{narration_inspired_by}'
 Source Text Snippet for Stylistic Emulation (CRITICAL - Ensure refined draft's voice matches this):
 {narration_style_snippet_instruction_refine}
 --- END NARRATION STYLE GUIDE ---
-
-=== SCENARIO & PLOT DIRECTIVES (Check for adherence in the draft) ===
-Initial Scene Directive (If this shaped the story's opening, ensure the refined draft maintains its core elements and intent):
-{initial_scene_directive_refine}
-
-Main Plot Outline (The refined story MUST still follow this original plot structure):
-{plot_outline} 
---- END SCENARIO & PLOT DIRECTIVES ---
-
+""", TIER_STYLE),
+        PromptSection("character_consistency", """
 === CHARACTER CONSISTENCY (Check for adherence in the draft) ===
 Active Characters & Their Core Profiles (Ensure their actions/dialogue in the refined draft are consistent with these):
 {characters_full_profiles_for_refinement_context}
@@ -141,125 +213,283 @@ Contextual Story Elements (for reference):
 - Genre: {genre}
 - Setting: {setting}
 - Overall Tone: {tone}
+""", TIER_SESSION),
+        PromptSection("scenario_directive", """
+Initial Scene Directive (This shaped the story's opening; ensure the refined draft maintains its core elements and intent):
+{initial_scene_directive_refine}
+""", TIER_SESSION, optional_variables=("initial_scene_directive_refine",)),
+        PromptSection("plot_outline", """
+Main Plot Outline (The refined story MUST still follow this original plot structure):
+{plot_outline} 
+""", TIER_TURN),
+        PromptSection("story_draft", """
+--- STORY DRAFT START ---
+{story_draft}
+--- STORY DRAFT END ---
 
-*** YOUR REFINEMENT TASK ***
-Meticulously rewrite and polish the draft. Your primary focus is:
-1.  **Absolute Adherence to the Narration Style Guide above.** This is paramount.
-2.  **Faithful Adherence to Plot Outline and Initial Scene Directives (if applicable).**
-3.  **Deep Character Consistency** based on their provided profiles.
-4.  Enhanced Imagery, Sensory Details, Pacing, Flow, Emotional Impact.
-5.  Elimination of Clichés, Awkward Phrasing, and anything "AI-generated." Ensure Chekhov's Gun principle is respected if noted in guidelines.
-6.  Cohesion and compelling language.
-
-Do NOT add new major plot points or fundamentally change the story's core events from the draft. Elevate the existing material based on ALL the provided directives.
 Output ONLY the revised story. No preamble.
-"""
-STORY_REFINEMENT_PROMPT = PromptTemplate(
-    input_variables=[
-        "story_draft", # From previous chain (story_draft_chain)
-        "plot_outline", # From first chain (plot_outline_chain), passed through by SequentialChain
-        "initial_scene_directive_refine", 
-        "narration_name_display", "narration_tone", "narration_inspired_by", "narration_style_snippet_instruction_refine",
-        "characters_full_profiles_for_refinement_context", 
-        "genre", "setting", "tone",
+""", TIER_TURN),
     ],
-    template=story_refinement_template
 )
 
-# Agent E: Slide/Segment Generator (Uses more explicit data unpacking instructions)
-slide_generation_template = """
-System Note: You are a creative storytelling AI. Your primary goal is to co-create a story with the user, segment by segment.
+# --- Novel Mode (book outline -> chapter outlines -> parallel chapter drafts -> continuity pass; see core/novel_compiler.py) ---
+
+# Agent N1: Book Outline Generator
+book_outline_template = """
+You are a master novelist planning a full-length novel from these story elements:
+- Genre: {genre}
+- Setting: {setting}
+- Overall Story Tone: {tone}
+- Characters: {characters_summary}
+{initial_scene_directive}
+Plan the novel as exactly {chapter_count} chapters with a complete arc: inciting incident early, rising
+action and complications through the middle, a climax near the end, and a resolution in the final chapter.
+Every chapter must move the plot forward; track character arcs, secrets and promises across chapters.
+
+Output ONLY the plan, in exactly this format, with one line per chapter and nothing else:
+TITLE: <title of the novel>
+CHAPTER 1: <chapter title> | <2-3 sentence synopsis of what happens in the chapter>
+CHAPTER 2: <chapter title> | <2-3 sentence synopsis>
+...
+"""
+BOOK_OUTLINE_PROMPT = PromptTemplate(
+    input_variables=["genre", "setting", "tone", "characters_summary", "initial_scene_directive", "chapter_count"],
+    template=book_outline_template
+)
+
+# Agent N2: Chapter Outline Generator (one call per chapter, run concurrently)
+chapter_outline_template = """
+You are a story architect breaking one chapter of a novel into scenes.
+
+Novel outline (for context):
+{book_outline}
+
+Characters: {characters_summary}
+
+Previous chapter synopsis: {previous_chapter_synopsis}
+Next chapter synopsis: {next_chapter_synopsis}
+
+Chapter {chapter_number}: {chapter_title}
+Chapter synopsis: {chapter_synopsis}
 
-**STEP 1: ANALYZE USER'S LATEST REQUEST**
-User's Latest Request/Input: {user_input}
-   - Is this a command/directive (e.g., "System Update: ...", "System Directive: Style changed...")?
-   - Is this a request to start a new story or apply an initial scene directive?
-   - Is this a request to continue the existing story (e.g., "next slide", "continue", "what does Tom do?")?
-   - Is this a question about the story or characters?
-   - Is this a request to revise the previous story segment?
+Write a beat outline of 4-6 scenes for this chapter. For each scene give: where and when it happens,
+who is present, what happens, and what changes by its end. The first scene must follow on from the
+previous chapter; the last scene must set up the next chapter.
+Output only the numbered scene beats.
+"""
+CHAPTER_OUTLINE_PROMPT = PromptTemplate(
+    input_variables=["book_outline", "characters_summary", "previous_chapter_synopsis", "next_chapter_synopsis",
+                     "chapter_number", "chapter_title", "chapter_synopsis"],
+    template=chapter_outline_template
+)
 
-**STEP 2: INTERNALIZE CURRENT NARRATION STYLE (MANDATORY ADHERENCE)**
+# Agent N3: Chapter Draft Generator (one call per chapter, run concurrently)
+# Compiled prompt: the static rules, style guide and novel-wide context are identical for every chapter
+# (a shared, cacheable prefix); only the neighbour synopses and the chapter's own outline differ.
+CHAPTER_DRAFT_PROMPT = CompiledPromptTemplate(
+    prompt_name="chapter_draft",
+    sections=[
+        PromptSection("instructions", """
+You are a masterful novelist writing ONE chapter of a longer novel. Other chapters are being written at the same time from the same outline, so:
+- Write ONLY the chapter described at the end, following its scene beats in order. Do not resolve later chapters' events early or retell earlier ones at length.
+- Begin where the previous chapter's synopsis leaves off, and end so the next chapter can pick up.
+- Write approximately {chapter_words} words of finished prose: scenes, dialogue, description. No chapter heading, summary, preamble or meta-commentary.
+""", TIER_STATIC),
+        PromptSection("narration_style", """
+--- NARRATION STYLE GUIDE (CRITICAL - ADHERE STRICTLY FOR THE ENTIRE CHAPTER) ---
 Style Persona: '{narration_name_display}'
-Core Characteristics & Specific Writing Guidelines for this Style: 
-{narration_tone}
+Core Characteristics & Specific Writing Guidelines: 
+{narration_tone}  
 Literary Inspiration: '{narration_inspired_by}'
-Source Text Snippet for Stylistic Emulation (CRITICAL: Emulate voice, sentence structure, tone):
-{narration_style_snippet_instruction_slide} 
+Source Text Snippet for Stylistic Emulation:
+{narration_style_snippet_instruction} 
+--- END NARRATION STYLE GUIDE ---
+""", TIER_STYLE),
+        PromptSection("scenario_directive", """
+IMPORTANT SCENARIO DIRECTIVE (shapes the novel's opening and premise):
+{initial_scene_directive}
+""", TIER_SESSION, optional_variables=("initial_scene_directive",)),
+        PromptSection("novel_context", """
+NOVEL: {novel_title}
+- Genre: {genre}
+- Setting: {setting}
+- Overall Tone: {tone}
 
-**STEP 3: DETERMINE SCENARIO & PLOT FOCUS FOR THIS TURN**
-Initial Scene Directive (Use ONLY if User's Request from Step 1 indicates starting a brand new story with these specific instructions, AND this directive is not empty. This OVERRIDES generic genre/setting for the opening):
-{initial_scene_directive_slide}
+CHARACTERS (keep names, relationships and traits consistent):
+{characters_full_profiles}
 
-Previous Story Slide Text (Use ONLY if User's Request from Step 1 is a "System Directive" to re-narrate due to a style change, AND this text is not empty. Re-narrate ONLY this text): 
-{last_story_slide_text}
+NOVEL OUTLINE:
+{book_outline}
+""", TIER_SESSION),
+        PromptSection("neighbour_chapters", """
+PREVIOUS CHAPTER (already written by another author; continue from here): {previous_chapter_synopsis}
+NEXT CHAPTER (will be written by another author; set it up, don't write it): {next_chapter_synopsis}
+""", TIER_TURN),
+        PromptSection("chapter", """
+CHAPTER TO WRITE: Chapter {chapter_number}: {chapter_title}
+Synopsis: {chapter_synopsis}
+Scene beats:
+{chapter_outline}
+
+Write Chapter {chapter_number} now.
+""", TIER_TURN),
+    ],
+)
 
-Current Plot Focus / User's Goal for this Segment (Derived from User's Request in Step 1 and Chat History):
-{current_plot_focus_or_user_goal} 
+# Agent N4: Continuity Editor (one call per chapter boundary, run concurrently)
+chapter_continuity_template = """
+You are a continuity editor stitching together a novel whose chapters were drafted separately.
 
-**STEP 4: DEEPLY INTEGRATE CHARACTER DIRECTIVES (MANDATORY)**
-Active Characters & Their Profiles:
-{characters_full_profiles} 
-   - How will each character's listed traits, goals, and internal conflicts specifically manifest in THIS segment/response, aligning with the Plot Focus from Step 3?
+Novel outline (for reference):
+{book_outline}
 
-**STEP 5: REFERENCE STORY CONTEXT & HISTORY**
-Story Theme/Genre (Use if not overridden by Initial Scene Directive): {genre}
-Story Setting (Use if not overridden by Initial Scene Directive): {setting}
-Overall Story Tone (Must align with Narration Style): {tone}
-Conversation/Story History (The story so far. The last assistant message containing story is your direct continuation point if generating new story content):
-{chat_history}
+Characters:
+{characters_summary}
+
+--- END OF CHAPTER {previous_chapter_number} ---
+{previous_chapter_ending}
+--- END ---
+
+--- OPENING OF CHAPTER {chapter_number}: {chapter_title} ---
+{chapter_opening}
+--- END ---
+
+Rewrite the OPENING OF CHAPTER {chapter_number} so it follows on naturally from the end of Chapter {previous_chapter_number}:
+fix contradictions in names, places, timeline, who knows what, and objects in hand; smooth the transition; do not repeat
+events already narrated. Keep the same events, voice, style and approximate length, and end exactly where the given
+opening ends so the rest of the chapter still follows. Output only the rewritten opening passage.
+"""
+CHAPTER_CONTINUITY_PROMPT = PromptTemplate(
+    input_variables=["book_outline", "characters_summary", "previous_chapter_number", "previous_chapter_ending",
+                     "chapter_number", "chapter_title", "chapter_opening"],
+    template=chapter_continuity_template
+)
+
+# Agent S: Rolling Story Summary (folds slides that aged out of the chat history into a running synopsis)
+story_summary_template = """
+You are a meticulous story editor maintaining a running synopsis of an ongoing, collaboratively written story.
+
+Current synopsis (may be empty if nothing has been summarized yet):
+{current_summary}
 
-**STEP 6: GENERATE RESPONSE / STORY SEGMENT**
-Based on your analysis from Steps 1-5:
+New story segments, in order, that must now be folded into the synopsis:
+{new_story_segments}
 
-   A. **IF User's Request (Step 1) was a "System Directive" for Style Change AND `last_story_slide_text` (Step 3) is provided:**
+Rewrite the synopsis so it covers both the current synopsis and the new segments.
+Keep: key plot events in order, character names and their relationships, goals, secrets, promises,
+unresolved conflicts, important objects and locations. Drop: prose style, dialogue wording, descriptions.
+The synopsis MUST NOT exceed {max_words} words; compress older events more than recent ones.
+Output only the synopsis.
+"""
+STORY_SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["current_summary", "new_story_segments", "max_words"],
+    template=story_summary_template
+)
+
+# Agent E: Slide/Segment Generator (Uses more explicit data unpacking instructions)
+# Compiled prompt: the response rules never change, so they lead; the narration style, story setup
+# and per-turn context follow, and the user's latest request is last. Empty optional sections are omitted.
+SLIDE_GENERATION_PROMPT = CompiledPromptTemplate(
+    prompt_name="slide_generation",
+    sections=[
+        PromptSection("instructions", """
+System Note: You are a creative storytelling AI. Your primary goal is to co-create a story with the user, segment by segment.
+The sections below give you, in order: the NARRATION STYLE, the CHARACTERS, the STORY CONTEXT (with a synopsis of earlier events, if any), the CHAT HISTORY, then, only when relevant, the PREVIOUS STORY SLIDE to re-narrate and an INITIAL SCENE DIRECTIVE, and finally the PLOT FOCUS and the USER'S LATEST REQUEST.
+
+**HOW TO WORK**
+1. Analyze the USER'S LATEST REQUEST (command/directive such as "System Update: ..." or "System Directive: Style changed...", start of a new story, story continuation, question, or revision request).
+2. Internalize the NARRATION STYLE (MANDATORY ADHERENCE).
+3. Determine the scenario and plot focus: use the INITIAL SCENE DIRECTIVE only if it is present AND the request starts a brand new story (it OVERRIDES generic genre/setting for the opening); use the PREVIOUS STORY SLIDE only if it is present AND the request is a "System Directive" to re-narrate due to a style change (re-narrate ONLY that text).
+4. Deeply integrate the CHARACTERS: how will each character's listed traits, goals, and internal conflicts specifically manifest in THIS segment/response?
+5. Reference the STORY CONTEXT and CHAT HISTORY. The last assistant message containing story is your direct continuation point if generating new story content.
+
+**HOW TO RESPOND**
+   A. **IF the request is a "System Directive" for Style Change AND a PREVIOUS STORY SLIDE is provided:**
       - Acknowledge the style change.
-      - Provide ONLY the re-narrated version of `last_story_slide_text` in the new style (Step 2).
+      - Provide ONLY the re-narrated version of the PREVIOUS STORY SLIDE in the new style.
       - THEN, ask the user if they are happy or want changes. (e.g., "Here's the segment in the new style! How does it feel?")
 
-   B. **IF User's Request (Step 1) was a "System Directive" for Style Change AND `last_story_slide_text` (Step 3) is EMPTY (or style set for a new story):**
-      - Acknowledge the style change (e.g., "Style set to {narration_name_display}.").
-      - If `initial_scene_directive_slide` (Step 3) is provided AND User's Request indicates starting with it: Generate the initial story segment (approx. 300 words) strictly following `initial_scene_directive_slide`, character profiles (Step 4), and narration style (Step 2).
+   B. **IF the request is a "System Directive" for Style Change AND no PREVIOUS STORY SLIDE is provided (or style set for a new story):**
+      - Acknowledge the style change (e.g., "Style set to <Style Persona>.").
+      - If an INITIAL SCENE DIRECTIVE is provided AND the request indicates starting with it: Generate the initial story segment (approx. 300 words) strictly following the directive, the CHARACTERS, and the NARRATION STYLE.
       - ELSE (no initial scene directive, or not starting new): State that the new style will be applied to the next story segment the user requests. Do NOT generate story content.
       - THEN, ask the user how they'd like to proceed or for their first story prompt.
 
-   C. **IF User's Request (Step 1) is to CONTINUE an existing story (e.g., "next slide", "continue", or implies continuation):**
+   C. **IF the request is to CONTINUE an existing story (e.g., "next slide", "continue", or implies continuation):**
       - Generate the next story segment (approx. 300 words).
-      - This segment MUST logically follow the last assistant-generated story part in `chat_history` (Step 5).
-      - It MUST advance the `current_plot_focus_or_user_goal` (Step 3).
-      - It MUST deeply integrate characters (Step 4).
-      - It MUST flawlessly maintain narration style (Step 2).
+      - This segment MUST logically follow the last assistant-generated story part in the CHAT HISTORY (and stay consistent with the synopsis).
+      - It MUST advance the PLOT FOCUS.
+      - It MUST deeply integrate the CHARACTERS.
+      - It MUST flawlessly maintain the NARRATION STYLE.
       - End with impact (cliffhanger, conflict, poignant moment, revelation).
       - THEN, ALWAYS conclude by briefly asking the user for their input: "What are your thoughts? Shall we continue, or would you like to suggest a twist or make a revision?"
 
-   D. **IF User's Request (Step 1) is a question or other non-story-continuation interaction:**
+   D. **IF the request is a question or other non-story-continuation interaction:**
       - Respond appropriately, thoughtfully, and in character if asking about a character's thoughts.
-      - Maintain the narration style (Step 2) in your response tone if appropriate.
+      - Maintain the NARRATION STYLE in your response tone if appropriate.
+""", TIER_STATIC),
+        PromptSection("narration_style", """
+**NARRATION STYLE (MANDATORY ADHERENCE)**
+Style Persona: '{narration_name_display}'
+Core Characteristics & Specific Writing Guidelines for this Style: 
+{narration_tone}
+Literary Inspiration: '{narration_inspired_by}'
+Source Text Snippet for Stylistic Emulation (CRITICAL: Emulate voice, sentence structure, tone):
+{narration_style_snippet_instruction_slide} 
+""", TIER_STYLE),
+        PromptSection("characters", """
+**CHARACTERS**
+Active Characters & Their Profiles:
+{characters_full_profiles} 
+""", TIER_SESSION),
+        PromptSection("story_context", """
+**STORY CONTEXT**
+Story Theme/Genre (Use if not overridden by an Initial Scene Directive): {genre}
+Story Setting (Use if not overridden by an Initial Scene Directive): {setting}
+Overall Story Tone (Must align with Narration Style): {tone}
+""", TIER_SESSION),
+        PromptSection("story_summary", """
+Story Synopsis So Far (Earlier events no longer shown in the chat history. Stay consistent with it):
+{story_summary}
+""", TIER_SESSION, optional_variables=("story_summary",)),
+        PromptSection("chat_history", """
+**CHAT HISTORY** (The story so far. The last assistant message containing story is your direct continuation point):
+{chat_history}
+""", TIER_TURN, optional_variables=("chat_history",)),
+        PromptSection("previous_story_slide", """
+**PREVIOUS STORY SLIDE** (Re-narrate ONLY this text, and only for a style-change "System Directive"):
+{last_story_slide_text}
+""", TIER_TURN, optional_variables=("last_story_slide_text",)),
+        PromptSection("initial_scene_directive", """
+**INITIAL SCENE DIRECTIVE** (Use ONLY if the request starts a brand new story):
+{initial_scene_directive_slide}
+""", TIER_TURN, optional_variables=("initial_scene_directive_slide",)),
+        PromptSection("user_request", """
+**PLOT FOCUS** (Current Plot Focus / User's Goal for this Segment):
+{current_plot_focus_or_user_goal} 
+
+**USER'S LATEST REQUEST**
+{user_input}
 
 Output only your complete response (acknowledgment, story segment, and follow-up question, as applicable per A, B, C, or D).
-"""
-SLIDE_GENERATION_PROMPT = PromptTemplate(
-    input_variables=[
-        "user_input", 
-        "narration_name_display", "narration_tone", "narration_inspired_by", 
-        "narration_style_snippet_instruction_slide", "initial_scene_directive_slide", 
-        "current_plot_focus_or_user_goal", "last_story_slide_text",
-        "characters_full_profiles",
-        "genre", "setting", "tone",
-        "chat_history",
+""", TIER_TURN),
     ],
-    template=slide_generation_template
 )
 
 
 # --- Chain Creation Functions ---
 def create_author_style_snippet_chain(api_key: str) -> LLMChain:
     llm = get_grok_llm(api_key=api_key, temperature=0.7)
-    return LLMChain(llm=llm, prompt=AUTHOR_STYLE_SNIPPET_PROMPT, output_key="style_snippet")
+    return _llm_chain(llm, AUTHOR_STYLE_SNIPPET_PROMPT, "style_snippet")
 
 def create_slide_generation_chain(api_key: str, temperature_override: float = None) -> LLMChain:
     temp = temperature_override if temperature_override is not None else 0.9
     llm = get_grok_llm(api_key=api_key, temperature=temp)
-    return LLMChain(llm=llm, prompt=SLIDE_GENERATION_PROMPT, output_key="ai_response")
+    return _llm_chain(llm, SLIDE_GENERATION_PROMPT, "ai_response")
+
+def create_story_summary_chain(api_key: str) -> LLMChain:
+    llm = get_grok_llm(api_key=api_key, temperature=0.3)
+    return _llm_chain(llm, STORY_SUMMARY_PROMPT, "story_summary")
 
 def create_story_compilation_pipeline(api_key: str, bennet_style_active: bool = False) -> SequentialChain:
     plot_temp = 0.7
@@ -267,21 +497,12 @@ def create_story_compilation_pipeline(api_key: str, bennet_style_active: bool =
     refine_temp = 0.6
     # if bennet_style_active: draft_temp = 0.75 # Optional temperature tweak
 
-    plot_outline_chain = LLMChain(
-        llm=get_grok_llm(api_key=api_key, temperature=plot_temp),
-        prompt=PLOT_OUTLINE_PROMPT,
-        output_key="plot_outline" # Output will be passed as 'plot_outline'
-    )
-    story_draft_chain = LLMChain(
-        llm=get_grok_llm(api_key=api_key, temperature=draft_temp),
-        prompt=STORY_DRAFT_PROMPT, 
-        output_key="story_draft" # Output will be passed as 'story_draft'
-    )
-    story_refine_chain = LLMChain(
-        llm=get_grok_llm(api_key=api_key, temperature=refine_temp),
-        prompt=STORY_REFINEMENT_PROMPT, 
-        output_key="refined_story" 
-    )
+    plot_outline_chain = _llm_chain(get_grok_llm(api_key=api_key, temperature=plot_temp), PLOT_OUTLINE_PROMPT,
+                                    "plot_outline") # Output will be passed as 'plot_outline'
+    story_draft_chain = _llm_chain(get_grok_llm(api_key=api_key, temperature=draft_temp), STORY_DRAFT_PROMPT,
+                                   "story_draft") # Output will be passed as 'story_draft'
+    story_refine_chain = _llm_chain(get_grok_llm(api_key=api_key, temperature=refine_temp), STORY_REFINEMENT_PROMPT,
+                                    "refined_story")
     
     # These are the initial inputs the SequentialChain needs that are not outputs of prior chains.
     # `plot_outline` and `story_draft` are intermediate and handled by SequentialChain.
@@ -305,5 +526,49 @@ def create_story_compilation_pipeline(api_key: str, bennet_style_active: bool =
         # These typically include the final output and any intermediate outputs you want to inspect.
         output_variables=["refined_story", "plot_outline", "story_draft"], 
         verbose=True, 
+        callbacks=TRACING_CALLBACKS,
+        metadata={"trace_stage": "story_compilation"},
     )
-    return story_compilation_pipeline
\ No newline at end of file
+    return story_compilation_pipeline
+
+def create_book_outline_chain(api_key: str) -> LLMChain:
+    llm = get_grok_llm(api_key=api_key, temperature=0.7)
+    return _llm_chain(llm, BOOK_OUTLINE_PROMPT, "book_outline")
+
+def create_chapter_outline_chain(api_key: str) -> LLMChain:
+    llm = get_grok_llm(api_key=api_key, temperature=0.7)
+    return _llm_chain(llm, CHAPTER_OUTLINE_PROMPT, "chapter_outline")
+
+def create_chapter_draft_chain(api_key: str) -> LLMChain:
+    llm = get_grok_llm(api_key=api_key, temperature=0.85)
+    return _llm_chain(llm, CHAPTER_DRAFT_PROMPT, "chapter_draft")
+
+def create_chapter_continuity_chain(api_key: str) -> LLMChain:
+    llm = get_grok_llm(api_key=api_key, temperature=0.4)
+    return _llm_chain(llm, CHAPTER_CONTINUITY_PROMPT, "chapter_opening")
+
+# --- Streaming Helpers ---
+def stream_chain(chain: LLMChain, chain_input: dict):
+    """Yields text chunks from an LLMChain's model as they arrive instead of waiting for the full response."""
+    with span(f"chain.{chain.output_key}", kind="chain", streamed=True) as stage_span: # chain.llm.stream bypasses the chain's callbacks
+        prompt_value = chain.prompt.format_prompt(**{k: chain_input[k] for k in chain.prompt.input_variables})
+        output_chars = 0
+        for chunk in chain.llm.stream(prompt_value):
+            text = chunk.content if hasattr(chunk, "content") else str(chunk)
+            if text:
+                output_chars += len(text)
+                yield text
+        stage_span.set(output_chars=output_chars)
+
+def stream_story_compilation(pipeline: SequentialChain, pipeline_input: dict):
+    """
+    Runs the compilation pipeline stage by stage, yielding (stage_output_key, text_chunk).
+    Each finished stage's output is fed to the following stages, as SequentialChain does.
+    """
+    known_values = dict(pipeline_input)
+    for stage_chain in pipeline.chains:
+        stage_parts = []
+        for chunk in stream_chain(stage_chain, known_values):
+            stage_parts.append(chunk)
+            yield stage_chain.output_key, chunk
+        known_values[stage_chain.output_key] = "".join(stage_parts)
@@ -0,0 +1,133 @@
+# core/llm_clients.py
+# Process-wide registry of pooled LLM clients.
+# Streamlit rebuilds the Langchain chains on every chat turn; without this registry each
+# rebuild created a new ChatOpenAI, a new HTTP client and a new TLS handshake to the API.
+import hashlib
+import os
+import threading
+import time
+
+import httpx
+
+from .startup_profiler import lazy_import
+
+# --- Pool configuration (override through the environment) ---
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "10"))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "120"))  # seconds an idle socket stays open
+LLM_CLIENT_IDLE_TTL = float(os.getenv("LLM_CLIENT_IDLE_TTL", "900"))  # seconds before an unused client is evicted
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))
+LLM_HTTP2_ENABLED = os.getenv("LLM_HTTP2_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx needs the 'h2' package for HTTP/2)
+        return True
+    except ImportError:
+        return False
+
+
+class LLMClientRegistry:
+    """
+    Shares ChatOpenAI instances keyed by (api key hash, model, temperature, base URL) and
+    one keep-alive httpx connection pool per base URL across all Streamlit sessions.
+    """
+    def __init__(self, max_connections=LLM_POOL_MAX_CONNECTIONS, max_keepalive=LLM_POOL_MAX_KEEPALIVE,
+                 keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY, idle_ttl=LLM_CLIENT_IDLE_TTL, http2=LLM_HTTP2_ENABLED):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.idle_ttl = idle_ttl
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            print("LLM Clients Warning: 'h2' package not installed. Falling back to HTTP/1.1 keep-alive.")
+        self._lock = threading.Lock()
+        self._clients = {}       # key -> [ChatOpenAI, last_used_ts]
+        self._http_clients = {}  # base_url -> httpx.Client
+        self._stats = {"requests": 0, "hits": 0, "misses": 0, "evictions": 0, "http_pools_created": 0}
+
+    @staticmethod
+    def _make_key(api_key: str, model: str, temperature: float, base_url: str) -> tuple:
+        key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]  # never keep raw keys in dict keys
+        return (key_hash, model, round(float(temperature), 3), base_url)
+
+    def _get_http_client(self, base_url: str) -> httpx.Client:
+        http_client = self._http_clients.get(base_url)
+        if http_client is None or http_client.is_closed:
+            http_client = httpx.Client(
+                http2=self.http2,
+                timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+            self._http_clients[base_url] = http_client
+            self._stats["http_pools_created"] += 1
+        return http_client
+
+    def _evict_idle(self, now: float):
+        stale_keys = [k for k, (_, last_used) in self._clients.items() if now - last_used > self.idle_ttl]
+        for k in stale_keys:
+            del self._clients[k]
+            self._stats["evictions"] += 1
+        # The shared httpx pools are left open: a chain still holding an evicted client may be mid-request,
+        # and idle sockets are already closed by keepalive_expiry.
+
+    def get(self, api_key: str, model: str, temperature: float, base_url: str, callbacks: list = None):
+        """callbacks (e.g. the tracing handler) are attached when the client is created; they are not part of the key."""
+        key = self._make_key(api_key, model, temperature, base_url)
+        now = time.monotonic()
+        with self._lock:
+            self._stats["requests"] += 1
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._stats["hits"] += 1
+                return entry[0]
+            self._stats["misses"] += 1
+            llm = lazy_import("langchain_openai").ChatOpenAI( # Imported with the first client, not at app startup
+                model_name=model,
+                openai_api_key=api_key,
+                openai_api_base=base_url,
+                temperature=temperature,
+                http_client=self._get_http_client(base_url),
+                callbacks=callbacks,
+            )
+            self._clients[key] = [llm, now]
+            return llm
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active_clients"] = len(self._clients)
+            stats["http_pools"] = len(self._http_clients)
+            stats["http2"] = self.http2
+        stats["reuse_rate"] = round(stats["hits"] / stats["requests"], 3) if stats["requests"] else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            for http_client in self._http_clients.values():
+                try: http_client.close()
+                except Exception as e: print(f"LLM Clients Warning: Error closing HTTP pool: {e}")
+            self._http_clients.clear()
+            self._clients.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_llm_client_registry() -> LLMClientRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = LLMClientRegistry()
+    return _registry
+
+def get_llm_client_stats() -> dict:
+    return get_llm_client_registry().stats()
@@ -1,16 +1,163 @@
 # core/narration.py
 import os
-from pinecone import Pinecone 
+import threading
+import time
+from collections import OrderedDict
+from .style_library import CUSTOM_STYLE_ID_PREFIX, get_author_style_by_id, build_author_voice_description
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .startup_profiler import lazy_import
+from .tracing import span, traced
+from .style_store import LocalStyleStore, PineconeStyleStore, STYLE_STORE_LOCAL_DIR, query_styles
 
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = "narration-styles" 
 
+# "pinecone": hosted index. "local": memory-mapped snapshot in STYLE_STORE_LOCAL_DIR (no network I/O).
+# "auto" (default): the local snapshot when one exists, otherwise Pinecone.
+STYLE_STORE_BACKEND = os.getenv("STYLE_STORE_BACKEND", "auto").lower()
+
 pinecone_client = None
 narration_index = None
 PINECONE_INITIALIZED_SUCCESSFULLY = False 
+style_store = None
 
-def initialize_pinecone():
+# --- Style Cache Configuration ---
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+STYLE_CACHE_TTL_SECONDS = float(os.getenv("STYLE_CACHE_TTL_SECONDS", "3600"))
+STYLE_CACHE_MAX_ENTRIES = int(os.getenv("STYLE_CACHE_MAX_ENTRIES", "256"))
+# Touched by scripts/embed_and_store_styles.py after an upsert; a newer mtime invalidates every process's cache.
+STYLE_CACHE_STAMP_FILE = os.getenv("STYLE_CACHE_STAMP_FILE", os.path.join(PROJECT_ROOT, "data", ".style_cache_stamp"))
+STYLE_CACHE_STAMP_CHECK_SECONDS = 5.0
+STYLE_SEARCH_QUERY_CACHE_SIZE = 128
+# Circuit breaker around the remote style backend: per-call timeout, consecutive failures before it opens,
+# and how often the background probe checks whether the backend is back.
+STYLE_BACKEND_TIMEOUT_SECONDS = float(os.getenv("STYLE_BACKEND_TIMEOUT_SECONDS", "5"))
+STYLE_BACKEND_FAILURE_THRESHOLD = int(os.getenv("STYLE_BACKEND_FAILURE_THRESHOLD", "2"))
+STYLE_BACKEND_PROBE_SECONDS = float(os.getenv("STYLE_BACKEND_PROBE_SECONDS", "30"))
+
+_MISSING = object() # Cached "not in the index" marker, so unknown ids don't cost a fetch each time
+
+
+class StyleCache:
+    """
+    TTL + LRU cache of parsed style descriptions, keyed by voice id. Also keeps the last known good
+    version of every style it has seen (unaffected by TTL and invalidation), served while the style
+    backend's circuit breaker is open.
+    """
+    def __init__(self, ttl_seconds: float = STYLE_CACHE_TTL_SECONDS, max_entries: int = STYLE_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # voice_id -> (style dict or _MISSING, stored_at)
+        self._last_good = OrderedDict() # voice_id -> style dict
+        self._lock = threading.Lock()
+        self._stamp_mtime = self._read_stamp_mtime()
+        self._stamp_checked_at = time.monotonic()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0, "prefetched": 0, "stale_served": 0}
+
+    @staticmethod
+    def _read_stamp_mtime() -> float:
+        try: return os.path.getmtime(STYLE_CACHE_STAMP_FILE)
+        except OSError: return 0.0
+
+    def _check_stamp(self, now: float) -> bool:
+        """Clears the cache if the stamp file is newer than the last one seen. Returns True if it was."""
+        if now - self._stamp_checked_at < STYLE_CACHE_STAMP_CHECK_SECONDS: return False
+        self._stamp_checked_at = now
+        stamp_mtime = self._read_stamp_mtime()
+        if stamp_mtime <= self._stamp_mtime: return False
+        self._stamp_mtime = stamp_mtime
+        self._entries.clear()
+        self._stats["invalidations"] += 1
+        print("Narration: Style index was updated by the embed script. Style cache invalidated.")
+        return True
+
+    def get(self, voice_id: str):
+        """Returns the cached style dict, _MISSING for a cached negative result, or None on a cache miss."""
+        now = time.monotonic()
+        with self._lock: index_updated = self._check_stamp(now)
+        if index_updated: reopen_style_store() # A rewritten local snapshot isn't visible through the open memory map
+        with self._lock:
+            entry = self._entries.get(voice_id)
+            if entry is None:
+                self._stats["misses"] += 1; return None
+            if now - entry[1] > self.ttl_seconds:
+                del self._entries[voice_id]
+                self._stats["expired"] += 1; self._stats["misses"] += 1; return None
+            self._entries.move_to_end(voice_id)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, voice_id: str, style, prefetched: bool = False):
+        with self._lock:
+            self._entries[voice_id] = (style, time.monotonic())
+            self._entries.move_to_end(voice_id)
+            if prefetched: self._stats["prefetched"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            if style is not _MISSING:
+                self._last_good[voice_id] = style
+                self._last_good.move_to_end(voice_id)
+                while len(self._last_good) > self.max_entries: self._last_good.popitem(last=False)
+
+    def get_last_good(self, voice_id: str) -> dict | None:
+        """The most recently stored style for voice_id, however old. No network, no TTL."""
+        with self._lock:
+            style = self._last_good.get(voice_id)
+            if style is not None: self._stats["stale_served"] += 1
+            return style
+
+    def invalidate(self, voice_id: str = None):
+        with self._lock:
+            if voice_id is None: self._entries.clear()
+            else: self._entries.pop(voice_id, None)
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["last_good_entries"] = len(self._last_good)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+style_cache = StyleCache()
+
+def _probe_style_backend():
+    """Background health check while the style backend's circuit is open; raises if it is still down."""
+    if style_store is not None: style_store.fetch(["DEFAULT"])
+    else:
+        _connect_pinecone(_new_pinecone_client())
+        initialize_style_store() # Picks up the new connection, so lookups use the store again
+
+style_backend_breaker = CircuitBreaker("style-backend", failure_threshold=STYLE_BACKEND_FAILURE_THRESHOLD,
+                                       call_timeout=STYLE_BACKEND_TIMEOUT_SECONDS, probe_interval=STYLE_BACKEND_PROBE_SECONDS,
+                                       probe=_probe_style_backend)
+
+def _call_style_backend(fn, *args):
+    """Runs a style store call through the circuit breaker. The local snapshot does no network I/O and is called directly."""
+    backend_name = style_store.backend_name if style_store is not None else "pinecone"
+    with span(f"style_backend.{fn.__name__}", kind="style", backend=backend_name, circuit=style_backend_breaker.state):
+        if style_store is not None and not style_store.remote: return fn(*args)
+        return style_backend_breaker.call(fn, *args)
+
+def _new_pinecone_client():
+    # Imported only when the Pinecone backend is used, and outside style_backend_breaker: a cold import is no backend failure.
+    return lazy_import("pinecone").Pinecone(api_key=PINECONE_API_KEY)
+
+def _connect_pinecone(client):
+    """Connects client to the style index (the network calls). Raises on any failure; run through style_backend_breaker."""
     global pinecone_client, narration_index, PINECONE_INITIALIZED_SUCCESSFULLY
+    index_names_list = [idx_spec.name for idx_spec in client.list_indexes().indexes]
+    if PINECONE_INDEX_NAME not in index_names_list:
+        raise LookupError(f"Pinecone index '{PINECONE_INDEX_NAME}' not found. Please create it or run embed script.")
+    pinecone_client = client
+    narration_index = client.Index(PINECONE_INDEX_NAME)
+    PINECONE_INITIALIZED_SUCCESSFULLY = True
+
+def initialize_pinecone():
+    global PINECONE_INITIALIZED_SUCCESSFULLY
     
     if PINECONE_INITIALIZED_SUCCESSFULLY: return True
     if not PINECONE_API_KEY:
@@ -23,49 +170,174 @@ def initialize_pinecone():
         del initialize_pinecone.api_key_warning_shown
 
     try:
-        pinecone_client = Pinecone(api_key=PINECONE_API_KEY)
-        index_exists = False
-        listed_indexes_data = pinecone_client.list_indexes()
-        index_names_list = [idx_spec.name for idx_spec in listed_indexes_data.indexes]
-        if PINECONE_INDEX_NAME in index_names_list: index_exists = True
-        
-        if index_exists:
-            narration_index = pinecone_client.Index(PINECONE_INDEX_NAME)
-            PINECONE_INITIALIZED_SUCCESSFULLY = True
-            return True
-        else:
-            print(f"Narration Error: Pinecone index '{PINECONE_INDEX_NAME}' not found. Please create it or run embed script.")
-            PINECONE_INITIALIZED_SUCCESSFULLY = False; return False
+        client = _new_pinecone_client()
+    except Exception as e:
+        print(f"Narration Error: Could not load the Pinecone client: {e}")
+        return False
+    try:
+        style_backend_breaker.call(_connect_pinecone, client)
+        return True
+    except CircuitOpenError:
+        return False # Backend known to be down; the breaker's probe reconnects once it is back
     except Exception as e:
         print(f"Narration Error: During Pinecone initialization or index connection: {e}")
-        PINECONE_INITIALIZED_SUCCESSFULLY = False; return False
+        return False
+
+def _open_style_store():
+    """Opens the configured backend; None if it is unavailable."""
+    use_local = STYLE_STORE_BACKEND == "local" or (STYLE_STORE_BACKEND == "auto" and LocalStyleStore.exists(STYLE_STORE_LOCAL_DIR))
+    if use_local:
+        try:
+            store = LocalStyleStore(STYLE_STORE_LOCAL_DIR)
+            print(f"Narration: Using local style store at '{STYLE_STORE_LOCAL_DIR}' ({store.describe()['vectors']} vectors).")
+            return store
+        except Exception as e:
+            print(f"Narration Error: Opening local style store '{STYLE_STORE_LOCAL_DIR}': {e}")
+            if STYLE_STORE_BACKEND == "local": return None
+    if initialize_pinecone():
+        return PineconeStyleStore(narration_index, PINECONE_INDEX_NAME)
+    return None
+
+def initialize_style_store() -> bool:
+    global style_store
+    if style_store is not None: return True
+    style_store = _open_style_store()
+    return style_store is not None
 
-def get_voice_description_from_pinecone(voice_id: str) -> dict | None:
-    if not PINECONE_INITIALIZED_SUCCESSFULLY: return None 
-    if not narration_index: 
-        if not initialize_pinecone() or not narration_index: return None # Try re-init
+def reopen_style_store() -> bool:
+    """
+    Reopens the style store after the index was rebuilt (e.g. a new local snapshot, or one created
+    where Pinecone was used before). The new store is swapped in only once it is open, so concurrent
+    lookups keep using the previous one meanwhile, and keep it if the reopen fails.
+    """
+    global style_store
+    if style_store is None: return initialize_style_store()
+    store = _open_style_store()
+    if store is None: return False
+    style_store = store
+    return True
+
+def _style_from_metadata(voice_id: str, metadata: dict) -> dict:
+    if metadata is None: metadata = {} 
+
+    keywords_list = metadata.get("keywords", []) 
+    inspired_by_text = ", ".join(keywords_list) if keywords_list else "the provided example text"
+    
+    # The 'description' from metadata will now include the specific guidelines for Bennet
+    return {
+        "name_display": metadata.get("style_name", voice_id),
+        "tone": metadata.get("description", f"Custom style for {voice_id} from the style store"), 
+        "inspired_by": inspired_by_text, 
+        "source_text_snippet": metadata.get("source_text_snippet", None), 
+    }
+
+def get_voice_description_from_store(voice_id: str) -> dict | None:
+    cached_style = style_cache.get(voice_id)
+    if cached_style is _MISSING: return None
+    if cached_style is not None: return cached_style
+
+    if not style_store and not initialize_style_store(): return style_cache.get_last_good(voice_id)
             
     try:
-        fetch_response = narration_index.fetch(ids=[voice_id])
-        if fetch_response and fetch_response.vectors and voice_id in fetch_response.vectors:
-            vector_object = fetch_response.vectors[voice_id]
-            metadata = vector_object.metadata if hasattr(vector_object, 'metadata') else {}
-            if metadata is None: metadata = {} 
-
-            keywords_list = metadata.get("keywords", []) 
-            inspired_by_text = ", ".join(keywords_list) if keywords_list else "the provided example text"
-            
-            # The 'description' from metadata will now include the specific guidelines for Bennet
-            return {
-                "name_display": metadata.get("style_name", voice_id),
-                "tone": metadata.get("description", f"Custom style for {voice_id} from Pinecone"), 
-                "inspired_by": inspired_by_text, 
-                "source_text_snippet": metadata.get("source_text_snippet", None), 
-            }
+        fetched_records = _call_style_backend(style_store.fetch, [voice_id])
+        if voice_id in fetched_records:
+            style = _style_from_metadata(voice_id, fetched_records[voice_id]["metadata"])
+            style_cache.put(voice_id, style)
+            return style
+        style_cache.put(voice_id, _MISSING)
         return None 
+    except CircuitOpenError:
+        return style_cache.get_last_good(voice_id) # Backend is down: no network wait
+    except Exception as e:
+        print(f"Narration Error: Fetching style '{voice_id}' from {style_store.backend_name} style store: {e}")
+        return style_cache.get_last_good(voice_id)
+
+def prefetch_voice_styles(voice_ids: list = None) -> int:
+    """Loads the given styles (default: every VOICE_OPTIONS_MAP id) into the style cache with one batched fetch."""
+    if voice_ids is None: voice_ids = list(VOICE_OPTIONS_MAP.values())
+    if not voice_ids or not initialize_style_store(): return 0
+    try:
+        started_at = time.perf_counter()
+        fetched_records = _call_style_backend(style_store.fetch, list(voice_ids))
+        for voice_id in voice_ids:
+            if voice_id in fetched_records: style_cache.put(voice_id, _style_from_metadata(voice_id, fetched_records[voice_id]["metadata"]), prefetched=True)
+            else: style_cache.put(voice_id, _MISSING, prefetched=True)
+        print(f"Narration: Prefetched {len(fetched_records)}/{len(voice_ids)} styles from {style_store.backend_name} store in {(time.perf_counter() - started_at) * 1000:.0f} ms.")
+        return len(fetched_records)
     except Exception as e:
-        print(f"Narration Error: Fetching style '{voice_id}' from Pinecone: {e}")
-        return None
+        print(f"Narration Error: Prefetching styles from {style_store.backend_name} style store: {e}")
+        return 0
+
+def invalidate_style_cache(voice_id: str = None):
+    """Drops one style (or all styles) from the cache in this process."""
+    style_cache.invalidate(voice_id)
+
+def mark_style_index_updated():
+    """Signals every running app process that the style index changed (their caches and style stores reload on next lookup)."""
+    os.makedirs(os.path.dirname(STYLE_CACHE_STAMP_FILE), exist_ok=True)
+    with open(STYLE_CACHE_STAMP_FILE, "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+    invalidate_style_cache()
+    if style_store is not None: reopen_style_store()
+
+def get_style_cache_stats() -> dict:
+    return style_cache.stats()
+
+def get_style_backend_health() -> dict:
+    """Circuit breaker state of the remote style backend (always 'closed' for the local snapshot)."""
+    stats = style_backend_breaker.stats()
+    stats["backend"] = style_store.backend_name if style_store is not None else None
+    return stats
+
+_query_embedding_cache = OrderedDict() # normalized query text -> embedding (repeat searches skip the model)
+_query_embedding_lock = threading.Lock()
+
+def _get_query_embedding(query_text: str) -> list[float] | None:
+    from .embedding_utils import get_embedding # Deferred: keeps the embedding stack out of narration's import cost
+    cache_key = " ".join(query_text.split()).lower()
+    with _query_embedding_lock:
+        if cache_key in _query_embedding_cache:
+            _query_embedding_cache.move_to_end(cache_key)
+            return _query_embedding_cache[cache_key]
+    embedding = get_embedding(query_text)
+    if embedding is not None:
+        with _query_embedding_lock:
+            _query_embedding_cache[cache_key] = embedding
+            while len(_query_embedding_cache) > STYLE_SEARCH_QUERY_CACHE_SIZE: _query_embedding_cache.popitem(last=False)
+    return embedding
+
+@traced(kind="style")
+def find_similar_styles(query_text: str, top_k: int = 3) -> list[dict]:
+    """
+    Semantic style search: embeds a pasted passage or a description of a voice and returns the top_k
+    closest narration styles as [{"voice_id", "name_display", "score", "matched_vectors"}], best first.
+    """
+    if not query_text or not query_text.strip(): return []
+    if not style_store and not initialize_style_store(): return []
+    started_at = time.perf_counter()
+    query_embedding = _get_query_embedding(query_text.strip())
+    if query_embedding is None: return []
+    embedded_at = time.perf_counter()
+    try:
+        matches = _call_style_backend(query_styles, style_store, query_embedding, top_k)
+    except CircuitOpenError:
+        print(f"Narration: Style search skipped, the {style_store.backend_name} style backend is unavailable.")
+        return []
+    except Exception as e:
+        print(f"Narration Error: Searching styles in {style_store.backend_name} style store: {e}")
+        return []
+    finished_at = time.perf_counter()
+    print(f"Narration: Style search returned {len(matches)} styles in {(finished_at - started_at) * 1000:.0f} ms "
+          f"(embed {(embedded_at - started_at) * 1000:.0f} ms, {style_store.backend_name} search {(finished_at - embedded_at) * 1000:.0f} ms).")
+    return [
+        {
+            "voice_id": match["style_id"],
+            "name_display": (match["metadata"] or {}).get("style_name", match["style_id"]),
+            "score": round(match["score"], 4),
+            "matched_vectors": match["matched_vectors"],
+        }
+        for match in matches
+    ]
 
 STATIC_VOICE_DESCRIPTIONS = {
     "DEFAULT": {"name_display": "Default AI", "tone": "A neutral, clear, and engaging storytelling voice that adapts to the overall story tone.", "inspired_by": "General good storytelling practices, clarity, and flow.", "source_text_snippet": None},
@@ -73,19 +345,23 @@ STATIC_VOICE_DESCRIPTIONS = {
 }
 
 def get_active_voice_description(voice_id: str) -> dict:
-    pinecone_style = None
-    if not hasattr(get_active_voice_description, 'pinecone_init_attempted_this_run'):
-        initialize_pinecone() 
-        get_active_voice_description.pinecone_init_attempted_this_run = True
+    stored_style = None
+    if not hasattr(get_active_voice_description, 'style_store_init_attempted_this_run'):
+        initialize_style_store() 
+        get_active_voice_description.style_store_init_attempted_this_run = True
 
-    if PINECONE_INITIALIZED_SUCCESSFULLY: 
-        pinecone_style = get_voice_description_from_pinecone(voice_id)
+    if style_store is not None: 
+        stored_style = get_voice_description_from_store(voice_id)
     
-    if pinecone_style:
-        return pinecone_style
+    if stored_style:
+        return stored_style
     
     if voice_id in STATIC_VOICE_DESCRIPTIONS:
         return STATIC_VOICE_DESCRIPTIONS[voice_id]
+
+    if voice_id.startswith(CUSTOM_STYLE_ID_PREFIX): # Emulated author saved in the shared style library
+        library_entry = get_author_style_by_id(voice_id)
+        if library_entry: return build_author_voice_description(library_entry)
     
     print(f"Narration Warning: Voice ID '{voice_id}' is unknown. Using generic fallback.")
     return {"name_display": voice_id, "tone": "custom (undefined)", "inspired_by": "User defined", "source_text_snippet": None}
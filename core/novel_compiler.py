@@ -0,0 +1,184 @@
+# core/novel_compiler.py
+# Long-form compile mode: book outline -> chapter outlines -> chapter drafts -> continuity pass.
+# Only the book outline is a single call. Chapter outlines, chapter drafts and the continuity edits
+# of each chapter boundary are independent calls run concurrently (batch_as_completed with
+# NOVEL_MAX_CONCURRENCY), so a 20k+ word novel takes about four sequential LLM round-trips.
+# Several novel jobs can run at once (core/compile_jobs.py), so their chapter calls also share a
+# process-wide cap, NOVEL_MAX_INFLIGHT_CALLS, kept below the LLM connection pool's size
+# (LLM_POOL_MAX_CONNECTIONS) to leave connections for interactive slide calls.
+# Every chapter call gets a bounded context: the (clipped) novel outline, the neighbouring chapters'
+# synopses and the character profiles, never the other chapters' text.
+import os
+import re
+import threading
+import time
+
+from langchain_core.runnables import RunnableLambda
+
+from .chat_history import estimate_tokens, clip_text
+from .langchain_chains import (
+    create_book_outline_chain,
+    create_chapter_outline_chain,
+    create_chapter_draft_chain,
+    create_chapter_continuity_chain,
+)
+
+NOVEL_CHAPTER_COUNT = int(os.getenv("NOVEL_CHAPTER_COUNT", "12"))
+NOVEL_CHAPTER_WORDS = int(os.getenv("NOVEL_CHAPTER_WORDS", "1800"))
+NOVEL_MAX_CONCURRENCY = int(os.getenv("NOVEL_MAX_CONCURRENCY", "6")) # Per job: half the chapters of a default novel at once
+NOVEL_MAX_INFLIGHT_CALLS = int(os.getenv("NOVEL_MAX_INFLIGHT_CALLS", "12")) # Per process, across all novel jobs
+NOVEL_RETRY_DELAY_SECONDS = float(os.getenv("NOVEL_RETRY_DELAY_SECONDS", "5")) # Before retrying failed calls (e.g. rate limited)
+NOVEL_CONTEXT_MAX_TOKENS = int(os.getenv("NOVEL_CONTEXT_MAX_TOKENS", "1500")) # Per context block (outline, profiles) in chapter calls
+NOVEL_CONTINUITY_EXCERPT_WORDS = int(os.getenv("NOVEL_CONTINUITY_EXCERPT_WORDS", "250"))
+
+NOVEL_STAGE_BOOK_OUTLINE = "book_outline"
+NOVEL_STAGE_CHAPTER_OUTLINES = "chapter_outlines"
+NOVEL_STAGE_CHAPTER_DRAFTS = "chapter_drafts"
+NOVEL_STAGE_CONTINUITY = "continuity"
+
+_TITLE_LINE = re.compile(r"^\s*\**\s*TITLE\s*\**\s*:\s*(.+?)\s*$", re.IGNORECASE)
+_CHAPTER_LINE = re.compile(r"^\s*\**\s*CHAPTER\s+(\d+)\s*\**\s*[:.\-]\s*(.+?)\s*$", re.IGNORECASE)
+
+
+def parse_book_outline(outline_text: str) -> tuple[str, list[dict]]:
+    """Parses the book outline format into (novel title, [{"number", "title", "synopsis"}]) in chapter order."""
+    novel_title, chapters = "Untitled", {}
+    for line in outline_text.splitlines():
+        title_match = _TITLE_LINE.match(line)
+        if title_match: novel_title = title_match.group(1).strip("*\"' "); continue
+        chapter_match = _CHAPTER_LINE.match(line)
+        if not chapter_match: continue
+        chapter_title, _, synopsis = chapter_match.group(2).partition("|")
+        chapters.setdefault(int(chapter_match.group(1)), {"number": int(chapter_match.group(1)),
+                                                          "title": chapter_title.strip("*\"' "), "synopsis": synopsis.strip()})
+    ordered = [chapters[number] for number in sorted(chapters)]
+    for position, chapter in enumerate(ordered, start=1): chapter["number"] = position # Renumber gaps/duplicates
+    return novel_title, ordered
+
+def _clip(text: str, max_tokens: int = NOVEL_CONTEXT_MAX_TOKENS) -> str:
+    return clip_text(text, estimate_tokens(text), max_tokens) if text else text
+
+def _split_opening(chapter_text: str, min_words: int) -> tuple[str, str]:
+    """Splits a chapter at a paragraph boundary after at least min_words words: (opening, rest)."""
+    paragraphs = chapter_text.split("\n\n")
+    words = 0
+    for i, paragraph in enumerate(paragraphs):
+        words += len(paragraph.split())
+        if words >= min_words: return "\n\n".join(paragraphs[:i + 1]), "\n\n".join(paragraphs[i + 1:])
+    return chapter_text, ""
+
+def _ending(chapter_text: str, n_words: int) -> str:
+    words = chapter_text.split()
+    return ("... " if len(words) > n_words else "") + " ".join(words[-n_words:])
+
+_novel_call_slots = threading.BoundedSemaphore(NOVEL_MAX_INFLIGHT_CALLS)
+
+def _slotted(chain) -> RunnableLambda:
+    """chain as a runnable whose every call holds one of the process-wide novel call slots."""
+    def invoke(chain_input: dict, config):
+        with _novel_call_slots: return chain.invoke(chain_input, config)
+    return RunnableLambda(invoke, name=chain.output_key)
+
+def _run_concurrently(chain, inputs: list[dict], stage_key: str, job=None, required: bool = True) -> list:
+    """
+    Runs chain over inputs with at most NOVEL_MAX_CONCURRENCY calls of this job and NOVEL_MAX_INFLIGHT_CALLS
+    calls of all jobs in flight. Failed or empty calls are retried once, after NOVEL_RETRY_DELAY_SECONDS;
+    if some still fail, raises (required) or leaves their result None.
+    """
+    outputs, pending, last_error = [None] * len(inputs), list(range(len(inputs))), None
+    slotted_chain = _slotted(chain)
+    for attempt in range(2):
+        if attempt:
+            time.sleep(NOVEL_RETRY_DELAY_SECONDS)
+            if job is not None: job.check_cancelled()
+        failed = []
+        for batch_index, result in slotted_chain.batch_as_completed([inputs[i] for i in pending], config={"max_concurrency": NOVEL_MAX_CONCURRENCY},
+                                                            return_exceptions=True):
+            input_index = pending[batch_index]
+            text = "" if isinstance(result, Exception) else (result.get(chain.output_key) or "").strip()
+            if not text:
+                last_error = result if isinstance(result, Exception) else ValueError("empty response")
+                print(f"Novel Compiler: {stage_key} call {input_index + 1}/{len(inputs)} failed: {last_error}")
+                failed.append(input_index)
+            else:
+                outputs[input_index] = text
+                if job is not None: job.record_progress(stage_key, len(text))
+            if job is not None: job.check_cancelled()
+        if not failed: return outputs
+        pending = failed
+    if required: raise RuntimeError(f"{stage_key}: {len(pending)} of {len(inputs)} calls failed after a retry (last error: {last_error})")
+    return outputs
+
+def compile_novel(api_key: str, pipeline_input: dict, chapter_count: int = NOVEL_CHAPTER_COUNT, chapter_words: int = NOVEL_CHAPTER_WORDS, job=None) -> dict:
+    """
+    Generates a novel from the compile pipeline input (see story_manager._prepare_compile_pipeline_input).
+    job is an optional core.compile_jobs.CompileJob for stage progress and cancellation.
+    Returns {"novel", "novel_title", "book_outline", "chapters", "word_count", "elapsed_seconds"}.
+    """
+    started_at = time.perf_counter()
+    if job is not None: job.start_stage(NOVEL_STAGE_BOOK_OUTLINE)
+    book_outline = create_book_outline_chain(api_key).invoke({
+        "genre": pipeline_input["genre"], "setting": pipeline_input["setting"], "tone": pipeline_input["tone"],
+        "characters_summary": pipeline_input["characters_summary"], "chapter_count": chapter_count,
+        "initial_scene_directive": f"\nIMPORTANT SCENARIO DIRECTIVE (the novel's premise and opening):\n{pipeline_input['initial_scene_directive_draft']}\n"
+                                   if pipeline_input.get("initial_scene_directive_draft") else "",
+    })["book_outline"]
+    if job is not None: job.record_progress(NOVEL_STAGE_BOOK_OUTLINE, len(book_outline))
+    novel_title, chapters = parse_book_outline(book_outline)
+    if len(chapters) < 2: raise ValueError(f"The book outline could not be parsed into chapters:\n{book_outline[:500]}")
+    print(f"Novel Compiler: '{novel_title}' outlined as {len(chapters)} chapters in {time.perf_counter() - started_at:.1f}s.")
+    outline_context = _clip(book_outline)
+
+    def neighbour_synopsis(position: int) -> str:
+        return f"Chapter {chapters[position]['number']}: {chapters[position]['title']}. {chapters[position]['synopsis']}" if 0 <= position < len(chapters) else ""
+
+    if job is not None: job.start_stage(NOVEL_STAGE_CHAPTER_OUTLINES)
+    chapter_outlines = _run_concurrently(create_chapter_outline_chain(api_key), [
+        {"book_outline": outline_context, "characters_summary": pipeline_input["characters_summary"],
+         "previous_chapter_synopsis": neighbour_synopsis(i - 1) or "(this is the first chapter)",
+         "next_chapter_synopsis": neighbour_synopsis(i + 1) or "(this is the final chapter)",
+         "chapter_number": chapter["number"], "chapter_title": chapter["title"], "chapter_synopsis": chapter["synopsis"]}
+        for i, chapter in enumerate(chapters)
+    ], NOVEL_STAGE_CHAPTER_OUTLINES, job)
+
+    if job is not None: job.start_stage(NOVEL_STAGE_CHAPTER_DRAFTS)
+    characters_context = _clip(pipeline_input["characters_full_profiles"])
+    chapter_drafts = _run_concurrently(create_chapter_draft_chain(api_key), [
+        {"chapter_words": chapter_words, "novel_title": novel_title, "book_outline": outline_context,
+         "genre": pipeline_input["genre"], "setting": pipeline_input["setting"], "tone": pipeline_input["tone"],
+         "characters_full_profiles": characters_context,
+         "narration_name_display": pipeline_input["narration_name_display"], "narration_tone": pipeline_input["narration_tone"],
+         "narration_inspired_by": pipeline_input["narration_inspired_by"],
+         "narration_style_snippet_instruction": pipeline_input["narration_style_snippet_instruction"],
+         "initial_scene_directive": pipeline_input.get("initial_scene_directive_draft", "") if i == 0 else "",
+         "previous_chapter_synopsis": neighbour_synopsis(i - 1) or "(none: this is the first chapter)",
+         "next_chapter_synopsis": neighbour_synopsis(i + 1) or "(none: this is the final chapter)",
+         "chapter_number": chapter["number"], "chapter_title": chapter["title"], "chapter_synopsis": chapter["synopsis"],
+         "chapter_outline": chapter_outlines[i]}
+        for i, chapter in enumerate(chapters)
+    ], NOVEL_STAGE_CHAPTER_DRAFTS, job)
+
+    # Continuity: rewrite each chapter's opening against the previous chapter's actual ending. Optional per boundary:
+    # a failed edit keeps the original opening.
+    if job is not None: job.start_stage(NOVEL_STAGE_CONTINUITY)
+    split_chapters = [_split_opening(draft, NOVEL_CONTINUITY_EXCERPT_WORDS) for draft in chapter_drafts]
+    revised_openings = _run_concurrently(create_chapter_continuity_chain(api_key), [
+        {"book_outline": outline_context, "characters_summary": pipeline_input["characters_summary"],
+         "previous_chapter_number": chapters[i - 1]["number"], "previous_chapter_ending": _ending(chapter_drafts[i - 1], NOVEL_CONTINUITY_EXCERPT_WORDS),
+         "chapter_number": chapters[i]["number"], "chapter_title": chapters[i]["title"], "chapter_opening": split_chapters[i][0]}
+        for i in range(1, len(chapters))
+    ], NOVEL_STAGE_CONTINUITY, job, required=False)
+
+    chapter_texts = [chapter_drafts[0]]
+    for i, revised_opening in enumerate(revised_openings, start=1):
+        opening, rest = split_chapters[i]
+        chapter_texts.append("\n\n".join(part for part in (revised_opening or opening, rest) if part))
+    novel_text = f"# {novel_title}\n\n" + "\n\n".join(
+        f"## Chapter {chapter['number']}: {chapter['title']}\n\n{text}" for chapter, text in zip(chapters, chapter_texts))
+    word_count = len(novel_text.split())
+    elapsed_seconds = round(time.perf_counter() - started_at, 1)
+    print(f"Novel Compiler: '{novel_title}' compiled: {len(chapters)} chapters, {word_count} words in {elapsed_seconds}s "
+          f"({sum(1 for r in revised_openings if r)}/{len(revised_openings)} chapter transitions revised).")
+    return {"novel": novel_text, "novel_title": novel_title, "book_outline": book_outline,
+            "chapters": [{"number": chapter["number"], "title": chapter["title"], "words": len(text.split())} for chapter, text in zip(chapters, chapter_texts)],
+            "word_count": word_count, "elapsed_seconds": elapsed_seconds}
@@ -0,0 +1,108 @@
+# core/prompt_compiler.py
+# Prompt assembly for the big instruction templates.
+# A CompiledPromptTemplate is built from sections tagged with a volatility tier. Sections are emitted
+# static-first (instructions, then per-style, then per-session, then per-turn data with the user's
+# request last), so consecutive calls share the longest possible prefix for provider-side prompt
+# caching. Optional sections whose variables are all blank are omitted instead of sent empty.
+import threading
+from dataclasses import dataclass, field
+from string import Formatter
+
+from langchain.prompts import StringPromptTemplate
+
+from .chat_history import estimate_tokens
+
+# Volatility tiers, in emission order.
+TIER_STATIC = 0   # Identical on every call
+TIER_STYLE = 1    # Changes only with the narration style
+TIER_SESSION = 2  # Story setup: characters, genre/setting/tone, synopsis
+TIER_TURN = 3     # Changes every call (history, plot focus, user input)
+
+
+def _template_variables(template: str) -> tuple:
+    return tuple(dict.fromkeys(name for _, name, _, _ in Formatter().parse(template) if name))
+
+
+@dataclass(frozen=True)
+class PromptSection:
+    """One block of a compiled prompt. If optional_variables is set, the block is omitted when they are all blank."""
+    name: str
+    template: str
+    tier: int = TIER_STATIC
+    optional_variables: tuple = ()
+    input_variables: tuple = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "template", self.template.strip("\n"))
+        object.__setattr__(self, "input_variables", _template_variables(self.template))
+
+    def is_omitted(self, values: dict) -> bool:
+        return bool(self.optional_variables) and all(not str(values.get(v) or "").strip() for v in self.optional_variables)
+
+    def render(self, values: dict) -> str:
+        return self.template.format(**{v: values[v] for v in self.input_variables})
+
+
+class _PromptCompilerStats:
+    """
+    Per-prompt byte counts, recorded on every format() call. Token counts are only estimated when the
+    stats are read (diagnostics): the last prompt sent is tokenized once and its tokens-per-byte ratio
+    applies to the totals, so prompt formatting never pays for a tokenizer pass.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_prompt = {}
+
+    def record(self, prompt_name: str, prompt_text: str, sent_bytes: int, saved_bytes: int, omitted_sections: list):
+        with self._lock:
+            stats = self._by_prompt.setdefault(prompt_name, {"calls": 0, "bytes_sent": 0, "bytes_saved": 0})
+            stats["calls"] += 1
+            stats["bytes_sent"] += sent_bytes; stats["bytes_saved"] += saved_bytes
+            stats["last_bytes_sent"] = sent_bytes
+            stats["last_omitted_sections"] = list(omitted_sections)
+            stats["_last_prompt"] = prompt_text
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            by_prompt = {name: dict(stats) for name, stats in self._by_prompt.items()}
+        for stats in by_prompt.values():
+            last_prompt = stats.pop("_last_prompt")
+            tokens_per_byte = estimate_tokens(last_prompt) / stats["last_bytes_sent"] if stats["last_bytes_sent"] else 0.0
+            stats["tokens_sent"] = round(stats["bytes_sent"] * tokens_per_byte)
+            stats["tokens_saved"] = round(stats["bytes_saved"] * tokens_per_byte)
+        return by_prompt
+
+
+prompt_compiler_stats = _PromptCompilerStats()
+
+def get_prompt_compiler_stats() -> dict:
+    return prompt_compiler_stats.snapshot()
+
+
+class CompiledPromptTemplate(StringPromptTemplate):
+    """Drop-in StringPromptTemplate (usable by LLMChain/SequentialChain) assembled from PromptSections."""
+    prompt_name: str
+    sections: list[PromptSection]
+    section_separator: str = "\n\n"
+
+    def __init__(self, prompt_name: str, sections: list, **kwargs):
+        ordered_sections = sorted(sections, key=lambda section: section.tier) # Stable: declaration order within a tier
+        input_variables = list(dict.fromkeys(v for section in ordered_sections for v in section.input_variables))
+        super().__init__(prompt_name=prompt_name, sections=ordered_sections, input_variables=input_variables, **kwargs)
+
+    @property
+    def _prompt_type(self) -> str:
+        return "compiled"
+
+    def format(self, **kwargs) -> str:
+        values = self._merge_partial_and_user_variables(**kwargs)
+        rendered, omitted_names, saved_bytes = [], [], 0
+        for section in self.sections:
+            if section.is_omitted(values):
+                omitted_names.append(section.name)
+                saved_bytes += len(section.render(values).encode("utf-8")) + len(self.section_separator)
+            else:
+                rendered.append(section.render(values))
+        prompt_text = self.section_separator.join(rendered)
+        prompt_compiler_stats.record(self.prompt_name, prompt_text, len(prompt_text.encode("utf-8")), saved_bytes, omitted_names)
+        return prompt_text
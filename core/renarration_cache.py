@@ -0,0 +1,75 @@
+# core/renarration_cache.py
+# Per-session cache of re-narrated slides.
+# Changing the narration voice (or emulated author) re-narrates last_story_slide_text with a full
+# slide-chain call. Users flip back and forth between voices to compare, so the responses are kept,
+# keyed by (source slide hash, style id, style version). The source is the slide as first generated:
+# a re-narration of a re-narration resolves to the same source, and the original response is stored
+# under the voice it was written in, so switching back to any voice already seen needs no LLM call.
+# Entries are evicted least recently used first once the session's cache exceeds max_bytes.
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+RENARRATION_CACHE_MAX_BYTES = int(os.getenv("RENARRATION_CACHE_MAX_BYTES", str(256 * 1024))) # Per session
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def style_version(voice_description: dict) -> str:
+    """Changes whenever the style's description does (e.g. a refreshed author snippet)."""
+    return hashlib.sha256(json.dumps(voice_description or {}, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class RenarrationCache:
+    def __init__(self, max_bytes: int = RENARRATION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # (source hash, style id, style version) -> (response text, story text hash, size)
+        self._sources = {} # story text hash -> source hash, for slides produced by a re-narration
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _source_of(self, slide_text: str) -> str:
+        slide_hash = text_hash(slide_text)
+        return self._sources.get(slide_hash, slide_hash)
+
+    def get(self, slide_text: str, style_id: str, version: str) -> str | None:
+        """Returns the cached response re-narrating slide_text (or the slide it was derived from) in the style."""
+        with self._lock:
+            key = (self._source_of(slide_text), style_id, version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1; return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, source_slide_text: str, style_id: str, version: str, response_text: str, story_text: str):
+        """Stores response_text (whose extracted slide is story_text) as the rendition of source_slide_text in the style."""
+        size = len(response_text.encode("utf-8"))
+        if size > self.max_bytes: return
+        with self._lock:
+            source_hash = self._source_of(source_slide_text)
+            story_hash = text_hash(story_text)
+            if story_hash != source_hash: self._sources[story_hash] = source_hash
+            key = (source_hash, style_id, version)
+            previous = self._entries.pop(key, None)
+            if previous is not None: self._bytes -= previous[2]
+            self._entries[key] = (response_text, story_hash, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_story_hash, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._sources.pop(evicted_story_hash, None)
+                self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
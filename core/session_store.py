@@ -0,0 +1,220 @@
+# core/session_store.py
+# Durable story sessions. Every change to a StoryState is written as a small journal record
+# (one per appended message, story_config diff, agents change or scalar field change) instead of
+# rewriting the whole state; every SESSION_SNAPSHOT_EVERY records the journal is compacted into a
+# snapshot. Resuming a session = loading its snapshot and replaying the (short) journal tail.
+# Backends: "sqlite" (default, a local WAL-mode database file) or "none" (persistence disabled).
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite").lower()
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(PROJECT_ROOT, "data", "sessions.sqlite3"))
+SESSION_SNAPSHOT_EVERY = int(os.getenv("SESSION_SNAPSHOT_EVERY", "50"))
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$") # uuid4().hex, as minted by app.py
+
+JOURNAL_MESSAGE = "message"  # payload: {"role", "content"}
+JOURNAL_CONFIG = "config"    # payload: {"set": {key: value}, "unset": [key, ...]}
+JOURNAL_AGENTS = "agents"    # payload: the full agents list (small, and changes rarely)
+JOURNAL_FIELDS = "fields"    # payload: {field: value} for the scalar fields below
+STATE_FIELDS = ("narration_voice_id", "last_story_slide_text", "story_summary")
+
+
+def is_valid_session_id(session_id: str) -> bool:
+    return bool(session_id) and bool(SESSION_ID_PATTERN.match(session_id))
+
+def apply_journal_record(state: dict, kind: str, payload):
+    """Replays one journal record onto a snapshot dict (see StoryState.to_dict)."""
+    if kind == JOURNAL_MESSAGE: state["messages"].append(payload)
+    elif kind == JOURNAL_CONFIG:
+        state["story_config"].update(payload.get("set", {}))
+        for key in payload.get("unset", []): state["story_config"].pop(key, None)
+    elif kind == JOURNAL_AGENTS: state["agents"] = payload
+    elif kind == JOURNAL_FIELDS: state.update(payload)
+    else: print(f"Session Store Warning: Unknown journal record kind '{kind}' ignored.")
+
+
+class SessionConflictError(Exception):
+    """Another writer (e.g. a second tab resumed from the same ?session= link) got to the session's journal first."""
+
+
+class SessionStore(ABC):
+    """Common interface. States are JSON-serializable dicts in StoryState.to_dict() form."""
+    backend_name = "base"
+
+    @abstractmethod
+    def load(self, session_id: str) -> tuple[dict | None, int, int]:
+        """Returns (state, last journal seq, journal records since the snapshot); state is None for unknown sessions."""
+    @abstractmethod
+    def append(self, session_id: str, records: list, first_seq: int) -> int:
+        """Writes records as seq first_seq, first_seq + 1, ... and returns the last seq. Raises SessionConflictError if a seq is taken."""
+    @abstractmethod
+    def write_snapshot(self, session_id: str, state: dict, through_seq: int): ...
+    @abstractmethod
+    def delete(self, session_id: str): ...
+    def describe(self) -> dict: return {"backend": self.backend_name}
+
+
+class SQLiteSessionStore(SessionStore):
+    backend_name = "sqlite"
+
+    def __init__(self, path: str = SESSION_STORE_PATH):
+        self.path = path
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # One connection shared by Streamlit's script threads; access is serialized by self._lock.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # Durable across app crashes; an OS crash may lose the last few records
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (session_id TEXT PRIMARY KEY, seq INTEGER NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS journal (session_id TEXT NOT NULL, seq INTEGER NOT NULL, kind TEXT NOT NULL, payload TEXT NOT NULL,
+                                                created_at REAL NOT NULL, PRIMARY KEY (session_id, seq));
+        """)
+
+    def load(self, session_id: str) -> tuple[dict | None, int, int]:
+        with self._lock:
+            snapshot_row = self._conn.execute("SELECT seq, state FROM snapshots WHERE session_id = ?", (session_id,)).fetchone()
+            snapshot_seq = snapshot_row[0] if snapshot_row else 0
+            journal_rows = self._conn.execute("SELECT seq, kind, payload FROM journal WHERE session_id = ? AND seq > ? ORDER BY seq",
+                                              (session_id, snapshot_seq)).fetchall()
+        if snapshot_row is None and not journal_rows: return None, 0, 0
+        state = json.loads(snapshot_row[1]) if snapshot_row else {"messages": [], "agents": [], "story_config": {}}
+        last_seq = snapshot_seq
+        for seq, kind, payload in journal_rows:
+            apply_journal_record(state, kind, json.loads(payload))
+            last_seq = seq
+        return state, last_seq, len(journal_rows)
+
+    def append(self, session_id: str, records: list, first_seq: int) -> int:
+        now = time.time()
+        rows = [(session_id, first_seq + i, kind, json.dumps(payload, ensure_ascii=False), now) for i, (kind, payload) in enumerate(records)]
+        try:
+            with self._lock:
+                with self._conn: # One transaction per sync
+                    self._conn.execute("BEGIN")
+                    snapshot_row = self._conn.execute("SELECT seq FROM snapshots WHERE session_id = ?", (session_id,)).fetchone()
+                    if snapshot_row and snapshot_row[0] >= first_seq: # Compacted away by another writer's snapshot
+                        raise sqlite3.IntegrityError(f"seq {first_seq} is covered by the snapshot through seq {snapshot_row[0]}")
+                    self._conn.executemany("INSERT INTO journal (session_id, seq, kind, payload, created_at) VALUES (?, ?, ?, ?, ?)", rows)
+        except sqlite3.IntegrityError as e: # (session_id, seq) already written; the transaction was rolled back
+            raise SessionConflictError(f"Journal seq {first_seq} of session {session_id} was already written by another writer.") from e
+        return first_seq + len(rows) - 1
+
+    def write_snapshot(self, session_id: str, state: dict, through_seq: int):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.execute("INSERT OR REPLACE INTO snapshots (session_id, seq, state, updated_at) VALUES (?, ?, ?, ?)",
+                                   (session_id, through_seq, json.dumps(state, ensure_ascii=False), time.time()))
+                self._conn.execute("DELETE FROM journal WHERE session_id = ? AND seq <= ?", (session_id, through_seq))
+
+    def delete(self, session_id: str):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.execute("DELETE FROM snapshots WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM journal WHERE session_id = ?", (session_id,))
+
+    def describe(self) -> dict:
+        with self._lock:
+            sessions = self._conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+            journal_rows = self._conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+        return {"backend": self.backend_name, "path": self.path, "snapshots": sessions, "journal_rows": journal_rows}
+
+
+class SessionJournal:
+    """
+    Per-session writer. Remembers what has already been persisted and, on sync(state), journals only
+    what changed since: new messages (StoryState messages are append-only), story_config key diffs,
+    the agents list if it changed, and changed scalar fields. Compacts into a snapshot periodically.
+    If another writer appended to the session meanwhile (two tabs on one ?session= link), the journal
+    reloads what is persisted and re-diffs this state against it (so config, agents and fields are
+    last writer wins), as long as this state still contains every persisted message; a state whose
+    transcript diverged is rejected with SessionConflictError rather than interleaving two stories.
+    """
+    def __init__(self, store: SessionStore, session_id: str, persisted_state: dict = None, last_seq: int = 0, records_since_snapshot: int = 0):
+        self.store = store
+        self.session_id = session_id
+        self._set_baseline(persisted_state or {}, last_seq, records_since_snapshot)
+
+    def _set_baseline(self, persisted_state: dict, last_seq: int, records_since_snapshot: int):
+        self.last_seq = last_seq
+        self.records_since_snapshot = records_since_snapshot
+        self._message_count = len(persisted_state.get("messages", []))
+        self._config = json.loads(json.dumps(persisted_state.get("story_config", {})))
+        self._agents = json.loads(json.dumps(persisted_state.get("agents", [])))
+        self._fields = {field: persisted_state.get(field) for field in STATE_FIELDS}
+
+    def _diff(self, state) -> tuple[list, tuple]:
+        records = [(JOURNAL_MESSAGE, message.to_dict()) for message in state.messages[self._message_count:]]
+        config = json.loads(json.dumps(state.story_config)) # Deep copy, normalized the way it round-trips through JSON
+        changed = {key: value for key, value in config.items() if key not in self._config or self._config[key] != value}
+        removed = [key for key in self._config if key not in config]
+        if changed or removed: records.append((JOURNAL_CONFIG, {"set": changed, "unset": removed}))
+        agents = json.loads(json.dumps(state.agents))
+        if agents != self._agents: records.append((JOURNAL_AGENTS, agents))
+        fields = {"narration_voice_id": state.narration_voice_id, "last_story_slide_text": state.last_story_slide_text,
+                  "story_summary": state.summary_memory.get_summary()}
+        changed_fields = {field: value for field, value in fields.items() if self._fields.get(field) != value}
+        if changed_fields: records.append((JOURNAL_FIELDS, changed_fields))
+        return records, (len(state.messages), config, agents, fields)
+
+    def _reload(self, state):
+        """Takes what another writer persisted as the new baseline. Raises SessionConflictError if state lacks some of its messages."""
+        persisted_state, last_seq, records_since_snapshot = self.store.load(self.session_id)
+        persisted_state = persisted_state or {}
+        persisted_messages = persisted_state.get("messages", [])
+        if len(persisted_messages) > len(state.messages) or any(
+                state.messages[i]["role"] != message["role"] or state.messages[i]["content"] != message["content"]
+                for i, message in enumerate(persisted_messages)):
+            raise SessionConflictError(f"Session {self.session_id} was continued elsewhere (e.g. another tab); "
+                                       f"this copy's changes were not persisted.")
+        self._set_baseline(persisted_state, last_seq, records_since_snapshot)
+
+    def sync(self, state) -> int:
+        """Persists the changes in state (a StoryState). Returns the number of journal records written."""
+        records, persisted_baseline = self._diff(state)
+        if not records: return 0
+        try:
+            self.last_seq = self.store.append(self.session_id, records, self.last_seq + 1)
+        except SessionConflictError:
+            self._reload(state)
+            records, persisted_baseline = self._diff(state)
+            if not records: return 0
+            self.last_seq = self.store.append(self.session_id, records, self.last_seq + 1)
+        self._message_count, self._config, self._agents, self._fields = persisted_baseline
+        self.records_since_snapshot += len(records)
+        if self.records_since_snapshot >= SESSION_SNAPSHOT_EVERY:
+            started_at = time.perf_counter()
+            self.store.write_snapshot(self.session_id, state.to_dict(), self.last_seq)
+            print(f"Session Store: Compacted {self.records_since_snapshot} journal records of session {self.session_id} "
+                  f"into a snapshot in {(time.perf_counter() - started_at) * 1000:.1f} ms.")
+            self.records_since_snapshot = 0
+        return len(records)
+
+
+_store = None
+_store_initialized = False
+_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore | None:
+    global _store, _store_initialized
+    if not _store_initialized:
+        with _store_lock:
+            if not _store_initialized:
+                if SESSION_STORE_BACKEND == "sqlite":
+                    try:
+                        _store = SQLiteSessionStore()
+                        print(f"Session Store: Using SQLite session store at '{_store.path}'.")
+                    except Exception as e:
+                        print(f"Session Store Error: Could not open SQLite session store at '{SESSION_STORE_PATH}': {e}. Sessions will not persist.")
+                elif SESSION_STORE_BACKEND != "none":
+                    print(f"Session Store Error: Unknown SESSION_STORE_BACKEND '{SESSION_STORE_BACKEND}'. Sessions will not persist.")
+                _store_initialized = True
+    return _store
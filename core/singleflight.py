@@ -0,0 +1,94 @@
+# core/singleflight.py
+# In-flight request deduplication.
+# A double-clicked sidebar button or a replayed widget change reaches story_manager as a second,
+# identical request, and each one used to pay for a full LLM call. SingleFlight collapses calls by
+# key: a duplicate that arrives while the first call is running waits for it and shares its result;
+# one that arrives shortly after it finished gets the finished result (kept for result_ttl seconds).
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+SINGLEFLIGHT_RESULT_TTL_SECONDS = float(os.getenv("SINGLEFLIGHT_RESULT_TTL_SECONDS", "30"))
+SINGLEFLIGHT_MAX_RESULTS = 512
+
+
+def request_key(*parts) -> str:
+    """Stable hash of the request parts. Strings are normalized (case, surrounding and repeated whitespace)."""
+    normalized = [" ".join(part.split()).lower() if isinstance(part, str) else part for part in parts]
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, result_ttl: float = SINGLEFLIGHT_RESULT_TTL_SECONDS, max_results: int = SINGLEFLIGHT_MAX_RESULTS):
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._inflight = {}            # key -> _Call
+        self._results = OrderedDict()  # key -> (result, finished_at)
+        self._stats = {"calls": 0, "executed": 0, "shared_inflight": 0, "shared_recent": 0}
+
+    def _purge_expired(self, now: float):
+        """Drops finished results older than result_ttl. _results is kept in finishing order, so they're at the front."""
+        while self._results:
+            key, (_, finished_at) = next(iter(self._results.items()))
+            if now - finished_at <= self.result_ttl: break
+            del self._results[key]
+
+    def do(self, key: str, fn, *args, **kwargs) -> tuple:
+        """Returns (result, shared). Runs fn(*args, **kwargs) unless an identical call is running or just finished."""
+        now = time.monotonic()
+        with self._lock:
+            self._stats["calls"] += 1
+            self._purge_expired(now)
+            recent = self._results.get(key)
+            if recent is not None:
+                self._stats["shared_recent"] += 1
+                return recent[0], True
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                self._stats["executed"] += 1
+            else:
+                self._stats["shared_inflight"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None: raise call.error
+            return call.result, True
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e # Shared with waiters, not cached: the next request retries
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if call.error is None: self._store(key, call.result)
+            call.done.set()
+        return call.result, False
+
+    def _store(self, key: str, result):
+        now = time.monotonic()
+        self._purge_expired(now)
+        self._results[key] = (result, now)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_results: self._results.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["inflight"] = len(self._inflight)
+            stats["recent_results"] = len(self._results)
+        return stats
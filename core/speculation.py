@@ -0,0 +1,171 @@
+# core/speculation.py
+# Speculative pre-generation of the next story slide (opt-in).
+# Most inputs after a slide are "continue"/"next". When a story slide has been delivered, the slide
+# that a continuation would produce is generated on a background worker against the state's
+# fingerprint (StoryState.fingerprint). If the next input is a continuation and the fingerprint still
+# matches, the pre-generated slide is served at once (or, if it is still being generated, waited for
+# instead of starting a new call); otherwise it is discarded. Spend is capped per process (in-flight calls and an hourly budget
+# of discarded tokens) and per session (speculation pauses after repeated misses).
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .chat_history import estimate_tokens
+from .tracing import span
+
+SPECULATIVE_SLIDES_DEFAULT = os.getenv("SPECULATIVE_SLIDES", "0").lower() in ("1", "true", "yes") # Initial value of the UI toggle
+SPECULATIVE_MAX_INFLIGHT = int(os.getenv("SPECULATIVE_MAX_INFLIGHT", "4")) # Process-wide concurrent speculative calls
+SPECULATIVE_MAX_WASTED_TOKENS_PER_HOUR = int(os.getenv("SPECULATIVE_MAX_WASTED_TOKENS_PER_HOUR", "50000")) # Process-wide
+SPECULATIVE_MAX_SESSION_MISSES = int(os.getenv("SPECULATIVE_MAX_SESSION_MISSES", "3")) # Consecutive misses before a session pauses
+SPECULATIVE_WAIT_SECONDS = float(os.getenv("SPECULATIVE_WAIT_SECONDS", "120")) # Max wait for an in-flight slide on a hit
+SPECULATIVE_CONTINUATION_INPUT = "Continue the story."
+
+# Short inputs that only ask for more story ("continue", "next please", "what happens next?", "go on!").
+_CONTINUATION_PATTERN = re.compile(
+    r"^(?:(?:ok(?:ay)?|yes|sure|great|nice|good|please|pls|now)[\s,.!]*)*"
+    r"(?:continue|next|go on|keep going|carry on|proceed|more|and then|then what|what happens next|what next|tell me more|go ahead)"
+    r"(?:[\s,.!]*(?:please|pls|the story|story|on|with the story))*[\s.!?]*$",
+    re.IGNORECASE)
+
+MISS_NOT_CONTINUATION = "not_continuation"
+MISS_STALE = "stale_state"
+MISS_FAILED = "failed"
+
+
+def is_continuation_request(user_text: str) -> bool:
+    return bool(user_text) and len(user_text) <= 60 and bool(_CONTINUATION_PATTERN.match(user_text.strip()))
+
+
+class _SpeculationBudget:
+    """Process-wide limits and counters shared by every session's speculator."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._wasted = deque() # (timestamp, tokens) of discarded slides in the last hour
+        self._stats = {"scheduled": 0, "hits": 0, "hits_waited": 0, "misses": 0, "skipped_budget": 0,
+                       "wasted_tokens": 0, "served_tokens": 0}
+
+    def _wasted_last_hour(self, now: float) -> int:
+        while self._wasted and now - self._wasted[0][0] > 3600: self._wasted.popleft()
+        return sum(tokens for _, tokens in self._wasted)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._inflight >= SPECULATIVE_MAX_INFLIGHT or self._wasted_last_hour(time.time()) >= SPECULATIVE_MAX_WASTED_TOKENS_PER_HOUR:
+                self._stats["skipped_budget"] += 1; return False
+            self._inflight += 1; self._stats["scheduled"] += 1
+            return True
+
+    def release(self):
+        with self._lock: self._inflight -= 1
+
+    def record(self, key: str, amount: int = 1):
+        with self._lock: self._stats[key] += amount
+
+    def record_waste(self, tokens: int):
+        with self._lock:
+            self._wasted.append((time.time(), tokens)); self._stats["wasted_tokens"] += tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["inflight"] = self._inflight
+            stats["wasted_tokens_last_hour"] = self._wasted_last_hour(time.time())
+        decided = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / decided, 3) if decided else 0.0
+        return stats
+
+
+speculation_budget = _SpeculationBudget()
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=SPECULATIVE_MAX_INFLIGHT, thread_name_prefix="speculative-slide")
+    return _executor
+
+def get_speculation_stats() -> dict:
+    return speculation_budget.stats()
+
+
+class SlideSpeculator:
+    """Per-session holder of at most one speculative slide."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._future = None
+        self._consecutive_misses = 0
+        self.hits = 0
+        self.misses = {MISS_NOT_CONTINUATION: 0, MISS_STALE: 0, MISS_FAILED: 0}
+
+    def schedule(self, fingerprint: str, generate, chain_input: dict) -> bool:
+        """Starts generate(chain_input) -> slide text in the background, replacing any pending speculation."""
+        if self._consecutive_misses >= SPECULATIVE_MAX_SESSION_MISSES: return False # Paused until a continuation request
+        self.discard()
+        if not speculation_budget.try_acquire(): return False
+
+        def run():
+            try:
+                with span("speculative_slide", kind="job"): return generate(chain_input)
+            finally: speculation_budget.release()
+
+        with self._lock:
+            self._fingerprint = fingerprint
+            self._future = _get_executor().submit(contextvars.copy_context().run, run) # Spans join the submitting trace
+        return True
+
+    def take(self, fingerprint: str, user_text: str) -> str | None:
+        """Returns the speculative slide if user_text is a continuation and the state still matches; otherwise discards it."""
+        is_continuation = is_continuation_request(user_text)
+        if is_continuation and self._consecutive_misses >= SPECULATIVE_MAX_SESSION_MISSES:
+            self._consecutive_misses = 0 # The user does continue: let the next slide be speculated again
+        with self._lock:
+            future, speculated_fingerprint = self._future, self._fingerprint
+            self._future = self._fingerprint = None
+        if future is None: return None
+        if not is_continuation or speculated_fingerprint != fingerprint:
+            self._record_miss(MISS_NOT_CONTINUATION if not is_continuation else MISS_STALE, future); return None
+        waited = not future.done()
+        try:
+            slide_text = future.result(timeout=SPECULATIVE_WAIT_SECONDS)
+        except Exception as e:
+            print(f"Speculation: Pre-generated slide unavailable ({type(e).__name__}: {e}). Generating normally.")
+            self._record_miss(MISS_FAILED, None); return None
+        if not slide_text: self._record_miss(MISS_FAILED, None); return None
+        self.hits += 1; self._consecutive_misses = 0
+        speculation_budget.record("hits")
+        if waited: speculation_budget.record("hits_waited")
+        speculation_budget.record("served_tokens", estimate_tokens(slide_text))
+        return slide_text
+
+    def discard(self):
+        """Drops a pending speculation without counting a miss (e.g. a new one replaces it)."""
+        with self._lock:
+            future = self._future
+            self._future = self._fingerprint = None
+        if future is not None: self._charge_waste(future)
+
+    def _record_miss(self, reason: str, future):
+        self.misses[reason] += 1; self._consecutive_misses += 1
+        speculation_budget.record("misses")
+        if future is not None: self._charge_waste(future)
+
+    @staticmethod
+    def _charge_waste(future):
+        def charge(done_future):
+            try: speculation_budget.record_waste(estimate_tokens(done_future.result() or ""))
+            except Exception: pass
+        future.add_done_callback(charge) # Runs now if already done, else when the in-flight call returns
+
+    def stats(self) -> dict:
+        with self._lock: pending = self._future is not None
+        return {"hits": self.hits, "misses": dict(self.misses), "pending": pending,
+                "paused": self._consecutive_misses >= SPECULATIVE_MAX_SESSION_MISSES}
@@ -0,0 +1,79 @@
+# core/startup_profiler.py
+# Cold-start profiling and deferred imports.
+# Heavy dependencies (langchain, the OpenAI client stack, pinecone) are imported on first use through
+# lazy_import() instead of when app.py starts. With STARTUP_PROFILE=1 every top-level import and one-time
+# initialization wrapped in profile_stage() is timed, a breakdown is printed after the first page load,
+# and deferred imports that happen later (e.g. langchain on the first chat turn) are printed as they occur.
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+STARTUP_PROFILE_ENABLED = os.getenv("STARTUP_PROFILE", "0").lower() in ("1", "true", "yes")
+# Reported as loaded or deferred in the breakdown.
+HEAVY_MODULES = ("langchain", "langchain_openai", "openai", "pinecone", "numpy", "tiktoken", "sentence_transformers", "torch")
+
+
+class StartupProfiler:
+    def __init__(self, enabled: bool = STARTUP_PROFILE_ENABLED):
+        self.enabled = enabled
+        self.started_at = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = [] # {"kind", "label", "ms", "new_modules", "after_first_page_load"}
+        self._seen = set()
+        self._reported = False
+
+    @contextmanager
+    def stage(self, label: str, kind: str = "init"):
+        """Times the block the first time (kind, label) runs in this process; later runs (Streamlit reruns) are not recorded."""
+        if not self.enabled or (kind, label) in self._seen:
+            yield
+            return
+        modules_before = len(sys.modules)
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {"kind": kind, "label": label, "ms": round((time.perf_counter() - started_at) * 1000, 1),
+                      "new_modules": len(sys.modules) - modules_before, "after_first_page_load": self._reported}
+            with self._lock:
+                if (kind, label) not in self._seen:
+                    self._seen.add((kind, label)); self._stages.append(record)
+            if record["after_first_page_load"]:
+                print(f"Startup Profile: Deferred {kind} '{label}' took {record['ms']:.1f} ms ({record['new_modules']} modules).")
+
+    def report(self):
+        """Prints the import/init breakdown once per process, at the end of the first page load."""
+        if not self.enabled or self._reported: return
+        self._reported = True
+        with self._lock: stages = list(self._stages)
+        lines = [f"Startup Profile: first page load {(time.perf_counter() - self.started_at) * 1000:.1f} ms after the profiler was imported."]
+        for kind in ("import", "init"):
+            kind_stages = sorted((s for s in stages if s["kind"] == kind), key=lambda s: s["ms"], reverse=True)
+            lines.append(f"  {kind} total {sum(s['ms'] for s in kind_stages):.1f} ms")
+            lines.extend(f"    {s['ms']:>9.1f} ms  {s['label']} (+{s['new_modules']} modules)" for s in kind_stages)
+        loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        lines.append(f"  heavy modules loaded: {', '.join(loaded) or 'none'}; "
+                     f"deferred: {', '.join(name for name in HEAVY_MODULES if name not in loaded) or 'none'}")
+        print("\n".join(lines))
+
+    def stages(self) -> list[dict]:
+        with self._lock:
+            return [dict(s) for s in self._stages]
+
+
+startup_profiler = StartupProfiler()
+
+def profile_stage(label: str, kind: str = "init"):
+    return startup_profiler.stage(label, kind)
+
+def report_startup_profile():
+    startup_profiler.report()
+
+def lazy_import(module_name: str):
+    """Imports module_name on first use (timed as an 'import' stage); later calls are a sys.modules lookup."""
+    if module_name in sys.modules: return importlib.import_module(module_name) # Also waits out an import in progress on another thread
+    with startup_profiler.stage(module_name, kind="import"):
+        return importlib.import_module(module_name)
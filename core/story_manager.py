@@ -1,38 +1,87 @@
 # core/story_manager.py
 import datetime 
+import functools
+import os
+import time
 from .prompts import BENNET_STYLE_INITIAL_SCENE_PROMPT 
 from .agent_factory import generate_agent_profile, describe_agent
 from .narration import get_active_voice_description, VOICE_OPTIONS_MAP
-from .utils import is_primarily_story_content
 from .story_engine import build_agent_context_for_prompt 
-
-from .langchain_chains import (
-    create_author_style_snippet_chain,
-    create_slide_generation_chain,
-    create_story_compilation_pipeline
-)
+from .style_library import author_style_id, build_author_voice_description, record_author_style_use, save_author_style, list_author_styles, get_author_style_by_id
+from .chat_history import COMPILED_STORY_MESSAGE_PREFIX, COMPILED_NOVEL_MESSAGE_PREFIX
+from .story_state import StoryState # Re-exported: app.py builds story_manager.StoryState
+from .session_store import get_session_store, is_valid_session_id, SessionConflictError, SessionJournal
+from .compile_jobs import get_compile_job_manager, JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED, FINISHED_JOB_STATUSES
+from .startup_profiler import lazy_import
+from .speculation import SPECULATIVE_CONTINUATION_INPUT
+from .singleflight import SingleFlight, request_key
+from .renarration_cache import style_version
+from .utils import is_primarily_story_content
+from .tracing import traced, current_span
 
 XAI_API_KEY_CONFIGURED = False 
+STYLE_PREVIEW_MAX_CONCURRENCY = int(os.getenv("STYLE_PREVIEW_MAX_CONCURRENCY", "8")) # Re-narration calls in flight for "preview in all styles"
+
+# Display labels for the compile stages, in pipeline order (keyed by each stage chain's output_key).
+COMPILE_STAGE_LABELS = {
+    "plot_outline": "📝 Plot Outline",
+    "story_draft": "✍️ Story Draft",
+    "refined_story": "✨ Refined Story",
+}
+
+# Stage labels of the long-form novel job (core/novel_compiler.py), in order.
+NOVEL_COMPILE_STAGE_LABELS = {
+    "book_outline": "📚 Book Outline",
+    "chapter_outlines": "🗂️ Chapter Outlines",
+    "chapter_drafts": "✍️ Chapter Drafts (in parallel)",
+    "continuity": "🧵 Continuity Pass",
+}
+
+def compile_stage_label(stage_key: str) -> str:
+    return COMPILE_STAGE_LABELS.get(stage_key) or NOVEL_COMPILE_STAGE_LABELS.get(stage_key) or stage_key
+
+def _traced_handler(handler):
+    """One tracing span per call (core/tracing.py), tagged with the calling session's id."""
+    return traced(kind="handler", session_id=lambda current_state, *args, **kwargs: current_state.ui_inputs.get("session_id"))(handler)
+
+story_request_flight = SingleFlight() # Sidebar handlers, deduplicated per session (see _single_flight)
+
+def _single_flight(handler):
+    """
+    Collapses identical requests of one session: same handler, same normalized arguments, same state
+    object and fingerprint. A double click or a replayed widget change shares the in-flight (or just finished)
+    call's result instead of paying for another LLM call. Results are only registered under the
+    request's pre-call key: the same request against the state a call produced (a deliberate
+    force_refresh, re-adding a character) is a new request and runs.
+    The key includes the identity of the StoryState object, which each Streamlit session (browser tab)
+    owns: tabs resumed from the same ?session= id share a session_id and may share a fingerprint, but
+    must never be handed each other's mutable state. A cached result holds its state object, so the
+    id can't be reused by another state while the entry lives.
+    """
+    @functools.wraps(handler)
+    def wrapper(current_state: StoryState, *args, **kwargs):
+        request_parts = (handler.__name__, current_state.ui_inputs.get("session_id"), *args, *(f"{k}={v}" for k, v in sorted(kwargs.items())))
+        result, shared = story_request_flight.do(request_key(*request_parts, id(current_state), current_state.fingerprint()),
+                                                 handler, current_state, *args, **kwargs)
+        if shared:
+            log_message(f"Single-flight: Duplicate '{handler.__name__}' request served from the identical in-flight/recent call.")
+            current_span().set(single_flight="shared")
+        return result
+    return wrapper
+
+def get_request_dedup_stats() -> dict:
+    return story_request_flight.stats()
+
+def _chains():
+    """core.langchain_chains, imported on the first LLM call: it pulls in langchain and the OpenAI client stack."""
+    return lazy_import("core.langchain_chains")
 
 def log_message(message: str): # Logging helper
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"LOG [{timestamp}]: {message}")
 
-# --- StoryState, initialize_story_state, _get_narration_snippet_instruction_for_chain, 
+# --- StoryState now lives in core/story_state.py (re-exported here); initialize_story_state, _get_narration_snippet_instruction_for_chain, 
 # --- _is_new_story_context, _prime_bennet_context_if_new_story remain the same as Message #33 ---
-class StoryState: # ... same ...
-    def __init__(self, messages, agents, story_config, narration_voice_id, last_story_slide_text, ui_inputs=None):
-        self.messages = list(messages); self.agents = list(agents); self.story_config = dict(story_config)
-        self.narration_voice_id = narration_voice_id; self.last_story_slide_text = last_story_slide_text
-        self.ui_inputs = ui_inputs if ui_inputs else {}
-    def to_dict(self):
-        return {
-            "messages": self.messages, "agents": self.agents, "story_config": self.story_config,
-            "narration_voice_id": self.narration_voice_id, "last_story_slide_text": self.last_story_slide_text,
-            "new_char_name_val": self.ui_inputs.get("new_char_name_val", ""),
-            "new_char_role_val": self.ui_inputs.get("new_char_role_val", ""),
-            "custom_author_name_val": self.ui_inputs.get("custom_author_name_val", "")
-        }
 def initialize_story_state() -> dict: # ... same ...
     log_message("Initializing new story state.")
     initial_config = {"genre": None, "setting": None, "tone": None, "narration_style": get_active_voice_description("DEFAULT")}
@@ -42,6 +91,35 @@ def initialize_story_state() -> dict: # ... same ...
         "agents": [], "story_config": initial_config, "narration_voice_id": "DEFAULT",
         "last_story_slide_text": None, "new_char_name_val": "", "new_char_role_val": "", "custom_author_name_val":""
     }
+def resume_story_state(session_id: str, ui_inputs: dict = None) -> StoryState | None:
+    """Loads a persisted session (snapshot + journal replay). None if persistence is off or the session is unknown."""
+    store = get_session_store()
+    if store is None or not is_valid_session_id(session_id): return None
+    started_at = time.perf_counter()
+    try:
+        state_dict, last_seq, records_since_snapshot = store.load(session_id)
+        if state_dict is None: return None
+        state = StoryState.from_dict(state_dict, ui_inputs)
+    except Exception as e:
+        log_message(f"ERROR resuming session {session_id}: {e}"); return None
+    state.journal = SessionJournal(store, session_id, state_dict, last_seq, records_since_snapshot)
+    log_message(f"Resumed session {session_id}: {len(state.messages)} messages ({records_since_snapshot} journal records replayed) "
+                f"in {(time.perf_counter() - started_at) * 1000:.1f} ms.")
+    return state
+
+def persist_story_state(current_state: StoryState, session_id: str):
+    """Journals whatever changed in current_state since it was last persisted."""
+    store = get_session_store()
+    if store is None or not is_valid_session_id(session_id): return
+    if current_state.journal is None or current_state.journal.session_id != session_id:
+        current_state.journal = SessionJournal(store, session_id)
+    try:
+        current_state.journal.sync(current_state)
+    except SessionConflictError as e:
+        log_message(f"WARNING persisting session {session_id}: {e}")
+    except Exception as e:
+        log_message(f"ERROR persisting session {session_id}: {e}") # The in-memory session carries on; the next sync retries
+
 def _get_narration_snippet_instruction_for_chain(narration_style_details: dict, context_label="current operation") -> str: # ... same ...
     if narration_style_details and narration_style_details.get("source_text_snippet"):
         return (f"\nCRITICAL STYLE REFERENCE (Emulate this style for the {context_label}):\n"
@@ -50,8 +128,8 @@ def _get_narration_snippet_instruction_for_chain(narration_style_details: dict,
 def _is_new_story_context(current_state: StoryState) -> bool: # ... same ...
     # True if very few messages and no story content generated yet.
     # User's first real input after initial assistant message and potential style setting.
-    story_messages_count = sum(1 for msg in current_state.messages if msg['role'] == 'assistant' and is_primarily_story_content(msg['content'])[0])
-    return len(current_state.messages) <= 5 and not current_state.last_story_slide_text and story_messages_count == 0
+    if len(current_state.messages) > 5 or current_state.last_story_slide_text: return False
+    return current_state.messages.story_count == 0 # Maintained as messages are appended
 
 def _prime_bennet_context_if_new_story(current_state: StoryState): # ... same ...
     if current_state.narration_voice_id == "BENNET_REGENCY" and _is_new_story_context(current_state):
@@ -66,36 +144,19 @@ def _prime_bennet_context_if_new_story(current_state: StoryState): # ... same ..
             default_protagonist_role = "Lady's Maid (or Governess)"
             default_protagonist = generate_agent_profile(name=default_protagonist_name, role=default_protagonist_role, traits=["observant", "intelligent", "quietly yearning"], goal="Seek a life of meaning beyond her current station", conflict="Duty to her employers vs. her own desires and principles")
             current_state.agents.append(default_protagonist)
-            current_state.messages.append({"role": "assistant", "content": (f"For 'Bennet (Regency Romance)' style, I've set up: {default_protagonist_name}, a {default_protagonist_role}. The story will begin per style guidelines. What would you like to happen?")})
+            current_state.add_message("assistant", f"For 'Bennet (Regency Romance)' style, I've set up: {default_protagonist_name}, a {default_protagonist_role}. The story will begin per style guidelines. What would you like to happen?")
         log_message(f"Bennet context primed: Genre='{current_state.story_config['genre']}', Setting='{current_state.story_config['setting']}', Agents: {len(current_state.agents)}")
 
 
-def _call_langchain_slide_chain(current_state: StoryState, latest_user_input_override: str = None) -> StoryState:
-    log_message(f"Entering _call_langchain_slide_chain. Override input: '{latest_user_input_override[:100] if latest_user_input_override else 'None'}...'")
-    xai_api_key = current_state.ui_inputs.get("xai_api_key")
-    if not XAI_API_KEY_CONFIGURED or not xai_api_key:
-        log_message("API Key missing in _call_langchain_slide_chain. Aborting.")
-        current_state.messages.append({"role": "assistant", "content": "Cannot contact AI: API Key missing."}); return current_state
-
+def _build_slide_chain_input(current_state: StoryState, latest_user_input_override: str = None) -> dict:
     narration_details = current_state.story_config.get("narration_style", get_active_voice_description("DEFAULT"))
     
-    # Prepare chat history: last ~5 turns, excluding the current user input if it's not an override
-    history_limit = 5 
-    relevant_messages = []
-    user_turns = 0
-    assistant_turns = 0
-    for msg in reversed(current_state.messages):
-        if msg['role'] == 'user' and not latest_user_input_override and msg['content'] == current_state.messages[-1].get('content'): # Skip current user input unless overridden
-            continue
-        if msg['role'] == 'user' and user_turns >= history_limit: continue
-        if msg['role'] == 'assistant' and assistant_turns >= history_limit: continue
-        
-        relevant_messages.insert(0, f"{msg['role']}: {msg['content']}")
-        if msg['role'] == 'user': user_turns +=1
-        if msg['role'] == 'assistant': assistant_turns +=1
-        if user_turns >= history_limit and assistant_turns >= history_limit: break
-        
-    formatted_chat_history = "\n".join(relevant_messages)
+    # Chat history: token-budgeted window, synced with only the messages appended since the last turn.
+    # The current user input is excluded unless overridden (it is passed separately as user_input).
+    current_state.history_window.sync(current_state.messages)
+    current_input_index = len(current_state.messages) - 1 if not latest_user_input_override and current_state.messages and current_state.messages[-1]['role'] == 'user' else None
+    formatted_chat_history = current_state.history_window.format(exclude_message_index=current_input_index)
+    log_message(f"Chat history window: {current_state.history_window.stats()}")
     
     effective_user_input = latest_user_input_override
     if not effective_user_input: 
@@ -135,39 +196,218 @@ def _call_langchain_slide_chain(current_state: StoryState, latest_user_input_ove
         "genre": current_state.story_config.get("genre", "Not set"),
         "setting": current_state.story_config.get("setting", "Not set"),
         "tone": current_state.story_config.get("tone", "Not set"),
+        "story_summary": current_state.summary_memory.get_summary(), # Section omitted from the prompt while empty
         "chat_history": formatted_chat_history,
     }
     log_message(f"Invoking slide_generation_chain. Initial directive populated: {bool(initial_scene_directive_slide)}. Plot focus: '{current_plot_focus[:70]}...'")
+    return chain_input
+
+def _apply_slide_response(current_state: StoryState, ai_response_text: str):
+    # Do not add AI's entire meta-response if it includes self-correction/analysis steps
+    # The prompt now asks for "Output only your complete response (acknowledgment, story segment, and follow-up question...)"
+    # So, we assume ai_response_text is the final user-facing output.
+    response_message = current_state.add_message("assistant", ai_response_text)
     
+    is_story, extracted_story_text = response_message.is_story, response_message.story_text
+    if is_story and extracted_story_text:
+        current_state.last_story_slide_text = extracted_story_text
+        log_message(f"Extracted story slide. New last_story_slide_text (first 100): '{extracted_story_text[:100]}...'")
+    else:
+        # If it's not story content (e.g., just an acknowledgement or question), clear last_story_slide_text
+        # to avoid re-narrating this non-story response if style changes again.
+        current_state.last_story_slide_text = None 
+        log_message("AI response was not primarily story content. last_story_slide_text cleared.")
+    _schedule_story_summary_update(current_state)
+    if is_story: _schedule_speculative_slide(current_state)
+
+def _schedule_speculative_slide(current_state: StoryState):
+    """Opt-in: pre-generates the slide a "continue" would produce next, against the current state (core/speculation.py)."""
+    xai_api_key = current_state.ui_inputs.get("xai_api_key")
+    if not current_state.ui_inputs.get("speculative_slides") or not XAI_API_KEY_CONFIGURED or not xai_api_key: return
+    chain_input = _build_slide_chain_input(current_state, latest_user_input_override=SPECULATIVE_CONTINUATION_INPUT)
+    chain_input["last_story_slide_text"] = "" # As handle_regular_chat_input clears it before generating
+
+    def generate_slide(speculative_input: dict) -> str:
+        return _chains().create_slide_generation_chain(api_key=xai_api_key).invoke(speculative_input).get("ai_response")
+
+    if current_state.speculation.schedule(current_state.fingerprint(), generate_slide, chain_input):
+        log_message("Speculation: Pre-generating the next slide in the background.")
+
+def _take_speculative_slide(current_state: StoryState, user_text: str) -> str | None:
+    slide_text = current_state.speculation.take(current_state.fingerprint(exclude_trailing_user_message=True), user_text)
+    if slide_text: log_message("Speculation hit: serving the pre-generated slide."); current_span().set(speculative_hit=True)
+    return slide_text
+
+def _schedule_story_summary_update(current_state: StoryState):
+    """Hands story slides that just aged out of the history window to the background summary memory."""
+    current_state.history_window.sync(current_state.messages)
+    evicted_indices = current_state.history_window.pop_evicted_indices()
+    evicted_story_segments = []
+    for message_index in evicted_indices:
+        msg = current_state.messages[message_index]
+        if msg['role'] != 'assistant': continue
+        if msg.is_story and msg.story_text: evicted_story_segments.append(msg.story_text)
+    if not evicted_story_segments: return
+    current_state.summary_memory.add_segments(evicted_story_segments)
+    if current_state.summary_memory.schedule_update(current_state.ui_inputs.get("xai_api_key")):
+        log_message(f"Scheduled background story summary update ({len(evicted_story_segments)} evicted slides).")
+
+def _call_langchain_slide_chain(current_state: StoryState, latest_user_input_override: str = None) -> StoryState:
+    log_message(f"Entering _call_langchain_slide_chain. Override input: '{latest_user_input_override[:100] if latest_user_input_override else 'None'}...'")
+    xai_api_key = current_state.ui_inputs.get("xai_api_key")
+    if not XAI_API_KEY_CONFIGURED or not xai_api_key:
+        log_message("API Key missing in _call_langchain_slide_chain. Aborting.")
+        current_state.add_message("assistant", "Cannot contact AI: API Key missing."); return current_state
+
+    chain_input = _build_slide_chain_input(current_state, latest_user_input_override)
     try:
-        slide_chain = create_slide_generation_chain(api_key=xai_api_key) 
+        slide_chain = _chains().create_slide_generation_chain(api_key=xai_api_key) 
         response = slide_chain.invoke(chain_input)
         ai_response_text = response.get("ai_response", "Sorry, I had trouble generating a response.")
         log_message(f"slide_generation_chain response (first 100 chars): '{ai_response_text[:100]}...'")
-        
-        # Do not add AI's entire meta-response if it includes self-correction/analysis steps
-        # The prompt now asks for "Output only your complete response (acknowledgment, story segment, and follow-up question...)"
-        # So, we assume ai_response_text is the final user-facing output.
-        current_state.messages.append({"role": "assistant", "content": ai_response_text})
-        
-        is_story, extracted_story_text = is_primarily_story_content(ai_response_text)
-        if is_story and extracted_story_text:
-            current_state.last_story_slide_text = extracted_story_text
-            log_message(f"Extracted story slide. New last_story_slide_text (first 100): '{extracted_story_text[:100]}...'")
-        else:
-            # If it's not story content (e.g., just an acknowledgement or question), clear last_story_slide_text
-            # to avoid re-narrating this non-story response if style changes again.
-            current_state.last_story_slide_text = None 
-            log_message("AI response was not primarily story content. last_story_slide_text cleared.")
-            
+        _apply_slide_response(current_state, ai_response_text)
     except Exception as e:
         log_message(f"ERROR in _call_langchain_slide_chain: {e}")
         import traceback
         print(f"Detailed error in _call_langchain_slide_chain: {e}\n{traceback.format_exc()}")
-        current_state.messages.append({"role": "assistant", "content": f"Langchain slide error: {e}"})
+        current_state.add_message("assistant", f"Langchain slide error: {e}")
     log_message("Exiting _call_langchain_slide_chain.")
     return current_state
 
+def _stream_langchain_slide_chain(current_state: StoryState, latest_user_input_override: str = None):
+    """Streaming variant of _call_langchain_slide_chain: yields text chunks, then records the full response on current_state."""
+    log_message(f"Entering _stream_langchain_slide_chain. Override input: '{latest_user_input_override[:100] if latest_user_input_override else 'None'}...'")
+    xai_api_key = current_state.ui_inputs.get("xai_api_key")
+    if not XAI_API_KEY_CONFIGURED or not xai_api_key:
+        log_message("API Key missing in _stream_langchain_slide_chain. Aborting.")
+        error_text = "Cannot contact AI: API Key missing."
+        current_state.add_message("assistant", error_text); yield error_text; return
+
+    chain_input = _build_slide_chain_input(current_state, latest_user_input_override)
+    response_parts = []
+    started_at = time.perf_counter()
+    try:
+        slide_chain = _chains().create_slide_generation_chain(api_key=xai_api_key)
+        for chunk in _chains().stream_chain(slide_chain, chain_input):
+            if not response_parts: log_message(f"slide_generation_chain time-to-first-token: {(time.perf_counter() - started_at) * 1000:.0f} ms")
+            response_parts.append(chunk)
+            yield chunk
+        ai_response_text = "".join(response_parts) or "Sorry, I had trouble generating a response."
+        log_message(f"slide_generation_chain streamed {len(ai_response_text)} chars in {time.perf_counter() - started_at:.1f}s.")
+        _apply_slide_response(current_state, ai_response_text)
+    except Exception as e:
+        log_message(f"ERROR in _stream_langchain_slide_chain: {e}")
+        import traceback
+        print(f"Detailed error in _stream_langchain_slide_chain: {e}\n{traceback.format_exc()}")
+        error_text = f"Langchain slide error: {e}"
+        current_state.add_message("assistant", error_text)
+        yield f"\n\n{error_text}"
+    log_message("Exiting _stream_langchain_slide_chain.")
+
+def _current_narration_style(current_state: StoryState) -> tuple[str, dict]:
+    """(voice id, description) the story is currently narrated in; built-in voices are looked up, not taken from story_config."""
+    voice_id = current_state.narration_voice_id
+    if voice_id.startswith("custom_"): return voice_id, current_state.story_config.get("narration_style")
+    return voice_id, get_active_voice_description(voice_id)
+
+def _cache_current_rendition(current_state: StoryState, style: tuple[str, dict]):
+    """Stores the response last_story_slide_text was extracted from as its rendition in style (voice id, description)."""
+    source_text = current_state.last_story_slide_text
+    source_message = next((m for m in reversed(current_state.messages) if m.role == "assistant" and m.story_text == source_text), None)
+    if source_message is not None:
+        current_state.renarration_cache.put(source_text, style[0], style_version(style[1]), source_message.content, source_text)
+
+def _renarrate_last_slide(current_state: StoryState, directive_for_ai: str, previous_style: tuple[str, dict]) -> StoryState:
+    """
+    Re-narrates last_story_slide_text in the current narration style, served from the session's
+    re-narration cache when this slide was already rendered in that style (core/renarration_cache.py).
+    previous_style is the (voice id, description) the slide was written in.
+    """
+    cache = current_state.renarration_cache
+    source_text = current_state.last_story_slide_text
+    style_id, version = current_state.narration_voice_id, style_version(current_state.story_config.get("narration_style"))
+    cached_response = cache.get(source_text, style_id, version)
+    if cached_response:
+        log_message(f"Re-narration cache hit for style '{style_id}'. Skipping the LLM call.")
+        current_span().set(renarration_cache="hit")
+        _apply_slide_response(current_state, cached_response)
+        return current_state
+    _cache_current_rendition(current_state, previous_style) # So switching back to the slide's voice is a hit too
+    messages_before = len(current_state.messages)
+    current_state = _call_langchain_slide_chain(current_state, latest_user_input_override=directive_for_ai)
+    response_message = current_state.messages[-1] if len(current_state.messages) > messages_before else None
+    if response_message is not None and response_message.is_story and current_state.last_story_slide_text:
+        cache.put(source_text, style_id, version, response_message.content, current_state.last_story_slide_text)
+    return current_state
+
+def list_preview_styles() -> list[tuple[str, dict]]:
+    """(voice id, description) of every pre-defined voice and stored author style."""
+    styles = [(voice_id, get_active_voice_description(voice_id)) for voice_id in dict.fromkeys(VOICE_OPTIONS_MAP.values())]
+    styles.extend((entry["style_id"], build_author_voice_description(entry)) for entry in list_author_styles())
+    return styles
+
+@_traced_handler
+def preview_last_slide_in_styles(current_state: StoryState, styles: list[tuple[str, dict]] = None):
+    """
+    Re-narrates last_story_slide_text in every style (default: list_preview_styles()) without changing
+    the state's voice. Yields {"style_id", "name_display", "text", "source", "error"} per style as it
+    completes; source is "current", "cache" or "llm". Cached renditions are yielded first, the rest are
+    generated concurrently (STYLE_PREVIEW_MAX_CONCURRENCY calls in flight) and added to the cache.
+    """
+    source_text = current_state.last_story_slide_text
+    if not source_text: return
+    styles = styles if styles is not None else list_preview_styles()
+    cache = current_state.renarration_cache
+    current_style = _current_narration_style(current_state)
+    _cache_current_rendition(current_state, current_style)
+    pending = []
+    for style_id, voice_desc in styles:
+        name_display = voice_desc.get("name_display", style_id)
+        if style_id == current_style[0]:
+            yield {"style_id": style_id, "name_display": name_display, "text": source_text, "source": "current", "error": None}; continue
+        cached_response = cache.get(source_text, style_id, style_version(voice_desc))
+        if cached_response:
+            yield {"style_id": style_id, "name_display": name_display, "text": is_primarily_story_content(cached_response)[1] or cached_response,
+                   "source": "cache", "error": None}
+        else: pending.append((style_id, voice_desc))
+    if not pending: return
+    xai_api_key = current_state.ui_inputs.get("xai_api_key")
+    if not XAI_API_KEY_CONFIGURED or not xai_api_key:
+        for style_id, voice_desc in pending:
+            yield {"style_id": style_id, "name_display": voice_desc.get("name_display", style_id), "text": None, "source": "llm", "error": "API Key missing."}
+        return
+
+    base_input = _build_slide_chain_input(current_state, latest_user_input_override="System Directive: Style preview.")
+    chain_inputs = []
+    for style_id, voice_desc in pending:
+        name_display = voice_desc.get("name_display", "Default AI")
+        chain_inputs.append({**base_input,
+            "user_input": f"System Directive: Narration style preview in '{name_display}'. You MUST re-narrate the content provided in the PREVIOUS STORY SLIDE using this style. Focus ONLY on re-writing the text in the new voice; do NOT add new plot or change core events.",
+            "narration_name_display": name_display, "narration_tone": voice_desc.get("tone", "Neutral"),
+            "narration_inspired_by": voice_desc.get("inspired_by", "Clarity"),
+            "narration_style_snippet_instruction_slide": _get_narration_snippet_instruction_for_chain(voice_desc, "next story slide"),
+            "initial_scene_directive_slide": "",
+            "current_plot_focus_or_user_goal": f"Style preview: re-narrate the previous slide text ('{source_text[:50]}...') in '{name_display}'. Re-write ONLY that text."})
+    log_message(f"Style preview: Re-narrating the last slide in {len(pending)} styles ({len(styles) - len(pending)} already available).")
+    started_at = time.perf_counter()
+    slide_chain = _chains().create_slide_generation_chain(api_key=xai_api_key)
+    for pending_index, response in slide_chain.batch_as_completed(chain_inputs, config={"max_concurrency": STYLE_PREVIEW_MAX_CONCURRENCY},
+                                                                 return_exceptions=True):
+        style_id, voice_desc = pending[pending_index]
+        name_display = voice_desc.get("name_display", style_id)
+        response_text = None if isinstance(response, Exception) else response.get("ai_response")
+        if not response_text:
+            log_message(f"Style preview: '{style_id}' failed: {response if isinstance(response, Exception) else 'empty response'}")
+            yield {"style_id": style_id, "name_display": name_display, "text": None, "source": "llm",
+                   "error": str(response) if isinstance(response, Exception) else "Empty response."}
+            continue
+        is_story, story_text = is_primarily_story_content(response_text)
+        if is_story and story_text: cache.put(source_text, style_id, style_version(voice_desc), response_text, story_text)
+        log_message(f"Style preview: '{style_id}' ready after {time.perf_counter() - started_at:.1f}s.")
+        yield {"style_id": style_id, "name_display": name_display, "text": story_text or response_text, "source": "llm", "error": None}
+
+@_traced_handler
+@_single_flight
 def handle_story_details_update(current_state: StoryState, genre: str, setting: str, tone: str) -> tuple[StoryState, bool, str]:
     log_message(f"Entering handle_story_details_update. Genre: '{genre}', Setting: '{setting}', Tone: '{tone}'")
     updated = False; status_msg = "No changes in story details."
@@ -177,7 +417,7 @@ def handle_story_details_update(current_state: StoryState, genre: str, setting:
     if updated:
         log_message("Story details updated. Preparing AI acknowledgement.")
         user_confirmation = f"✅ Story elements updated: Genre='{current_state.story_config.get('genre', 'N/A')}', Setting='{current_state.story_config.get('setting', 'N/A')}', Tone='{current_state.story_config.get('tone', 'N/A')}'."
-        current_state.messages.append({"role": "assistant", "content": user_confirmation}) # User confirmation first
+        current_state.add_message("assistant", user_confirmation) # User confirmation first
         # Then craft the directive for the AI
         directive = f"System Update: Core story elements have been updated by the user. Genre is now '{current_state.story_config.get('genre', 'N/A')}', Setting is '{current_state.story_config.get('setting', 'N/A')}', Tone is '{current_state.story_config.get('tone', 'N/A')}'. Please acknowledge this change and, based on the current setup state (e.g., if characters are defined, if initial story elements are complete), ask the next logical question for story setup or await user input to begin the story."
         current_state = _call_langchain_slide_chain(current_state, latest_user_input_override=directive)
@@ -186,9 +426,12 @@ def handle_story_details_update(current_state: StoryState, genre: str, setting:
     log_message("Exiting handle_story_details_update.")
     return current_state, updated, status_msg
 
+@_traced_handler
+@_single_flight
 def handle_narration_voice_change(current_state: StoryState, new_voice_id: str) -> tuple[StoryState, bool]:
     log_message(f"Entering handle_narration_voice_change. New voice ID: '{new_voice_id}'")
     if new_voice_id != current_state.narration_voice_id:
+        previous_style = _current_narration_style(current_state)
         current_state.narration_voice_id = new_voice_id
         voice_desc = get_active_voice_description(new_voice_id)
         current_state.story_config["narration_style"] = voice_desc 
@@ -203,9 +446,9 @@ def handle_narration_voice_change(current_state: StoryState, new_voice_id: str)
         if current_state.last_story_slide_text: 
             log_message("Previous slide exists. Triggering re-narration.")
             user_confirmation_message += " The previous segment will now be re-narrated in this style."
-            directive_for_ai += " You MUST re-narrate the content provided in 'last_story_slide_text' using this new style. Focus ONLY on re-writing the text in the new voice; do NOT add new plot or change core events."
-            current_state.messages.append({"role": "assistant", "content": user_confirmation_message}) # Show user confirmation
-            current_state = _call_langchain_slide_chain(current_state, latest_user_input_override=directive_for_ai)
+            directive_for_ai += " You MUST re-narrate the content provided in the PREVIOUS STORY SLIDE using this new style. Focus ONLY on re-writing the text in the new voice; do NOT add new plot or change core events."
+            current_state.add_message("assistant", user_confirmation_message) # Show user confirmation
+            current_state = _renarrate_last_slide(current_state, directive_for_ai, previous_style)
         else: # No previous slide
             log_message("No previous slide. Style will apply to next generation.")
             # If _prime_bennet_context_if_new_story added a message, don't overwrite or duplicate simple confirmations.
@@ -217,7 +460,7 @@ def handle_narration_voice_change(current_state: StoryState, new_voice_id: str)
             
             if not is_bennet_primed_message_last:
                 user_confirmation_message += " This new style will be applied to the next part of the story. What would you like to do next?"
-                current_state.messages.append({"role": "assistant", "content": user_confirmation_message})
+                current_state.add_message("assistant", user_confirmation_message)
             # No LLM call here just for style set without re-narration. AI will get context on next user input.
         
         log_message("Exiting handle_narration_voice_change (updated).")
@@ -225,26 +468,38 @@ def handle_narration_voice_change(current_state: StoryState, new_voice_id: str)
     log_message("Exiting handle_narration_voice_change (no change).")
     return current_state, False
 
-def handle_custom_author_style_change(current_state: StoryState, author_name: str) -> tuple[StoryState, bool]:
+@_traced_handler
+@_single_flight
+def handle_custom_author_style_change(current_state: StoryState, author_name: str, force_refresh: bool = False) -> tuple[StoryState, bool]:
     # ... (similar logic to handle_narration_voice_change for conditional LLM call) ...
-    log_message(f"Entering handle_custom_author_style_change. Author: '{author_name}'")
+    log_message(f"Entering handle_custom_author_style_change. Author: '{author_name}', Force refresh: {force_refresh}")
     xai_api_key = current_state.ui_inputs.get("xai_api_key")
-    if not XAI_API_KEY_CONFIGURED or not xai_api_key: log_message("API Key missing."); current_state.messages.append({"role": "assistant", "content": "Cannot set style: API Key missing."}); return current_state, False
-    if not author_name.strip(): log_message("Author name empty."); current_state.messages.append({"role": "assistant", "content": "Author name is empty."}); return current_state, False
+    if not XAI_API_KEY_CONFIGURED or not xai_api_key: log_message("API Key missing."); current_state.add_message("assistant", "Cannot set style: API Key missing."); return current_state, False
+    if not author_name.strip(): log_message("Author name empty."); current_state.add_message("assistant", "Author name is empty."); return current_state, False
     
-    current_state.messages.append({"role": "user", "content": f"System Command: User wants to emulate author: {author_name}"}) 
-    current_state.messages.append({"role": "assistant", "content": f"Attempting to generate a style example for {author_name}..."})
+    current_state.add_message("user", f"System Command: User wants to emulate author: {author_name}") 
     try:
-        log_message(f"Invoking author_style_snippet_chain for '{author_name}'.")
-        snippet_chain = create_author_style_snippet_chain(api_key=xai_api_key)
-        response = snippet_chain.invoke({"author_name": author_name})
-        style_snippet = response.get("style_snippet")
-        log_message(f"Snippet chain response (first 50 chars): '{style_snippet[:50] if style_snippet else 'None'}'")
-        if not style_snippet: log_message(f"Snippet generation failed for {author_name}."); current_state.messages.append({"role": "assistant", "content": f"Could not generate snippet for {author_name}."}); return current_state, False
+        library_entry = None if force_refresh else record_author_style_use(author_name)
+        if library_entry:
+            log_message(f"Author style for '{author_name}' served from style library (uses: {library_entry.get('uses')}).")
+            current_state.add_message("assistant", f"Using the saved style example for {library_entry['author_name']}.")
+        else:
+            current_state.add_message("assistant", f"Attempting to generate a style example for {author_name}...")
+            log_message(f"Invoking author_style_snippet_chain for '{author_name}'.")
+            snippet_chain = _chains().create_author_style_snippet_chain(api_key=xai_api_key)
+            response = snippet_chain.invoke({"author_name": author_name})
+            style_snippet = response.get("style_snippet")
+            log_message(f"Snippet chain response (first 50 chars): '{style_snippet[:50] if style_snippet else 'None'}'")
+            if not style_snippet: log_message(f"Snippet generation failed for {author_name}."); current_state.add_message("assistant", f"Could not generate snippet for {author_name}."); return current_state, False
+            try: library_entry = save_author_style(author_name, style_snippet, model_name=_chains().XAI_MODEL_NAME)
+            except Exception as e_save:
+                log_message(f"Could not save '{author_name}' to style library: {e_save}")
+                library_entry = {"author_name": author_name.strip(), "style_snippet": style_snippet}
         
-        dynamic_id = f"custom_{author_name.replace(' ', '_').lower()}"
+        dynamic_id = author_style_id(author_name)
+        previous_style = _current_narration_style(current_state)
         current_state.narration_voice_id = dynamic_id
-        dynamic_desc = {"name_display": f"{author_name} (Dynamically Emulated)", "tone": f"Emulating style of {author_name}.", "inspired_by": f"Works of {author_name} & generated snippet.", "source_text_snippet": style_snippet}
+        dynamic_desc = build_author_voice_description(library_entry)
         current_state.story_config["narration_style"] = dynamic_desc 
         log_message(f"Custom author style '{dynamic_desc['name_display']}' set.")
 
@@ -254,19 +509,21 @@ def handle_custom_author_style_change(current_state: StoryState, author_name: st
         if current_state.last_story_slide_text:
             log_message("Previous slide exists. Triggering re-narration for custom author.")
             user_confirmation_message += " The previous segment will now be re-narrated."
-            directive_for_ai += " You MUST re-narrate 'last_story_slide_text'. Do NOT add new plot."
-            current_state.messages.append({"role": "assistant", "content": user_confirmation_message})
-            current_state = _call_langchain_slide_chain(current_state, latest_user_input_override=directive_for_ai)
+            directive_for_ai += " You MUST re-narrate the PREVIOUS STORY SLIDE. Do NOT add new plot."
+            current_state.add_message("assistant", user_confirmation_message)
+            current_state = _renarrate_last_slide(current_state, directive_for_ai, previous_style)
         else:
             log_message("No previous slide. Custom author style will apply next.")
             user_confirmation_message += " This new style will be applied to the next part of the story. What's next?"
-            current_state.messages.append({"role": "assistant", "content": user_confirmation_message})
+            current_state.add_message("assistant", user_confirmation_message)
         
         log_message("Exiting handle_custom_author_style_change (success).")
         return current_state, True
     except Exception as e:
-        log_message(f"ERROR in handle_custom_author_style_change: {e}"); current_state.messages.append({"role": "assistant", "content": f"Error setting custom author style: {e}"}); return current_state, False
+        log_message(f"ERROR in handle_custom_author_style_change: {e}"); current_state.add_message("assistant", f"Error setting custom author style: {e}"); return current_state, False
 
+@_traced_handler
+@_single_flight
 def handle_add_character_sidebar(current_state: StoryState, name: str, role: str) -> tuple[StoryState, bool, str]: # ... same structure as #31
     log_message(f"Entering handle_add_character_sidebar. Name: '{name}', Role: '{role}'")
     if not name: log_message("Character name empty. Aborting."); return current_state, False, "Character name needed."
@@ -274,83 +531,216 @@ def handle_add_character_sidebar(current_state: StoryState, name: str, role: str
     desc = describe_agent(agent); current_state.ui_inputs["clear_char_inputs"] = True
     log_message(f"Character '{name}' added. Description: '{desc}'")
     user_confirmation = f"✅ Character added: {desc}"
-    current_state.messages.append({"role": "assistant", "content": user_confirmation})
+    current_state.add_message("assistant", user_confirmation)
     directive = f"System Update: New character '{name}' ({role or 'character'}) added. Description: {desc}. Please acknowledge this and, based on current setup state, ask the next logical setup question or await user input for story."
     current_state.last_story_slide_text = None 
     current_state = _call_langchain_slide_chain(current_state, latest_user_input_override=directive)
     log_message("Exiting handle_add_character_sidebar.")
     return current_state, True, ""
 
+@_traced_handler
+def handle_preview_style_choice(current_state: StoryState, style_id: str) -> tuple[StoryState, bool]:
+    """Switches to a style picked from the style preview: a stored author style or a pre-defined voice."""
+    author_entry = get_author_style_by_id(style_id)
+    if author_entry: return handle_custom_author_style_change(current_state, author_entry["author_name"])
+    return handle_narration_voice_change(current_state, style_id)
+
+def _prepare_compile_pipeline_input(current_state: StoryState) -> tuple[dict, bool]:
+    narration_details = current_state.story_config.get("narration_style", get_active_voice_description(current_state.narration_voice_id))
+    if not current_state.narration_voice_id.startswith("custom_"): 
+        narration_details = get_active_voice_description(current_state.narration_voice_id)
+        current_state.story_config["narration_style"] = narration_details
+    log_message(f"Compile: Using narration style '{narration_details.get('name_display')}'.")
+
+    initial_scene_directive = ""
+    bennet_active_for_compile = False
+    if current_state.narration_voice_id == "BENNET_REGENCY":
+        initial_scene_directive = BENNET_STYLE_INITIAL_SCENE_PROMPT
+        bennet_active_for_compile = True
+        log_message("Compile: Applying BENNET_STYLE_INITIAL_SCENE_PROMPT.")
+        if not current_state.story_config.get("genre"): current_state.story_config['genre'] = "Historical Romance (Regency)"
+        if not current_state.story_config.get("setting"): current_state.story_config['setting'] = "Early 19th Century England"
+        if not current_state.story_config.get("tone"): current_state.story_config['tone'] = "Elegant, Introspective"
+        if not current_state.agents: _prime_bennet_context_if_new_story(current_state) 
+
+    snippet_instr_draft = _get_narration_snippet_instruction_for_chain(narration_details, "full story draft")
+    snippet_instr_refine = _get_narration_snippet_instruction_for_chain(narration_details, "story refinement")
+    characters_full_profiles_str = build_agent_context_for_prompt(current_state.agents)
+    
+    pipeline_input = {
+        "initial_scene_directive_draft": initial_scene_directive, 
+        "initial_scene_directive_refine": initial_scene_directive, 
+        "genre": current_state.story_config.get("genre"), 
+        "setting": current_state.story_config.get("setting"),
+        "tone": current_state.story_config.get("tone"),
+        "characters_summary": "Key characters: " + ", ".join([ag['name'] for ag in current_state.agents]) if current_state.agents else "As defined by genre and style directives.",
+        "narration_name_display": narration_details.get("name_display", "Default AI"),
+        "narration_tone": narration_details.get("tone", "Neutral"), 
+        "narration_inspired_by": narration_details.get("inspired_by", "Clarity"),
+        "narration_style_snippet_instruction": snippet_instr_draft, 
+        "narration_style_snippet_instruction_refine": snippet_instr_refine, 
+        "characters_full_profiles": characters_full_profiles_str,
+        # For refinement context, plot_outline will be passed by SequentialChain
+        "characters_full_profiles_for_refinement_context": characters_full_profiles_str 
+    }
+    return pipeline_input, bennet_active_for_compile
+
+def _append_compiled_story(current_state: StoryState, response: dict):
+    plot_gen = response.get("plot_outline", "Plot not captured.") 
+    log_message(f"--- AGENT OUTPUT: PLOT OUTLINE ---\n{plot_gen}\n--- END PLOT OUTLINE ---")
+    current_state.add_message("assistant", f"Plot Outline Generated.\nNow generating story draft...")
+    draft_gen = response.get("story_draft", "Draft not captured.")
+    log_message(f"--- AGENT OUTPUT: STORY DRAFT ---\n{draft_gen[:500]}...\n--- END STORY DRAFT (Preview) ---")
+    current_state.add_message("assistant", f"Initial Story Draft Generated.\nNow refining the story...")
+    refined_story = response.get("refined_story")
+    log_message(f"--- AGENT OUTPUT: REFINED STORY ---\n{(refined_story or '')[:500]}...\n--- END REFINED STORY (Preview) ---")
+    if not refined_story: 
+        fallback_message = "Pipeline finished, but refined story missing."
+        if draft_gen and draft_gen != "Draft not captured.": fallback_message += " Providing draft:\n\n" + draft_gen
+        else: fallback_message += " No draft available."
+        current_state.add_message("assistant", fallback_message); return
+    current_state.add_message("assistant", f"{COMPILED_STORY_MESSAGE_PREFIX} Here's your polished story:\n\n" + refined_story)
+
+@_traced_handler
 def handle_compile_full_story(current_state: StoryState) -> StoryState: # ... same structure as #31, using updated pipeline
     log_message("Entering handle_compile_full_story.")
     xai_api_key = current_state.ui_inputs.get("xai_api_key")
-    if not XAI_API_KEY_CONFIGURED or not xai_api_key: log_message("API Key missing."); current_state.messages.append({"role": "assistant", "content": "Cannot compile: API Key missing."}); return current_state
+    if not XAI_API_KEY_CONFIGURED or not xai_api_key: log_message("API Key missing."); current_state.add_message("assistant", "Cannot compile: API Key missing."); return current_state
 
-    current_state.messages.append({"role": "assistant", "content": "Initiating Langchain multi-agent story compilation..."})
+    current_state.add_message("assistant", "Initiating Langchain multi-agent story compilation...")
     try:
-        narration_details = current_state.story_config.get("narration_style", get_active_voice_description(current_state.narration_voice_id))
-        if not current_state.narration_voice_id.startswith("custom_"): 
-            narration_details = get_active_voice_description(current_state.narration_voice_id)
-            current_state.story_config["narration_style"] = narration_details
-        log_message(f"Compile: Using narration style '{narration_details.get('name_display')}'.")
-
-        initial_scene_directive = ""
-        bennet_active_for_compile = False
-        if current_state.narration_voice_id == "BENNET_REGENCY":
-            initial_scene_directive = BENNET_STYLE_INITIAL_SCENE_PROMPT
-            bennet_active_for_compile = True
-            log_message("Compile: Applying BENNET_STYLE_INITIAL_SCENE_PROMPT.")
-            if not current_state.story_config.get("genre"): current_state.story_config['genre'] = "Historical Romance (Regency)"
-            if not current_state.story_config.get("setting"): current_state.story_config['setting'] = "Early 19th Century England"
-            if not current_state.story_config.get("tone"): current_state.story_config['tone'] = "Elegant, Introspective"
-            if not current_state.agents: _prime_bennet_context_if_new_story(current_state) 
-
-        snippet_instr_draft = _get_narration_snippet_instruction_for_chain(narration_details, "full story draft")
-        snippet_instr_refine = _get_narration_snippet_instruction_for_chain(narration_details, "story refinement")
-        characters_full_profiles_str = build_agent_context_for_prompt(current_state.agents)
-        
-        pipeline_input = {
-            "initial_scene_directive_draft": initial_scene_directive, 
-            "initial_scene_directive_refine": initial_scene_directive, 
-            "genre": current_state.story_config.get("genre"), 
-            "setting": current_state.story_config.get("setting"),
-            "tone": current_state.story_config.get("tone"),
-            "characters_summary": "Key characters: " + ", ".join([ag['name'] for ag in current_state.agents]) if current_state.agents else "As defined by genre and style directives.",
-            "narration_name_display": narration_details.get("name_display", "Default AI"),
-            "narration_tone": narration_details.get("tone", "Neutral"), 
-            "narration_inspired_by": narration_details.get("inspired_by", "Clarity"),
-            "narration_style_snippet_instruction": snippet_instr_draft, 
-            "narration_style_snippet_instruction_refine": snippet_instr_refine, 
-            "characters_full_profiles": characters_full_profiles_str,
-            # For refinement context, plot_outline will be passed by SequentialChain
-            "characters_full_profiles_for_refinement_context": characters_full_profiles_str 
-        }
+        pipeline_input, bennet_active_for_compile = _prepare_compile_pipeline_input(current_state)
         log_message(f"Invoking story_compilation_pipeline. Bennet active: {bennet_active_for_compile}")
-        story_pipeline = create_story_compilation_pipeline(api_key=xai_api_key, bennet_style_active=bennet_active_for_compile)
-        current_state.messages.append({"role": "assistant", "content": "Pipeline invoked. Generating Plot Outline..."})
+        story_pipeline = _chains().create_story_compilation_pipeline(api_key=xai_api_key, bennet_style_active=bennet_active_for_compile)
+        current_state.add_message("assistant", "Pipeline invoked. Generating Plot Outline...")
         response = story_pipeline.invoke(pipeline_input) 
         log_message("story_compilation_pipeline finished.")
-        plot_gen = response.get("plot_outline", "Plot not captured.") 
-        log_message(f"--- AGENT OUTPUT: PLOT OUTLINE ---\n{plot_gen}\n--- END PLOT OUTLINE ---")
-        current_state.messages.append({"role": "assistant", "content": f"Plot Outline Generated.\nNow generating story draft..."})
-        draft_gen = response.get("story_draft", "Draft not captured.")
-        log_message(f"--- AGENT OUTPUT: STORY DRAFT ---\n{draft_gen[:500]}...\n--- END STORY DRAFT (Preview) ---")
-        current_state.messages.append({"role": "assistant", "content": f"Initial Story Draft Generated.\nNow refining the story..."})
-        refined_story = response.get("refined_story")
-        log_message(f"--- AGENT OUTPUT: REFINED STORY ---\n{refined_story[:500]}...\n--- END REFINED STORY (Preview) ---")
-        if not refined_story: 
-            fallback_message = "Pipeline finished, but refined story missing."
-            if draft_gen and draft_gen != "Draft not captured.": fallback_message += " Providing draft:\n\n" + draft_gen
-            else: fallback_message += " No draft available."
-            current_state.messages.append({"role": "assistant", "content": fallback_message}); return current_state
-        current_state.messages.append({"role": "assistant", "content": "✨ Langchain story compilation complete! Here's your polished story:\n\n" + refined_story})
+        _append_compiled_story(current_state, response)
     except Exception as e: 
         log_message(f"ERROR in handle_compile_full_story: {e}")
         import traceback; print(f"Langchain compilation error: {e}\n{traceback.format_exc()}") 
-        current_state.messages.append({"role": "assistant", "content": f"Langchain compilation error: {e}"})
+        current_state.add_message("assistant", f"Langchain compilation error: {e}")
     log_message("Exiting handle_compile_full_story.")
     return current_state
 
+@_traced_handler
+def handle_compile_full_story_stream(current_state: StoryState):
+    """
+    Streaming variant of handle_compile_full_story. Yields (stage_output_key, text_chunk) tuples:
+    the plot outline first, then the draft, then the refined story. current_state is updated in place.
+    """
+    log_message("Entering handle_compile_full_story_stream.")
+    xai_api_key = current_state.ui_inputs.get("xai_api_key")
+    if not XAI_API_KEY_CONFIGURED or not xai_api_key:
+        log_message("API Key missing."); current_state.add_message("assistant", "Cannot compile: API Key missing.")
+        yield "error", "Cannot compile: API Key missing."; return
+
+    current_state.add_message("assistant", "Initiating Langchain multi-agent story compilation...")
+    stage_outputs = {}
+    started_at = time.perf_counter()
+    try:
+        pipeline_input, bennet_active_for_compile = _prepare_compile_pipeline_input(current_state)
+        log_message(f"Streaming story_compilation_pipeline. Bennet active: {bennet_active_for_compile}")
+        story_pipeline = _chains().create_story_compilation_pipeline(api_key=xai_api_key, bennet_style_active=bennet_active_for_compile)
+        current_state.add_message("assistant", "Pipeline invoked. Generating Plot Outline...")
+        for stage_key, chunk in _chains().stream_story_compilation(story_pipeline, pipeline_input):
+            if stage_key not in stage_outputs:
+                log_message(f"Compile stage '{stage_key}' time-to-first-token: {(time.perf_counter() - started_at) * 1000:.0f} ms")
+                stage_outputs[stage_key] = []
+            stage_outputs[stage_key].append(chunk)
+            yield stage_key, chunk
+        log_message(f"story_compilation_pipeline streamed in {time.perf_counter() - started_at:.1f}s.")
+        _append_compiled_story(current_state, {key: "".join(parts) for key, parts in stage_outputs.items()})
+    except Exception as e:
+        log_message(f"ERROR in handle_compile_full_story_stream: {e}")
+        import traceback; print(f"Langchain compilation error: {e}\n{traceback.format_exc()}")
+        current_state.add_message("assistant", f"Langchain compilation error: {e}")
+        yield "error", f"Langchain compilation error: {e}"
+    log_message("Exiting handle_compile_full_story_stream.")
+
+@_traced_handler
+def submit_compile_full_story_job(current_state: StoryState) -> tuple[StoryState, str | None]:
+    """Queues the plot->draft->refine pipeline on the background worker pool. Returns the job id (None on failure)."""
+    log_message("Entering submit_compile_full_story_job.")
+    xai_api_key = current_state.ui_inputs.get("xai_api_key")
+    if not XAI_API_KEY_CONFIGURED or not xai_api_key: log_message("API Key missing."); current_state.add_message("assistant", "Cannot compile: API Key missing."); return current_state, None
+
+    try:
+        # Inputs are captured now, on the script thread, so the worker never touches the live session state.
+        pipeline_input, bennet_active_for_compile = _prepare_compile_pipeline_input(current_state)
+        story_pipeline = _chains().create_story_compilation_pipeline(api_key=xai_api_key, bennet_style_active=bennet_active_for_compile)
+    except Exception as e:
+        log_message(f"ERROR in submit_compile_full_story_job: {e}")
+        current_state.add_message("assistant", f"Langchain compilation error: {e}"); return current_state, None
+
+    def run_compile_job(job):
+        stage_outputs = {}
+        for stage_key, chunk in _chains().stream_story_compilation(story_pipeline, pipeline_input):
+            if stage_key not in stage_outputs:
+                job.start_stage(stage_key)
+                stage_outputs[stage_key] = []
+            stage_outputs[stage_key].append(chunk)
+            job.record_progress(stage_key, len(chunk))
+            job.check_cancelled() # Stop streaming (and paying for tokens) as soon as a cancel is requested
+        return {key: "".join(parts) for key, parts in stage_outputs.items()}
+
+    job_id = get_compile_job_manager().submit(run_compile_job, stages=list(COMPILE_STAGE_LABELS.keys()), session_id=current_state.ui_inputs.get("session_id"))
+    current_state.add_message("assistant", "Initiating Langchain multi-agent story compilation in the background. You can keep this tab open to follow progress or cancel it.")
+    log_message(f"Exiting submit_compile_full_story_job. Job id: {job_id}")
+    return current_state, job_id
+
+def _append_compiled_novel(current_state: StoryState, result: dict):
+    chapters = result.get("chapters", [])
+    log_message(f"--- AGENT OUTPUT: BOOK OUTLINE ---\n{result.get('book_outline', '')}\n--- END BOOK OUTLINE ---")
+    current_state.add_message("assistant", f"Book outline generated: '{result.get('novel_title')}' in {len(chapters)} chapters.")
+    current_state.add_message("assistant", f"{COMPILED_NOVEL_MESSAGE_PREFIX} {result.get('word_count', 0)} words in {len(chapters)} chapters "
+                                            f"({result.get('elapsed_seconds')}s):\n\n" + result.get("novel", ""))
+
+@_traced_handler
+def submit_compile_novel_job(current_state: StoryState) -> tuple[StoryState, str | None]:
+    """Queues the long-form novel compile (outline -> chapter outlines -> parallel chapter drafts -> continuity) as a background job."""
+    log_message("Entering submit_compile_novel_job.")
+    xai_api_key = current_state.ui_inputs.get("xai_api_key")
+    if not XAI_API_KEY_CONFIGURED or not xai_api_key: log_message("API Key missing."); current_state.add_message("assistant", "Cannot compile: API Key missing."); return current_state, None
+
+    try:
+        pipeline_input, _ = _prepare_compile_pipeline_input(current_state) # Captured on the script thread, as for the story job
+        novel_compiler = lazy_import("core.novel_compiler")
+    except Exception as e:
+        log_message(f"ERROR in submit_compile_novel_job: {e}")
+        current_state.add_message("assistant", f"Novel compilation error: {e}"); return current_state, None
+
+    def run_novel_job(job):
+        return novel_compiler.compile_novel(xai_api_key, pipeline_input, job=job)
+
+    job_id = get_compile_job_manager().submit(run_novel_job, stages=list(NOVEL_COMPILE_STAGE_LABELS.keys()), session_id=current_state.ui_inputs.get("session_id"))
+    current_state.add_message("assistant", f"Initiating long-form novel compilation in the background ({novel_compiler.NOVEL_CHAPTER_COUNT} chapters of "
+                                            f"~{novel_compiler.NOVEL_CHAPTER_WORDS} words, drafted in parallel). You can follow progress or cancel it.")
+    log_message(f"Exiting submit_compile_novel_job. Job id: {job_id}")
+    return current_state, job_id
+
+def poll_compile_job(current_state: StoryState, job_id: str) -> tuple[StoryState, dict | None]:
+    """Returns the job status snapshot. When the job has finished, its outcome is appended to current_state's messages."""
+    job_status = get_compile_job_manager().get(job_id)
+    if job_status is None:
+        log_message(f"Compile job {job_id} not found (expired or server restarted).")
+        current_state.add_message("assistant", "The background compilation is no longer available. Please compile again.")
+        return current_state, None
+    if job_status["status"] == JOB_COMPLETED:
+        log_message(f"Compile job {job_id} completed in {job_status['elapsed_seconds']}s.")
+        if "novel" in (job_status["result"] or {}): _append_compiled_novel(current_state, job_status["result"])
+        else: _append_compiled_story(current_state, job_status["result"] or {})
+    elif job_status["status"] == JOB_FAILED:
+        current_state.add_message("assistant", f"Langchain compilation error: {job_status['error']}")
+    elif job_status["status"] == JOB_CANCELLED:
+        current_state.add_message("assistant", "🛑 Story compilation cancelled.")
+    return current_state, job_status
+
+def cancel_compile_job(job_id: str) -> bool:
+    log_message(f"Cancel requested for compile job {job_id}.")
+    return get_compile_job_manager().cancel(job_id)
+
+@_traced_handler
 def handle_add_character_chat(current_state: StoryState, user_input: str) -> tuple[StoryState, bool]: # ... same structure as #31
     log_message(f"Entering handle_add_character_chat. User input: '{user_input}'")
     try:
@@ -362,26 +752,44 @@ def handle_add_character_chat(current_state: StoryState, user_input: str) -> tup
         desc = describe_agent(agent)
         log_message(f"Character '{name}' added via chat. Description: '{desc}'")
         user_confirmation = f"✅ Character '{name}' added via chat."
-        current_state.messages.append({"role": "assistant", "content": user_confirmation})
+        current_state.add_message("assistant", user_confirmation)
         directive = f"System Update: Character '{name}' ({role or 'character'}) added via chat. Desc: {desc}. Acknowledge & continue setup."
         current_state = _call_langchain_slide_chain(current_state, latest_user_input_override=directive)
         log_message("Exiting handle_add_character_chat (success).")
         return current_state, True
     except Exception as e:
         log_message(f"ERROR in handle_add_character_chat: {e}")
-        current_state.messages.append({"role": "assistant", "content": f"⚠️ Error processing 'add character' command: {e}"}); return current_state, False
+        current_state.add_message("assistant", f"⚠️ Error processing 'add character' command: {e}"); return current_state, False
 
 
-def handle_regular_chat_input(current_state: StoryState, user_text: str) -> StoryState: # ... same structure as #31
-    log_message(f"Entering handle_regular_chat_input. User text: '{user_text}'") # user_text already in messages via app.py
+def _ensure_narration_style_current(current_state: StoryState):
     if "narration_style" not in current_state.story_config or \
        not current_state.story_config["narration_style"] or \
        (not current_state.narration_voice_id.startswith("custom_") and \
         current_state.story_config["narration_style"].get("name_display") != get_active_voice_description(current_state.narration_voice_id).get("name_display")):
          current_state.story_config["narration_style"] = get_active_voice_description(current_state.narration_voice_id)
          log_message(f"Regular chat: Ensured narration style is '{current_state.story_config['narration_style'].get('name_display')}'.")
-    
+
+@_traced_handler
+def handle_regular_chat_input(current_state: StoryState, user_text: str) -> StoryState: # ... same structure as #31
+    log_message(f"Entering handle_regular_chat_input. User text: '{user_text}'") # user_text already in messages via app.py
+    _ensure_narration_style_current(current_state)
     current_state.last_story_slide_text = None 
-    current_state = _call_langchain_slide_chain(current_state) 
+    speculative_slide = _take_speculative_slide(current_state, user_text)
+    if speculative_slide: _apply_slide_response(current_state, speculative_slide)
+    else: current_state = _call_langchain_slide_chain(current_state) 
     log_message("Exiting handle_regular_chat_input.")
-    return current_state
\ No newline at end of file
+    return current_state
+
+@_traced_handler
+def handle_regular_chat_input_stream(current_state: StoryState, user_text: str):
+    """Streaming variant of handle_regular_chat_input. Yields text chunks; current_state is updated in place."""
+    log_message(f"Entering handle_regular_chat_input_stream. User text: '{user_text}'")
+    _ensure_narration_style_current(current_state)
+    current_state.last_story_slide_text = None 
+    speculative_slide = _take_speculative_slide(current_state, user_text)
+    if speculative_slide:
+        _apply_slide_response(current_state, speculative_slide)
+        yield speculative_slide
+    else: yield from _stream_langchain_slide_chain(current_state)
+    log_message("Exiting handle_regular_chat_input_stream.")
\ No newline at end of file
@@ -0,0 +1,192 @@
+# core/story_state.py
+# Compact per-session state. Long-running Streamlit sessions keep their whole transcript in memory,
+# so messages are __slots__ records (no per-instance __dict__) with interned role strings, and the
+# values derived from a message (is it story content, where the story text lies in it, its token count)
+# are computed at most once; the story text itself is sliced from the content on demand, not stored.
+# Assistant messages are classified when they are appended. Records stay dict-compatible for reads: msg['role'], msg.get('content').
+import hashlib
+import json
+import sys
+
+from .chat_history import estimate_tokens, HistoryWindow
+from .renarration_cache import RenarrationCache
+from .speculation import SlideSpeculator
+from .story_summary import StorySummaryMemory
+from .utils import story_content_span
+
+_NOT_COMPUTED = object()
+
+
+class MessageRecord:
+    __slots__ = ("role", "content", "_story_start", "_story_end", "_token_count")
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(role) # A handful of distinct roles shared by every message
+        self.content = content
+        self._story_start = _NOT_COMPUTED # None once classified as not story content
+        self._story_end = None
+        self._token_count = None
+
+    @classmethod
+    def coerce(cls, message) -> "MessageRecord":
+        if isinstance(message, cls): return message
+        return cls(message["role"], message["content"])
+
+    # --- Dict-compatible reads ---
+    def __getitem__(self, key: str):
+        if key == "role": return self.role
+        if key == "content": return self.content
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        return self[key] if key in ("role", "content") else default
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("role", "content")
+
+    def __repr__(self) -> str:
+        return f"MessageRecord(role={self.role!r}, content={self.content[:40]!r})"
+
+    # --- Cached derived fields ---
+    def _classify(self):
+        self._story_start, self._story_end = story_content_span(self.content) or (None, None)
+
+    @property
+    def is_story(self) -> bool:
+        if self._story_start is _NOT_COMPUTED: self._classify()
+        return self._story_start is not None
+
+    @property
+    def story_text(self) -> str | None:
+        if self._story_start is _NOT_COMPUTED: self._classify()
+        return self.content[self._story_start:self._story_end] if self._story_start is not None else None
+
+    @property
+    def token_count(self) -> int:
+        if self._token_count is None: self._token_count = estimate_tokens(self.content)
+        return self._token_count
+
+    def to_dict(self) -> dict:
+        return {"role": self.role, "content": self.content}
+
+
+class MessageList(list):
+    """
+    List of MessageRecords. Plain {'role', 'content'} dicts are converted on the way in, and assistant
+    messages are classified as they are added, so story_count (assistant story messages) is always current.
+    Every list mutator that adds or drops messages updates the count.
+    """
+    __slots__ = ("story_count",)
+
+    def __init__(self, messages=()):
+        self.story_count = 0
+        super().__init__(self._track(m) for m in messages)
+
+    @staticmethod
+    def _counts(record: MessageRecord) -> bool:
+        return record.role == "assistant" and record.is_story
+
+    def _track(self, message) -> MessageRecord:
+        record = MessageRecord.coerce(message)
+        if self._counts(record): self.story_count += 1
+        return record
+
+    def _untrack(self, records):
+        self.story_count -= sum(1 for record in records if self._counts(record))
+
+    def append(self, message):
+        super().append(self._track(message))
+
+    def extend(self, messages):
+        super().extend(self._track(m) for m in messages)
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def insert(self, index, message):
+        super().insert(index, self._track(message))
+
+    def __setitem__(self, index, value):
+        replaced = self[index] if isinstance(index, slice) else [self[index]]
+        if isinstance(index, slice): value = [MessageRecord.coerce(m) for m in value]
+        else: value = MessageRecord.coerce(value)
+        super().__setitem__(index, value) # May raise (e.g. extended slice of the wrong length); count only once it is done
+        self._untrack(replaced)
+        for record in (value if isinstance(index, slice) else [value]): self._track(record)
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else [self[index]]
+        super().__delitem__(index)
+        self._untrack(removed)
+
+    def pop(self, index=-1) -> MessageRecord:
+        record = super().pop(index)
+        self._untrack([record])
+        return record
+
+    def remove(self, message):
+        self.pop(self.index(message))
+
+    def clear(self):
+        super().clear()
+        self.story_count = 0
+
+    def __imul__(self, times):
+        super().__imul__(times)
+        self.story_count = sum(1 for record in self if self._counts(record))
+        return self
+
+
+class StoryState:
+    __slots__ = ("messages", "agents", "story_config", "narration_voice_id", "last_story_slide_text", "ui_inputs",
+                 "history_window", "summary_memory", "journal", "speculation", "renarration_cache")
+
+    def __init__(self, messages, agents, story_config, narration_voice_id, last_story_slide_text, ui_inputs=None):
+        self.messages = messages if isinstance(messages, MessageList) else MessageList(messages)
+        # Taken over, not copied: callers hand in freshly built containers.
+        self.agents = agents if isinstance(agents, list) else list(agents)
+        self.story_config = story_config if isinstance(story_config, dict) else dict(story_config)
+        self.narration_voice_id = narration_voice_id; self.last_story_slide_text = last_story_slide_text
+        self.ui_inputs = ui_inputs if ui_inputs else {}
+        self.history_window = HistoryWindow() # Synced from self.messages on each slide turn
+        self.summary_memory = StorySummaryMemory() # Synopsis of the story slides evicted from history_window
+        self.journal = None # core.session_store.SessionJournal, once the session is persisted
+        self.speculation = SlideSpeculator() # Pre-generated next slide, if speculative mode is on (not persisted)
+        self.renarration_cache = RenarrationCache() # Last slide re-narrated in each voice seen (not persisted)
+
+    @classmethod
+    def from_dict(cls, state_dict: dict, ui_inputs: dict = None) -> "StoryState":
+        """Rebuilds a state saved with to_dict(), e.g. when resuming a persisted session."""
+        state = cls(state_dict["messages"], state_dict["agents"], state_dict["story_config"],
+                    state_dict.get("narration_voice_id", "DEFAULT"), state_dict.get("last_story_slide_text"), ui_inputs)
+        state.summary_memory.summary = state_dict.get("story_summary") or ""
+        # Slides already outside the history window are covered by the restored synopsis; don't summarize them again.
+        state.history_window.sync(state.messages)
+        state.history_window.pop_evicted_indices()
+        return state
+
+    def add_message(self, role: str, content: str) -> MessageRecord:
+        message = MessageRecord(role, content)
+        self.messages.append(message)
+        return message
+
+    def fingerprint(self, exclude_trailing_user_message: bool = False) -> str:
+        """Version hash of what generation depends on: the transcript, narration voice, story config and agents."""
+        messages = self.messages
+        if exclude_trailing_user_message and messages and messages[-1].role == "user": messages = messages[:-1]
+        digest = hashlib.sha256()
+        digest.update(f"{len(messages)}|{self.narration_voice_id}|".encode("utf-8"))
+        for message in messages[-2:]: digest.update(f"{message.role}:{message.content}|".encode("utf-8")) # Messages are append-only
+        digest.update(json.dumps([self.story_config, self.agents], sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    def to_dict(self):
+        return {
+            "messages": [m.to_dict() for m in self.messages], "agents": self.agents, "story_config": self.story_config,
+            "narration_voice_id": self.narration_voice_id, "last_story_slide_text": self.last_story_slide_text,
+            "story_summary": self.summary_memory.get_summary(),
+            "new_char_name_val": self.ui_inputs.get("new_char_name_val", ""),
+            "new_char_role_val": self.ui_inputs.get("new_char_role_val", ""),
+            "custom_author_name_val": self.ui_inputs.get("custom_author_name_val", "")
+        }
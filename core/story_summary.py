@@ -0,0 +1,105 @@
+# core/story_summary.py
+# Rolling summary memory for long sessions.
+# Story slides that age out of the token-budgeted history window (core/chat_history.py) are
+# folded into a compact running synopsis by a summary chain on a background worker, after the
+# slide has been delivered, so the slide prompt stays nearly constant in size however long the story gets.
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .chat_history import estimate_tokens, clip_text
+from .tracing import traced
+
+STORY_SUMMARY_WORKERS = int(os.getenv("STORY_SUMMARY_WORKERS", "4"))
+STORY_SUMMARY_MAX_WORDS = int(os.getenv("STORY_SUMMARY_MAX_WORDS", "350"))
+STORY_SUMMARY_MAX_SEGMENT_TOKENS = int(os.getenv("STORY_SUMMARY_MAX_SEGMENT_TOKENS", "800"))
+# Segments to collect before calling the summary chain; larger batches mean fewer (but later) updates.
+STORY_SUMMARY_BATCH_SEGMENTS = int(os.getenv("STORY_SUMMARY_BATCH_SEGMENTS", "1"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=STORY_SUMMARY_WORKERS, thread_name_prefix="story-summary")
+    return _executor
+
+
+class StorySummaryMemory:
+    """Running synopsis of the story slides that are no longer in the chat-history window."""
+    def __init__(self):
+        self.summary = ""
+        self.summarized_segments = 0
+        self.updates = 0
+        self.last_update_seconds = None
+        self.last_error = None
+        self._pending_segments = []
+        self._future = None
+        self._lock = threading.Lock()
+
+    def add_segments(self, segments: list[str]):
+        segments = [clip_text(segment, estimate_tokens(segment), STORY_SUMMARY_MAX_SEGMENT_TOKENS) for segment in segments if segment]
+        if not segments: return
+        with self._lock:
+            self._pending_segments.extend(segments)
+
+    def schedule_update(self, api_key: str) -> bool:
+        """Starts a background fold of the pending segments unless one is already running (it picks them up)."""
+        with self._lock:
+            if len(self._pending_segments) < STORY_SUMMARY_BATCH_SEGMENTS or not self._pending_segments: return False
+            if self._future is not None and not self._future.done(): return False
+            self._future = _get_executor().submit(contextvars.copy_context().run, self._run_updates, api_key) # Spans join the submitting trace
+        return True
+
+    @traced("story_summary_update", kind="job")
+    def _run_updates(self, api_key: str):
+        from .langchain_chains import create_story_summary_chain # Deferred: langchain_chains imports the LLM stack
+        while True:
+            with self._lock:
+                segments = list(self._pending_segments)
+                current_summary = self.summary
+            if not segments: return
+            started_at = time.perf_counter()
+            try:
+                response = create_story_summary_chain(api_key=api_key).invoke({
+                    "current_summary": current_summary or "(empty)",
+                    "new_story_segments": "\n\n".join(f"[Segment {i + 1}]\n{segment}" for i, segment in enumerate(segments)),
+                    "max_words": STORY_SUMMARY_MAX_WORDS,
+                })
+                new_summary = (response.get("story_summary") or "").strip()
+                if not new_summary: raise ValueError("Summary chain returned an empty synopsis.")
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Story Summary Error: Folding {len(segments)} segments: {e}")
+                return # Segments stay pending and are retried with the next update
+            with self._lock:
+                self.summary = new_summary
+                del self._pending_segments[:len(segments)]
+                self.summarized_segments += len(segments)
+                self.updates += 1
+                self.last_update_seconds = round(time.perf_counter() - started_at, 2)
+                self.last_error = None
+            print(f"Story Summary: Folded {len(segments)} segments in {self.last_update_seconds}s "
+                  f"(synopsis: {len(new_summary.split())} words, {self.summarized_segments} segments total).")
+
+    def get_summary(self) -> str:
+        with self._lock:
+            return self.summary
+
+    def wait(self, timeout: float = None):
+        """Blocks until the running update (if any) finishes. For scripts and shutdown."""
+        future = self._future
+        if future is not None: future.result(timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"summary_words": len(self.summary.split()), "summarized_segments": self.summarized_segments,
+                    "pending_segments": len(self._pending_segments), "updates": self.updates,
+                    "updating": self._future is not None and not self._future.done(),
+                    "last_update_seconds": self.last_update_seconds, "last_error": self.last_error}
@@ -0,0 +1,108 @@
+# core/style_library.py
+# Shared on-disk library of emulated author styles.
+# Generated author snippets are stored once (one JSON file per author, keyed by the
+# normalized author name) and reused by every session instead of calling the LLM again.
+import json
+import os
+import threading
+import time
+import unicodedata
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+STYLE_LIBRARY_DIR = os.getenv("STYLE_LIBRARY_DIR", os.path.join(PROJECT_ROOT, "data", "style_library"))
+CUSTOM_STYLE_ID_PREFIX = "custom_"
+
+_library_lock = threading.Lock()
+
+
+def normalize_author_name(author_name: str) -> str:
+    """
+    '  Jane   Austen ' / 'jane austen' / 'Jane Austén' -> 'jane_austen'. Accents are dropped, but letters
+    without an ASCII form are kept ('Лев Толстой' -> 'лев_толстой', '村上春樹' -> '村上春樹').
+    """
+    folded = "".join(_fold_name_char(char) for char in unicodedata.normalize("NFC", author_name or "").casefold())
+    return "_".join(folded.split())
+
+def _fold_name_char(char: str) -> str:
+    """'é' -> 'e'; letters with no ASCII base ('й', '村') and combining vowel signs are kept; anything else separates words."""
+    if not (char.isalnum() or unicodedata.category(char).startswith("M")): return " "
+    return unicodedata.normalize("NFKD", char).encode("ascii", "ignore").decode("ascii") or char
+
+def author_style_id(author_name: str) -> str:
+    return f"{CUSTOM_STYLE_ID_PREFIX}{normalize_author_name(author_name)}"
+
+def _entry_path(normalized_name: str) -> str:
+    return os.path.join(STYLE_LIBRARY_DIR, f"{normalized_name}.json")
+
+def _read_entry(normalized_name: str) -> dict | None:
+    path = _entry_path(normalized_name)
+    if not normalized_name or not os.path.exists(path): return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Style Library Error: Reading '{path}': {e}")
+        return None
+
+def _write_entry(entry: dict):
+    os.makedirs(STYLE_LIBRARY_DIR, exist_ok=True)
+    path = _entry_path(entry["normalized_name"])
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path) # Atomic: concurrent readers never see a half-written file
+
+
+def get_author_style(author_name: str) -> dict | None:
+    return _read_entry(normalize_author_name(author_name))
+
+def get_author_style_by_id(style_id: str) -> dict | None:
+    if not style_id or not style_id.startswith(CUSTOM_STYLE_ID_PREFIX): return None
+    return _read_entry(style_id[len(CUSTOM_STYLE_ID_PREFIX):])
+
+def save_author_style(author_name: str, style_snippet: str, model_name: str = None) -> dict:
+    normalized_name = normalize_author_name(author_name)
+    if not normalized_name: raise ValueError("Author name is empty after normalization.")
+    with _library_lock:
+        existing = _read_entry(normalized_name) or {}
+        now = time.time()
+        entry = {
+            "style_id": author_style_id(author_name),
+            "normalized_name": normalized_name,
+            "author_name": author_name.strip(),
+            "style_snippet": style_snippet,
+            "model_name": model_name,
+            "created_at": existing.get("created_at", now),
+            "updated_at": now,
+            "uses": existing.get("uses", 0) + 1,
+        }
+        _write_entry(entry)
+    return entry
+
+def record_author_style_use(author_name: str) -> dict | None:
+    with _library_lock:
+        entry = _read_entry(normalize_author_name(author_name))
+        if entry is None: return None
+        entry["uses"] = entry.get("uses", 0) + 1
+        try: _write_entry(entry)
+        except Exception as e: print(f"Style Library Warning: Could not record use for '{author_name}': {e}")
+    return entry
+
+def list_author_styles(min_uses: int = 0) -> list[dict]:
+    """All stored author styles, most used first."""
+    if not os.path.isdir(STYLE_LIBRARY_DIR): return []
+    entries = []
+    for file_name in os.listdir(STYLE_LIBRARY_DIR):
+        if not file_name.endswith(".json"): continue
+        entry = _read_entry(file_name[:-len(".json")])
+        if entry and entry.get("uses", 0) >= min_uses: entries.append(entry)
+    return sorted(entries, key=lambda e: (-e.get("uses", 0), e.get("author_name", "")))
+
+def build_author_voice_description(entry: dict) -> dict:
+    author_name = entry["author_name"]
+    return {
+        "name_display": f"{author_name} (Dynamically Emulated)",
+        "tone": f"Emulating style of {author_name}.",
+        "inspired_by": f"Works of {author_name} & generated snippet.",
+        "source_text_snippet": entry["style_snippet"],
+    }
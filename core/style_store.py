@@ -0,0 +1,267 @@
+# core/style_store.py
+# Pluggable storage backends for narration style vectors.
+# - PineconeStyleStore: the hosted 'narration-styles' index.
+# - LocalStyleStore: a memory-mapped float32 matrix plus a JSON metadata sidecar on disk,
+#   searched with exact, vectorized cosine similarity. Used for offline deployments and
+#   cold starts without any network I/O (see scripts/style_store_snapshot.py).
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+STYLE_STORE_LOCAL_DIR = os.getenv("STYLE_STORE_LOCAL_DIR", os.path.join(PROJECT_ROOT, "data", "style_store"))
+PINECONE_BATCH_SIZE = 100
+# Styles are stored as one pooled centroid (id = style id) plus per-chunk vectors ('<style id>#chunk-NNN').
+CHUNK_ID_SEPARATOR = "#chunk-"
+STYLE_QUERY_OVERSAMPLE = 4 # Raw matches fetched per requested style, so one style's chunks can't crowd out others
+
+
+class StyleStore(ABC):
+    """
+    Common interface. Records are dicts: {"id": str, "values": list[float], "metadata": dict}.
+    Query matches are dicts: {"id": str, "score": float, "metadata": dict}.
+    """
+    backend_name = "base"
+    remote = False # Network-backed: calls go through the style backend's circuit breaker (core/narration.py)
+
+    @abstractmethod
+    def fetch(self, ids: list) -> dict: ...
+    @abstractmethod
+    def query(self, vector: list, top_k: int = 5) -> list: ...
+    @abstractmethod
+    def upsert(self, vectors: list) -> int: ...
+    @abstractmethod
+    def delete(self, ids: list) -> int: ...
+    @abstractmethod
+    def list_ids(self) -> list: ...
+    def describe(self) -> dict: return {"backend": self.backend_name}
+
+
+class PineconeStyleStore(StyleStore):
+    backend_name = "pinecone"
+    remote = True
+
+    def __init__(self, index, index_name: str = None):
+        self.index = index
+        self.index_name = index_name
+
+    def fetch(self, ids: list) -> dict:
+        fetch_response = self.index.fetch(ids=list(ids))
+        fetched_vectors = (fetch_response.vectors if fetch_response else None) or {}
+        return {
+            vector_id: {
+                "id": vector_id,
+                "values": list(getattr(vector_object, "values", None) or []),
+                "metadata": getattr(vector_object, "metadata", None) or {},
+            }
+            for vector_id, vector_object in fetched_vectors.items()
+        }
+
+    def query(self, vector: list, top_k: int = 5) -> list:
+        query_response = self.index.query(vector=list(vector), top_k=top_k, include_metadata=True)
+        return [{"id": m.id, "score": float(m.score), "metadata": m.metadata or {}} for m in (query_response.matches or [])]
+
+    def upsert(self, vectors: list) -> int:
+        for i in range(0, len(vectors), PINECONE_BATCH_SIZE):
+            self.index.upsert(vectors=vectors[i:i + PINECONE_BATCH_SIZE])
+        return len(vectors)
+
+    def delete(self, ids: list) -> int:
+        ids = list(ids)
+        for i in range(0, len(ids), PINECONE_BATCH_SIZE):
+            self.index.delete(ids=ids[i:i + PINECONE_BATCH_SIZE])
+        return len(ids)
+
+    def list_ids(self) -> list:
+        all_ids = []
+        for id_page in self.index.list(): # Paginated id listing (serverless indexes)
+            all_ids.extend(id_page)
+        return all_ids
+
+    def describe(self) -> dict:
+        return {"backend": self.backend_name, "index_name": self.index_name}
+
+
+class LocalStyleStore(StyleStore):
+    backend_name = "local"
+    VECTORS_FILE = "vectors.f32" # Written by snapshots from before vector files were versioned
+    METADATA_FILE = "metadata.json"
+    LOAD_ATTEMPTS = 3
+
+    def __init__(self, directory: str = STYLE_STORE_LOCAL_DIR, dimension: int = None, create: bool = False):
+        """
+        Opens the snapshot in `directory`. When none exists yet, an empty store is started if `dimension`
+        is given or `create` is True (the dimension is then taken from the first upserted vector).
+        """
+        self.directory = directory
+        self.dimension = dimension
+        self.create = create
+        self._lock = threading.RLock()
+        self._ids = []
+        self._metadata = []
+        self._row_by_id = {}
+        self._matrix = None
+        self._norms = None
+        self._load()
+
+    @classmethod
+    def exists(cls, directory: str = STYLE_STORE_LOCAL_DIR) -> bool:
+        return os.path.exists(os.path.join(directory, cls.METADATA_FILE))
+
+    def _load(self):
+        """
+        Opens the snapshot the metadata sidecar points to. Each write puts the vectors in a new file and
+        then swaps the sidecar, so a sidecar always names a matrix with its own rows. A reader that races
+        a writer (the sidecar it read already names a removed matrix) reads the sidecar again.
+        """
+        metadata_path = os.path.join(self.directory, self.METADATA_FILE)
+        for attempt in range(self.LOAD_ATTEMPTS):
+            if not os.path.exists(metadata_path):
+                if self.dimension is None and not self.create:
+                    raise FileNotFoundError(f"No local style store at '{self.directory}'.")
+                self._set_contents([], [], np.zeros((0, self.dimension or 0), dtype=np.float32))
+                return
+            with open(metadata_path, "r", encoding="utf-8") as f:
+                sidecar = json.load(f)
+            ids, dimension = sidecar["ids"], int(sidecar["dimension"])
+            if not ids:
+                matrix = np.zeros((0, dimension), dtype=np.float32); break
+            vectors_path = os.path.join(self.directory, sidecar.get("vectors_file", self.VECTORS_FILE))
+            expected_bytes = len(ids) * dimension * 4
+            try:
+                actual_bytes = os.path.getsize(vectors_path)
+                if actual_bytes == expected_bytes:
+                    matrix = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(len(ids), dimension)); break
+            except FileNotFoundError: actual_bytes = -1 # Missing, or removed by a writer meanwhile
+            if attempt == self.LOAD_ATTEMPTS - 1:
+                raise ValueError(f"Local style store '{self.directory}' is inconsistent: expected {expected_bytes} vector bytes, found {actual_bytes}.")
+            time.sleep(0.05)
+        self.dimension = dimension
+        self._set_contents(ids, sidecar["metadata"], matrix)
+
+    def _set_contents(self, ids: list, metadata: list, matrix):
+        self._ids = list(ids)
+        self._metadata = list(metadata)
+        self._row_by_id = {vector_id: row for row, vector_id in enumerate(self._ids)}
+        self._matrix = matrix
+        self._norms = None
+
+    def _get_norms(self):
+        if self._norms is None:
+            norms = np.linalg.norm(self._matrix, axis=1)
+            norms[norms == 0] = 1.0
+            self._norms = norms
+        return self._norms
+
+    def _write(self, ids: list, metadata: list, matrix):
+        os.makedirs(self.directory, exist_ok=True)
+        metadata_path = os.path.join(self.directory, self.METADATA_FILE)
+        # A new vectors file per write; replacing the sidecar that names it is the single switch to the new version.
+        vectors_file = f"vectors-{uuid.uuid4().hex[:12]}.f32"
+        np.ascontiguousarray(matrix, dtype=np.float32).tofile(os.path.join(self.directory, vectors_file))
+        with open(f"{metadata_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"dimension": self.dimension, "metric": "cosine", "ids": ids, "metadata": metadata, "vectors_file": vectors_file,
+                       "updated_at": time.time()}, f, ensure_ascii=False)
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+        for name in os.listdir(self.directory): # Superseded versions; open memory maps of them stay valid
+            if name.endswith(".f32") and name.startswith("vectors") and name != vectors_file:
+                try: os.remove(os.path.join(self.directory, name))
+                except OSError: pass
+        self._load() # Re-open as a fresh read-only memmap
+
+    def fetch(self, ids: list) -> dict:
+        with self._lock:
+            return {
+                vector_id: {"id": vector_id, "values": self._matrix[self._row_by_id[vector_id]].tolist(), "metadata": self._metadata[self._row_by_id[vector_id]]}
+                for vector_id in ids if vector_id in self._row_by_id
+            }
+
+    def query(self, vector: list, top_k: int = 5) -> list:
+        with self._lock:
+            if not self._ids: return []
+            query_vector = np.asarray(vector, dtype=np.float32)
+            query_norm = float(np.linalg.norm(query_vector)) or 1.0
+            scores = (self._matrix @ query_vector) / (self._get_norms() * query_norm)
+            k = min(top_k, len(self._ids))
+            top_rows = np.argpartition(-scores, k - 1)[:k]
+            top_rows = top_rows[np.argsort(-scores[top_rows])]
+            return [{"id": self._ids[row], "score": float(scores[row]), "metadata": self._metadata[row]} for row in top_rows]
+
+    def upsert(self, vectors: list) -> int:
+        if not vectors: return 0
+        with self._lock:
+            if self.dimension is None: self.dimension = len(vectors[0]["values"])
+            ids, metadata = list(self._ids), list(self._metadata)
+            rows = [np.asarray(self._matrix[i], dtype=np.float32) for i in range(len(ids))]
+            row_by_id = dict(self._row_by_id)
+            for vector in vectors:
+                values = np.asarray(vector["values"], dtype=np.float32)
+                if values.shape != (self.dimension,):
+                    raise ValueError(f"Vector '{vector['id']}' has dimension {values.shape}, expected {self.dimension}.")
+                if vector["id"] in row_by_id:
+                    row = row_by_id[vector["id"]]
+                    rows[row], metadata[row] = values, vector.get("metadata") or {}
+                else:
+                    row_by_id[vector["id"]] = len(ids)
+                    ids.append(vector["id"]); rows.append(values); metadata.append(vector.get("metadata") or {})
+            self._write(ids, metadata, np.vstack(rows))
+        return len(vectors)
+
+    def delete(self, ids: list) -> int:
+        with self._lock:
+            ids_to_delete = set(ids) & set(self._row_by_id)
+            if not ids_to_delete: return 0
+            keep_rows = [row for row, vector_id in enumerate(self._ids) if vector_id not in ids_to_delete]
+            matrix = np.asarray(self._matrix[keep_rows], dtype=np.float32) if keep_rows else np.zeros((0, self.dimension), dtype=np.float32)
+            self._write([self._ids[row] for row in keep_rows], [self._metadata[row] for row in keep_rows], matrix)
+        return len(ids_to_delete)
+
+    def list_ids(self) -> list:
+        with self._lock:
+            return list(self._ids)
+
+    def describe(self) -> dict:
+        return {"backend": self.backend_name, "directory": self.directory, "vectors": len(self._ids), "dimension": self.dimension}
+
+
+def copy_style_store(source: StyleStore, target: StyleStore, batch_size: int = PINECONE_BATCH_SIZE) -> int:
+    """Copies every vector (values + metadata) from source to target. Used for snapshot export/import."""
+    all_ids = source.list_ids()
+    records = []
+    for i in range(0, len(all_ids), batch_size):
+        fetched = source.fetch(all_ids[i:i + batch_size])
+        records.extend(fetched[vector_id] for vector_id in all_ids[i:i + batch_size] if vector_id in fetched)
+    return target.upsert(records) # One write: the local store rewrites its files on every upsert
+
+
+def chunk_vector_id(style_id: str, chunk_index: int) -> str:
+    return f"{style_id}{CHUNK_ID_SEPARATOR}{chunk_index:03d}"
+
+def style_id_for_match(match: dict) -> str:
+    return (match.get("metadata") or {}).get("style_id") or match["id"].split(CHUNK_ID_SEPARATOR, 1)[0]
+
+def query_styles(style_store: StyleStore, vector: list, top_k: int = 5) -> list:
+    """
+    Style-level similarity search: raw chunk and centroid matches are grouped by style id, and each
+    style is scored by its best-matching vector. Returns [{"style_id", "score", "matched_vectors", "metadata"}].
+    """
+    raw_matches = style_store.query(vector, top_k=top_k * STYLE_QUERY_OVERSAMPLE)
+    styles = {}
+    for match in raw_matches:
+        style_id = style_id_for_match(match)
+        style = styles.setdefault(style_id, {"style_id": style_id, "score": match["score"], "matched_vectors": 0, "metadata": None})
+        style["score"] = max(style["score"], match["score"])
+        style["matched_vectors"] += 1
+        if match["id"] == style_id: style["metadata"] = match["metadata"] # Centroid carries the full style metadata
+    ranked = sorted(styles.values(), key=lambda s: -s["score"])[:top_k]
+    missing_metadata = [s["style_id"] for s in ranked if s["metadata"] is None]
+    if missing_metadata:
+        centroids = style_store.fetch(missing_metadata)
+        for style in ranked:
+            if style["metadata"] is None: style["metadata"] = centroids.get(style["style_id"], {}).get("metadata", {})
+    return ranked
@@ -0,0 +1,195 @@
+# core/tracing.py
+# Lightweight span tracing.
+# A span times one unit of work (a story_manager handler, a chain stage, an LLM call, a style backend
+# fetch, an embedding) and carries the session id, token counts and the error, if any. The current
+# span lives in a contextvar, so spans opened inside it (also on LangChain's batch worker threads,
+# which copy the context) become its children and share its trace id. Token counts recorded on a
+# span are added to its open ancestors, so a handler span shows what the whole turn cost.
+# Finished spans go to an in-memory ring buffer (for the in-app trace panel) and, if TRACE_FILE is
+# set, to a JSONL file, one span per line. The file is rotated to '<TRACE_FILE>.1' once it reaches
+# TRACE_FILE_MAX_BYTES, so at most two files' worth of spans are kept on disk.
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TRACING_ENABLED = os.getenv("TRACING", "1").lower() not in ("0", "false", "no")
+TRACE_FILE = os.getenv("TRACE_FILE", "") # e.g. data/traces.jsonl; unset or "" keeps spans in memory only
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2000")) # Finished spans kept in memory
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "session_id", "started_at", "duration_ms",
+                 "attributes", "status", "error", "_parent", "_started")
+
+    def __init__(self, name: str, kind: str, parent: "Span" = None, session_id: str = None, attributes: dict = None):
+        self.name, self.kind = name, kind
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.session_id = session_id or (parent.session_id if parent is not None else None)
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status, self.error = "ok", None
+        self._parent = parent
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_tokens(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        """Adds to this span's token counts and to those of its ancestors that are still open."""
+        with _tokens_lock:
+            span = self
+            while span is not None:
+                if span is not self and span.duration_ms is not None: break
+                span.attributes["prompt_tokens"] = span.attributes.get("prompt_tokens", 0) + prompt_tokens
+                span.attributes["completion_tokens"] = span.attributes.get("completion_tokens", 0) + completion_tokens
+                span = span._parent
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id, "session_id": self.session_id,
+                "name": self.name, "kind": self.kind, "started_at": round(self.started_at, 6), "duration_ms": self.duration_ms,
+                "status": self.status, "error": self.error, "attributes": self.attributes}
+
+
+class _NoopSpan:
+    """Returned while tracing is disabled, so call sites don't need to check."""
+    def set(self, **attributes): pass
+    def add_tokens(self, prompt_tokens: int = 0, completion_tokens: int = 0): pass
+
+_NOOP_SPAN = _NoopSpan()
+_tokens_lock = threading.Lock()
+
+
+class Tracer:
+    def __init__(self, enabled: bool = TRACING_ENABLED, trace_file: str = TRACE_FILE, buffer_size: int = TRACE_BUFFER_SIZE,
+                 max_file_bytes: int = TRACE_FILE_MAX_BYTES):
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+        self._finished = deque(maxlen=buffer_size)
+        self._file = None
+        self._file_bytes = 0
+        self._export_failed = False
+        self._stats = {"spans": 0, "errors": 0, "exported": 0, "rotations": 0}
+
+    def start_span(self, name: str, kind: str = "internal", parent: Span = None, session_id: str = None, **attributes):
+        """Opens a span without making it current (see span() for the usual form). parent defaults to the current span."""
+        if not self.enabled: return _NOOP_SPAN
+        return Span(name, kind, parent if parent is not None else _current_span.get(), session_id, attributes)
+
+    def finish_span(self, span, error: BaseException = None):
+        if span is _NOOP_SPAN or span.duration_ms is not None: return
+        span.duration_ms = round((time.perf_counter() - span._started) * 1000, 2)
+        if error is not None: span.status, span.error = "error", f"{type(error).__name__}: {error}"
+        record = span.to_dict()
+        with self._lock:
+            self._finished.append(record)
+            self._stats["spans"] += 1
+            if error is not None: self._stats["errors"] += 1
+            self._export(record)
+
+    def _export(self, record: dict):
+        if not self.trace_file or self._export_failed: return
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.trace_file) or ".", exist_ok=True)
+                self._file = open(self.trace_file, "a", encoding="utf-8", buffering=1) # Line-buffered: one span per line
+                self._file_bytes = self._file.tell()
+            line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+            self._file.write(line)
+            self._file_bytes += len(line.encode("utf-8"))
+            self._stats["exported"] += 1
+            if self._file_bytes >= self.max_file_bytes: self._rotate()
+        except Exception as e:
+            self._export_failed = True # Keep tracing in memory; don't retry on every span
+            print(f"Tracing Warning: Could not write the trace file '{self.trace_file}': {e}")
+
+    def _rotate(self):
+        """Moves the full trace file to '<trace_file>.1' (replacing the previous one); the next span starts a new file."""
+        self._file.close()
+        self._file = None
+        os.replace(self.trace_file, f"{self.trace_file}.1")
+        self._stats["rotations"] += 1
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", session_id: str = None, **attributes):
+        """Times the block as a child of the current span and makes it current inside the block. Errors are recorded and re-raised."""
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        span = self.start_span(name, kind, session_id=session_id, **attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            if not isinstance(e, GeneratorExit): error = e
+            raise
+        finally:
+            try: _current_span.reset(token)
+            except ValueError: _current_span.set(span._parent) # Closed from another context (e.g. a generator finalized elsewhere)
+            self.finish_span(span, error)
+
+    def recent_spans(self, limit: int = 200, session_id: str = None) -> list[dict]:
+        """Most recent finished spans, oldest first, optionally only those of one session."""
+        with self._lock: records = list(self._finished)
+        if session_id is not None: records = [r for r in records if r["session_id"] == session_id]
+        return records[-limit:]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(buffered=len(self._finished), enabled=self.enabled,
+                         trace_file=self.trace_file if self.trace_file and not self._export_failed else None)
+        return stats
+
+
+tracer = Tracer()
+
+def span(name: str, kind: str = "internal", session_id: str = None, **attributes):
+    return tracer.span(name, kind, session_id, **attributes)
+
+def current_span():
+    return _current_span.get() or _NOOP_SPAN
+
+def traced(name: str = None, kind: str = "internal", session_id=None):
+    """
+    Decorator form of span(). session_id may be a callable taking the function's arguments. Generator
+    functions are traced from the first next() to exhaustion (or close).
+    """
+    def decorator(fn):
+        span_name = name or fn.__name__
+        resolve_session = session_id if callable(session_id) else (lambda *args, **kwargs: session_id)
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                with tracer.span(span_name, kind, resolve_session(*args, **kwargs)):
+                    yield from fn(*args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name, kind, resolve_session(*args, **kwargs)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def get_recent_spans(limit: int = 200, session_id: str = None) -> list[dict]:
+    return tracer.recent_spans(limit, session_id)
+
+def get_tracing_stats() -> dict:
+    return tracer.stats()
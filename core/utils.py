@@ -1,51 +1,60 @@
 # core/utils.py
 import re
 
-def is_primarily_story_content(text: str) -> tuple[bool, str | None]:
+# Preambles that come before the slide, in priority order (the first one found in this order is stripped),
+# and the phrases that mark where the follow-up question after the slide begins. The unescaped "." in
+# two preambles is deliberate: it matches any character ("...the first slide!" / ":" / ".").
+_PREAMBLES = (r"alright, let's get started with the story!", r"alright, let's start the story with the first slide.",
+              r"here's the first slide:", r"here's the next slide:", r"continuing with the story...", r"slide \d+:")
+_QUESTION_BOUNDARIES = (r"\(word count: approximately \d+\)", r"how was that\?", r"are you happy with this slide",
+                        r"would you like to change, add, or update anything", r"would you like me to continue",
+                        r"would you like to interact", r"would you like any modifications", r"shall i continue",
+                        r"should i continue", r"what do you think", r"before i continue", r"let me know")
+# One precompiled pattern for the whole scan: a named group per preamble (p0, p1, ...) and one for the question phrases.
+# The groups sit in a lookahead, so matches are zero-width and may overlap (as the separate searches they replace could).
+# The leading lookahead on the phrases' first characters lets the scan skip most positions without trying every alternative.
+_FIRST_CHARS = "".join(sorted({phrase.lstrip("\\")[0] for phrase in _PREAMBLES + _QUESTION_BOUNDARIES}))
+_STORY_BOUNDARY_PATTERN = re.compile(
+    f"(?=[{re.escape(_FIRST_CHARS)}])(?=(?:"
+    + "|".join(f"(?P<p{i}>{preamble})" for i, preamble in enumerate(_PREAMBLES)) + f"|(?P<question>{'|'.join(_QUESTION_BOUNDARIES)})))",
+    re.IGNORECASE)
+_CONFIRMATION_STARTS = ("✅", "ok,", "alright,", "great,", "i see", "perfect!", "understood.", "sounds good.", "sure,")
+_LINGERING_QUESTION_PHRASES = ("would you like", "shall i", "how was that")
+
+def story_content_span(text: str) -> tuple[int, int] | None:
+    """(start, end) offsets of the story slide within text, or None if text isn't primarily story content."""
     if not text or not isinstance(text, str):
-        return False, None
-        
-    potential_story_part = text
-    preambles = [
-        r"alright, let's get started with the story!", r"alright, let's start the story with the first slide.",
-        r"here's the first slide:", r"here's the next slide:", r"continuing with the story...",
-        r"slide \d+:"
-    ]
-    for preamble_pattern in preambles:
-        match = re.search(preamble_pattern, potential_story_part, re.IGNORECASE)
-        if match:
-            potential_story_part = potential_story_part[match.end():].strip()
-            break 
-
-    question_phrases_boundary = [
-        r"\(word count: approximately \d+\)", r"how was that\?", r"are you happy with this slide",
-        r"would you like to change, add, or update anything", r"would you like me to continue",
-        r"would you like to interact", r"would you like any modifications", r"shall i continue", 
-        r"should i continue", r"what do you think", "before i continue", "let me know"
-    ]
-    earliest_question_start = len(potential_story_part)
-    for phrase_pattern in question_phrases_boundary:
-        match = re.search(phrase_pattern, potential_story_part, re.IGNORECASE)
-        if match and match.start() < earliest_question_start:
-            earliest_question_start = match.start()
-            
-    if earliest_question_start < len(potential_story_part):
-        potential_story_part = potential_story_part[:earliest_question_start].strip()
-
-    if not potential_story_part: return False, None
+        return None
+
+    # Single pass: the first occurrence of each preamble and the start of every question phrase.
+    preamble_ends, question_starts = {}, []
+    for match in _STORY_BOUNDARY_PATTERN.finditer(text):
+        if match.lastgroup == "question": question_starts.append(match.start())
+        else: preamble_ends.setdefault(match.lastgroup, match.end(match.lastgroup))
+    story_start = preamble_ends[min(preamble_ends, key=lambda group: int(group[1:]))] if preamble_ends else 0
+    story_end = next((start for start in question_starts if start >= story_start), None) # Only phrases after the preamble count
+    potential_story_part = text[story_start:story_end].strip() if preamble_ends or story_end is not None else text
+
+    if not potential_story_part: return None
     story_part_lower = potential_story_part.lower()
-    
-    confirmation_starts = ["✅", "ok,", "alright,", "great,", "i see", "perfect!", "understood.", "sounds good.", "sure,"]
-    if any(story_part_lower.startswith(start) for start in confirmation_starts): return False, None
-        
+
+    if story_part_lower.startswith(_CONFIRMATION_STARTS): return None
+
     if len(potential_story_part.split()) < 15: # Reduced slightly for short affirmations
         # Check if it's not just a question or very short statement
         if "?" in potential_story_part or story_part_lower.count(".") <=1:
-             return False, None # Likely not substantial story content
+             return None # Likely not substantial story content
 
-    lingering_question_phrases = ["would you like", "shall i", "how was that"]
-    if any(phrase in story_part_lower for phrase in lingering_question_phrases):
-        if story_part_lower.endswith("?") and any(phrase in story_part_lower[-50:] for phrase in lingering_question_phrases):
-            return False, None
+    if any(phrase in story_part_lower for phrase in _LINGERING_QUESTION_PHRASES):
+        if story_part_lower.endswith("?") and any(phrase in story_part_lower[-50:] for phrase in _LINGERING_QUESTION_PHRASES):
+            return None
 
-    return True, potential_story_part.strip()
\ No newline at end of file
+    # The stripped story part is a substring of text; locate it without keeping a copy.
+    window = text[story_start:story_end]
+    story_start += len(window) - len(window.lstrip())
+    return story_start, story_start + len(potential_story_part.strip())
+
+def is_primarily_story_content(text: str) -> tuple[bool, str | None]:
+    span = story_content_span(text)
+    if span is None: return False, None
+    return True, text[span[0]:span[1]]
@@ -0,0 +1,122 @@
+# scripts/benchmark_story_detection.py
+# Per-turn cost of story-content detection as a session grows. The legacy path re-ran a dozen
+# uncompiled re.search calls on every assistant message each time _is_new_story_context was asked
+# (several times per turn); now each message is classified once when it is appended, with one
+# precompiled pattern, and _is_new_story_context reads a counter.
+#
+#   python scripts/benchmark_story_detection.py [--sizes 10 100 1000] [--turns 20] [--checks 3]
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from core.story_state import StoryState
+from core.story_manager import _is_new_story_context
+from core.utils import is_primarily_story_content
+
+
+def legacy_is_primarily_story_content(text: str) -> tuple[bool, str | None]: # As it was in core/utils.py
+    if not text or not isinstance(text, str): return False, None
+    potential_story_part = text
+    preambles = [r"alright, let's get started with the story!", r"alright, let's start the story with the first slide.",
+                 r"here's the first slide:", r"here's the next slide:", r"continuing with the story...", r"slide \d+:"]
+    for preamble_pattern in preambles:
+        match = re.search(preamble_pattern, potential_story_part, re.IGNORECASE)
+        if match: potential_story_part = potential_story_part[match.end():].strip(); break
+    question_phrases_boundary = [r"\(word count: approximately \d+\)", r"how was that\?", r"are you happy with this slide",
+                                 r"would you like to change, add, or update anything", r"would you like me to continue",
+                                 r"would you like to interact", r"would you like any modifications", r"shall i continue",
+                                 r"should i continue", r"what do you think", "before i continue", "let me know"]
+    earliest_question_start = len(potential_story_part)
+    for phrase_pattern in question_phrases_boundary:
+        match = re.search(phrase_pattern, potential_story_part, re.IGNORECASE)
+        if match and match.start() < earliest_question_start: earliest_question_start = match.start()
+    if earliest_question_start < len(potential_story_part): potential_story_part = potential_story_part[:earliest_question_start].strip()
+    if not potential_story_part: return False, None
+    story_part_lower = potential_story_part.lower()
+    if any(story_part_lower.startswith(start) for start in ["✅", "ok,", "alright,", "great,", "i see", "perfect!", "understood.", "sounds good.", "sure,"]): return False, None
+    if len(potential_story_part.split()) < 15:
+        if "?" in potential_story_part or story_part_lower.count(".") <= 1: return False, None
+    lingering_question_phrases = ["would you like", "shall i", "how was that"]
+    if any(phrase in story_part_lower for phrase in lingering_question_phrases):
+        if story_part_lower.endswith("?") and any(phrase in story_part_lower[-50:] for phrase in lingering_question_phrases): return False, None
+    return True, potential_story_part.strip()
+
+def legacy_is_new_story_context(messages: list[dict], last_story_slide_text) -> bool: # As it was in core/story_manager.py
+    story_messages_count = sum(1 for msg in messages if msg['role'] == 'assistant' and legacy_is_primarily_story_content(msg['content'])[0])
+    return len(messages) <= 5 and not last_story_slide_text and story_messages_count == 0
+
+
+WORDS = ("the", "knight", "rode", "through", "silent", "forest", "while", "rain", "fell", "on", "ancient", "stones",
+         "and", "she", "remembered", "a", "promise", "made", "beneath", "burning", "sky", "letter", "hidden", "door")
+
+def make_turn(rng: random.Random, turn: int) -> tuple[dict, dict]:
+    """A user request and a ~300-word assistant slide with a follow-up question."""
+    slide = ". ".join(" ".join(rng.choices(WORDS, k=15)).capitalize() for _ in range(20))
+    return ({"role": "user", "content": f"Continue the story, turn {turn}."},
+            {"role": "assistant", "content": f"Here's the next slide: {slide}. How was that? Would you like me to continue?"})
+
+def build_transcript(n_messages: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    messages = [{"role": "system", "content": "System Initialized. Welcome to the AI Story Weaver!"}]
+    while len(messages) < n_messages: messages.extend(make_turn(rng, len(messages)))
+    return messages[:n_messages]
+
+def time_legacy_turns(transcript: list[dict], turns: int, checks: int) -> float:
+    messages, rng = [dict(m) for m in transcript], random.Random(1)
+    started_at = time.perf_counter()
+    for turn in range(turns):
+        messages.extend(make_turn(rng, turn))
+        for _ in range(checks): legacy_is_new_story_context(messages, None)
+    return (time.perf_counter() - started_at) / turns
+
+def time_current_turns(transcript: list[dict], turns: int, checks: int) -> float:
+    state, rng = StoryState(transcript, [], {}, "DEFAULT", None), random.Random(1) # Loading classifies once, outside the timing
+    started_at = time.perf_counter()
+    for turn in range(turns):
+        for message in make_turn(rng, turn): state.add_message(message["role"], message["content"])
+        for _ in range(checks): _is_new_story_context(state)
+    return (time.perf_counter() - started_at) / turns
+
+SLIDE = "The knight rode through the silent forest while rain fell. She remembered a promise made beneath a burning sky. The door creaked open."
+# Preamble variants the legacy patterns' unescaped "." accepted, and question phrases overlapping a preamble match.
+REGRESSION_SAMPLES = (
+    f"Alright, let's start the story with the first slide! {SLIDE}",
+    f"Alright, let's start the story with the first slide: {SLIDE}",
+    f"Alright, let's start the story with the first slide. {SLIDE} Would you like me to continue?",
+    f"Continuing with the story!!! {SLIDE} How was that?",
+    f"Here's the first slide: {SLIDE} Continuing with the story, how was that?",
+    f"Let me know first. Here's the next slide: {SLIDE} What do you think?",
+    f"✅ Done. {SLIDE}", f"\n\nOK, sure. {SLIDE}", "Shall I continue?",
+)
+
+def check_against_legacy():
+    """The detector must classify exactly as the legacy one did."""
+    samples = list(REGRESSION_SAMPLES) + [make_turn(random.Random(seed), seed)[1]["content"] for seed in range(20)]
+    mismatches = [text for text in samples if is_primarily_story_content(text) != legacy_is_primarily_story_content(text)]
+    assert not mismatches, f"Detector differs from the legacy implementation on: {mismatches[:3]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn story-detection overhead: legacy rescans vs append-time classification.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Session lengths in messages (default: 10 100 1000).")
+    parser.add_argument("--turns", type=int, default=20, help="Turns timed per session length (default: 20).")
+    parser.add_argument("--checks", type=int, default=3, help="_is_new_story_context calls per turn (default: 3).")
+    args = parser.parse_args()
+
+    check_against_legacy()
+    print(f"Per-turn overhead (append a user/assistant pair, {args.checks} new-story checks), mean of {args.turns} turns:")
+    print(f"{'messages':>10}{'legacy ms':>12}{'current ms':>12}")
+    for size in args.sizes:
+        transcript = build_transcript(size, seed=size)
+        legacy_ms = time_legacy_turns(transcript, args.turns, args.checks) * 1000
+        current_ms = time_current_turns(transcript, args.turns, args.checks) * 1000
+        print(f"{size:>10}{legacy_ms:>12.3f}{current_ms:>12.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 # scripts/embed_and_store_styles.py
+import argparse
+import hashlib
+import json
 import os
 import sys
 import time 
+import numpy as np
 from dotenv import load_dotenv
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -9,15 +13,15 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 try:
-    from pinecone import Pinecone, ServerlessSpec 
+    from core.embedding_utils import (
+        get_embeddings, get_embedding_dimension, warm_up_embedding_model, get_embedding_model_stats, chunk_text,
+        MODEL_NAME, CHUNK_WORDS, CHUNK_OVERLAP_WORDS,
+    )
+    from core.style_library import list_author_styles
+    from core.narration import mark_style_index_updated
+    from core.style_store import StyleStore, PineconeStyleStore, LocalStyleStore, STYLE_STORE_LOCAL_DIR, chunk_vector_id
 except ImportError:
-    print("Pinecone client not installed. Please install with 'pip install pinecone-client'.")
-    sys.exit(1)
-
-try:
-    from core.embedding_utils import get_embedding, get_embedding_dimension 
-except ImportError:
-    print("Could not import from core.embedding_utils.")
+    print("Could not import from core.embedding_utils / core.style_library / core.narration / core.style_store.")
     sys.exit(1)
 
 # --- Configuration ---
@@ -31,6 +35,7 @@ else:
 
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = "narration-styles" 
+MANIFEST_VECTOR_LAYOUT_VERSION = 2 # Bump when the stored vector layout changes (2 = centroid + chunks)
 
 # --- Narration Styles to Add/Update ---
 NARRATION_STYLES_DATA = {
@@ -56,13 +61,90 @@ NARRATION_STYLES_DATA = {
     },
 }
 
-def main():
-    if not PINECONE_API_KEY:
-        print("Error: Missing PINECONE_API_KEY."); return
+def build_author_library_styles_data(min_uses: int = 1) -> dict:
+    """Turns emulated authors saved in the shared style library into entries shaped like NARRATION_STYLES_DATA."""
+    styles_data = {}
+    for entry in list_author_styles(min_uses=min_uses):
+        styles_data[entry["style_id"]] = {
+            "text": entry["style_snippet"],
+            "style_name": f"{entry['author_name']} (Emulated)",
+            "description": f"Emulating the writing style of {entry['author_name']}, based on a generated example passage.",
+            "keywords": [entry["author_name"].lower(), "author emulation"],
+            "source": "author_library",
+        }
+    return styles_data
+
+def read_style_text(style_id: str, style_data: dict) -> str | None:
+    if "text" in style_data: # Library entries carry their text inline
+        narration_text = style_data["text"]
+        if not narration_text or not narration_text.strip():
+            print(f"Warning: Stored text for '{style_id}' is empty. Skipping."); return None
+        return narration_text
+
+    if not os.path.exists(style_data["text_file"]):
+        print(f"Error: Text file not found: {style_data['text_file']}. Skipping '{style_id}'.")
+        return None
+    try:
+        with open(style_data["text_file"], "r", encoding="utf-8") as f:
+            narration_text = f.read()
+        if not narration_text.strip():
+            print(f"Warning: Text file for '{style_id}' is empty. Skipping."); return None
+        # For bennet.txt, it has repeated content. We only need one instance for the snippet.
+        # Let's ensure we take a clean segment if there are obvious markers.
+        # For now, assuming the first part is representative.
+        # The script already takes narration_text[:500] for the snippet.
+        print(f"Read text from {style_data['text_file']} (length: {len(narration_text)} chars)")
+        return narration_text
+    except Exception as e:
+        print(f"Error reading file for '{style_id}': {e}. Skipping."); return None
+
+def build_style_vectors(style_id: str, style_data: dict, narration_text: str, chunks: list, chunk_embeddings: list) -> list:
+    """One pooled centroid vector under the style id (with the full style metadata) plus one vector per chunk."""
+    # Determine the snippet to store. If bennet.txt has duplicate "Episode 1", take first one.
+    effective_text_for_snippet = narration_text
+    if style_id == "BENNET_REGENCY": # Specific handling if needed for bennet.txt structure
+        parts = narration_text.split("Episode 1: A Dance of Duty")
+        if len(parts) > 1: # Found the marker
+             # Take the content after the first marker, up to a reasonable length for a snippet,
+             # or before the next potential marker if it's very long.
+             # For simplicity, we rely on the [:500] general rule below.
+             # This simple split just ensures we don't start mid-way if the file is messy.
+             # A more robust way would be to find the end of the first logical episode.
+             # For now, the default [:500] on the whole text is likely fine given the file content.
+             pass # No change to effective_text_for_snippet, default handling is okay.
+
+    chunk_matrix = np.asarray(chunk_embeddings, dtype=np.float32)
+    centroid = chunk_matrix.mean(axis=0)
+    centroid /= (np.linalg.norm(centroid) or 1.0)
+
+    vectors = [{
+        "id": style_id, 
+        "values": centroid.tolist(),
+        "metadata": {
+            "style_id": style_id,
+            "kind": "centroid",
+            "chunk_count": len(chunks),
+            "style_name": style_data["style_name"], 
+            "description": style_data["description"], # This now contains specific guidelines for Bennet
+            "keywords": style_data.get("keywords", []),
+            "source_text_snippet": effective_text_for_snippet[:500].strip() + ("..." if len(effective_text_for_snippet) > 500 else "")
+        }
+    }]
+    for chunk_index, chunk_embedding in enumerate(chunk_embeddings):
+        vectors.append({
+            "id": chunk_vector_id(style_id, chunk_index),
+            "values": chunk_embedding,
+            "metadata": {"style_id": style_id, "kind": "chunk", "chunk_index": chunk_index, "style_name": style_data["style_name"]},
+        })
+    return vectors
 
-    if get_embedding_dimension() is None:
-        print("Error: Embedding model failed to load."); return
-    embedding_dim = get_embedding_dimension()
+def open_pinecone_style_store(embedding_dim: int) -> PineconeStyleStore | None:
+    if not PINECONE_API_KEY:
+        print("Error: Missing PINECONE_API_KEY."); return None
+    try:
+        from pinecone import Pinecone, ServerlessSpec # Only needed for this backend; --backend local works without it
+    except ImportError:
+        print("Pinecone client not installed. Please install with 'pip install pinecone-client', or use --backend local."); return None
 
     try:
         print("Initializing Pinecone client...")
@@ -91,78 +173,157 @@ def main():
             print(f"Index stats: {stats}")
         except Exception as e_stats:
             print(f"Could not get index stats: {e_stats}")
+        return PineconeStyleStore(index, PINECONE_INDEX_NAME)
 
     except Exception as e:
-        print(f"Error during Pinecone initialization or index connection: {e}"); return
+        print(f"Error during Pinecone initialization or index connection: {e}"); return None
 
-    vectors_to_upsert = []
-    for style_id, style_data in NARRATION_STYLES_DATA.items():
-        print(f"\nProcessing style: {style_id} - {style_data['style_name']}")
-        
-        if not os.path.exists(style_data["text_file"]):
-            print(f"Error: Text file not found: {style_data['text_file']}. Skipping '{style_id}'.")
-            continue
-            
+def open_target_style_store(backend: str, embedding_dim: int) -> StyleStore | None:
+    if backend == "auto":
+        backend = "local" if LocalStyleStore.exists(STYLE_STORE_LOCAL_DIR) else "pinecone"
+    if backend == "local":
         try:
-            with open(style_data["text_file"], "r", encoding="utf-8") as f:
-                narration_text = f.read()
-            if not narration_text.strip():
-                print(f"Warning: Text file for '{style_id}' is empty. Skipping."); continue
-            # For bennet.txt, it has repeated content. We only need one instance for the snippet.
-            # Let's ensure we take a clean segment if there are obvious markers.
-            # For now, assuming the first part is representative.
-            # The script already takes narration_text[:500] for the snippet.
-            print(f"Read text from {style_data['text_file']} (length: {len(narration_text)} chars)")
+            style_store = LocalStyleStore(STYLE_STORE_LOCAL_DIR, dimension=embedding_dim)
+            print(f"Using local style store at '{STYLE_STORE_LOCAL_DIR}'.")
+            return style_store
         except Exception as e:
-            print(f"Error reading file for '{style_id}': {e}. Skipping."); continue
-
-        print(f"Generating embedding for style '{style_id}'...")
-        # The embedding is generated on the full text to capture its overall semantic meaning for potential similarity search.
-        # The snippet for direct LLM guidance is taken from the raw text.
-        embedding = get_embedding(narration_text) 
-        if embedding is None:
-            print(f"Failed to generate embedding for '{style_id}'. Skipping."); continue
-
-        # Determine the snippet to store. If bennet.txt has duplicate "Episode 1", take first one.
-        effective_text_for_snippet = narration_text
-        if style_id == "BENNET_REGENCY": # Specific handling if needed for bennet.txt structure
-            parts = narration_text.split("Episode 1: A Dance of Duty")
-            if len(parts) > 1: # Found the marker
-                 # Take the content after the first marker, up to a reasonable length for a snippet,
-                 # or before the next potential marker if it's very long.
-                 # For simplicity, we rely on the [:500] general rule below.
-                 # This simple split just ensures we don't start mid-way if the file is messy.
-                 # A more robust way would be to find the end of the first logical episode.
-                 # For now, the default [:500] on the whole text is likely fine given the file content.
-                 pass # No change to effective_text_for_snippet, default handling is okay.
-
-
-        vector = {
-            "id": style_id, 
-            "values": embedding,
-            "metadata": {
-                "style_name": style_data["style_name"], 
-                "description": style_data["description"], # This now contains specific guidelines for Bennet
-                "keywords": style_data.get("keywords", []),
-                "source_text_snippet": effective_text_for_snippet[:500].strip() + ("..." if len(effective_text_for_snippet) > 500 else "")
+            print(f"Error opening local style store '{STYLE_STORE_LOCAL_DIR}': {e}"); return None
+    return open_pinecone_style_store(embedding_dim)
+
+def compute_style_hash(style_data: dict, narration_text: str) -> str:
+    """Hash of everything that affects a style's stored vectors: source text, metadata and embedding setup."""
+    hashed_content = {
+        "text": narration_text,
+        "metadata": {key: style_data.get(key) for key in ("style_name", "description", "keywords")},
+        "embedding_model": MODEL_NAME,
+        "chunking": [CHUNK_WORDS, CHUNK_OVERLAP_WORDS],
+        "vector_layout": MANIFEST_VECTOR_LAYOUT_VERSION,
+    }
+    return hashlib.sha256(json.dumps(hashed_content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def get_manifest_path(style_store: StyleStore) -> str:
+    # One manifest per target store: the same style may be current in Pinecone but missing from a local snapshot.
+    if style_store.backend_name == "local":
+        return os.path.join(style_store.directory, "manifest.json")
+    return os.path.join(project_root, "data", f"style_manifest_{style_store.backend_name}_{PINECONE_INDEX_NAME}.json")
+
+def load_manifest(manifest_path: str) -> dict:
+    if not os.path.exists(manifest_path): return {"styles": {}}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest.setdefault("styles", {})
+        return manifest
+    except Exception as e:
+        print(f"Warning: Could not read manifest '{manifest_path}' ({e}). All styles will be re-embedded.")
+        return {"styles": {}}
+
+def save_manifest(manifest_path: str, manifest: dict):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    manifest["updated_at"] = time.time()
+    with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embed narration styles and store them in the style index.")
+    parser.add_argument("--include-author-library", action="store_true", help="Also index emulated authors saved in the style library.")
+    parser.add_argument("--min-uses", type=int, default=1, help="Only index library authors emulated at least this many times.")
+    parser.add_argument("--force", action="store_true", help="Re-embed every style, even those whose content hash is unchanged.")
+    parser.add_argument("--backend", choices=["auto", "pinecone", "local"], default=os.getenv("STYLE_STORE_BACKEND", "auto").lower(),
+                        help="Style store to write to (default: STYLE_STORE_BACKEND, else 'auto').")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    styles_data = dict(NARRATION_STYLES_DATA)
+    included_sources = {"config"}
+    if args.include_author_library:
+        library_styles = build_author_library_styles_data(min_uses=args.min_uses)
+        print(f"Including {len(library_styles)} emulated author style(s) from the style library.")
+        styles_data.update(library_styles)
+        included_sources.add("author_library")
+
+    style_store = open_target_style_store(args.backend, get_embedding_dimension())
+    if style_store is None: return
+    manifest_path = get_manifest_path(style_store)
+    manifest = load_manifest(manifest_path) # Also read with --force: it lists the vectors that removed styles and chunks left behind
+    print(f"Using style manifest: {manifest_path}{' (content hashes ignored: --force)' if args.force else ''}")
+
+    pending_styles = []
+    skipped_style_ids = []
+    for style_id, style_data in styles_data.items():
+        print(f"\nProcessing style: {style_id} - {style_data['style_name']}")
+        
+        narration_text = read_style_text(style_id, style_data)
+        if narration_text is None: continue
+
+        content_hash = compute_style_hash(style_data, narration_text)
+        if not args.force and manifest["styles"].get(style_id, {}).get("content_hash") == content_hash:
+            print(f"'{style_id}' is unchanged since the last run. Skipping.")
+            skipped_style_ids.append(style_id); continue
+
+        # MiniLM truncates long inputs, so the whole example is embedded as overlapping chunks.
+        chunks = chunk_text(narration_text)
+        print(f"Split '{style_id}' into {len(chunks)} overlapping chunks.")
+        pending_styles.append((style_id, style_data, narration_text, chunks, content_hash))
+
+    # Styles that were indexed before but are no longer configured (only for the sources included in this run).
+    removed_style_ids = [
+        style_id for style_id, entry in manifest["styles"].items()
+        if style_id not in styles_data and entry.get("source", "config") in included_sources
+    ]
+
+    vectors_to_upsert = []
+    new_manifest_entries = {}
+    stale_vector_ids = []
+    all_chunks = [chunk for _, _, _, chunks, _ in pending_styles for chunk in chunks]
+    if all_chunks:
+        warm_up_embedding_model(background=False) # Only paid when something actually changed
+        model_stats = get_embedding_model_stats()
+        if not model_stats["loaded"]:
+            print(f"Error: Embedding model failed to load: {model_stats['error']}"); return
+
+        print(f"\nGenerating embeddings for {len(all_chunks)} chunks across {len(pending_styles)} styles in one batch...")
+        all_chunk_embeddings = get_embeddings(all_chunks)
+        if all_chunk_embeddings is None:
+            print("Failed to generate chunk embeddings. Nothing will be upserted."); return
+        offset = 0
+        for style_id, style_data, narration_text, chunks, content_hash in pending_styles:
+            chunk_embeddings = all_chunk_embeddings[offset:offset + len(chunks)]
+            offset += len(chunks)
+            style_vectors = build_style_vectors(style_id, style_data, narration_text, chunks, chunk_embeddings)
+            vectors_to_upsert.extend(style_vectors)
+            vector_ids = [vector["id"] for vector in style_vectors]
+            # A shorter text leaves fewer chunks: drop the old chunk vectors that no longer exist.
+            stale_vector_ids.extend(set(manifest["styles"].get(style_id, {}).get("vector_ids", [])) - set(vector_ids))
+            new_manifest_entries[style_id] = {
+                "content_hash": content_hash, "vector_ids": vector_ids,
+                "source": style_data.get("source", "config"), "updated_at": time.time(),
             }
-        }
-        vectors_to_upsert.append(vector)
+    for style_id in removed_style_ids:
+        stale_vector_ids.extend(manifest["styles"][style_id].get("vector_ids", []))
 
-    if vectors_to_upsert:
+    if vectors_to_upsert or stale_vector_ids:
         try:
-            print(f"\nUpserting {len(vectors_to_upsert)} vectors to Pinecone index '{PINECONE_INDEX_NAME}'...")
-            batch_size = 100 
-            for i in range(0, len(vectors_to_upsert), batch_size):
-                batch = vectors_to_upsert[i:i + batch_size]
-                upsert_response = index.upsert(vectors=batch)
-                print(f"Upserted batch {i//batch_size + 1}. Response: {upsert_response}")
-            print(f"Successfully stored/updated styles in Pinecone.")
+            if vectors_to_upsert:
+                print(f"\nUpserting {len(vectors_to_upsert)} vectors to {style_store.backend_name} style store {style_store.describe()}...")
+                style_store.upsert(vectors_to_upsert)
+            if stale_vector_ids:
+                print(f"Deleting {len(stale_vector_ids)} stale vectors ({len(removed_style_ids)} removed style(s): {removed_style_ids})...")
+                style_store.delete(stale_vector_ids)
+            print(f"Successfully stored/updated styles in the {style_store.backend_name} style store.")
+            manifest["styles"].update(new_manifest_entries)
+            for style_id in removed_style_ids: del manifest["styles"][style_id]
+            save_manifest(manifest_path, manifest)
+            mark_style_index_updated() # Running app processes drop their cached styles on next lookup
         except Exception as e:
-            print(f"Error upserting to Pinecone: {e}")
+            print(f"Error updating the {style_store.backend_name} style store: {e}")
     else:
         print("\nNo valid vectors to upsert.")
 
+    print(f"\nSummary: {len(pending_styles)} style(s) embedded and upserted, {len(removed_style_ids)} removed, "
+          f"{len(skipped_style_ids)} unchanged style(s) skipped without embedding or upserting: {skipped_style_ids}")
     print("\nEmbedding and storing process finished.")
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+# scripts/style_store_snapshot.py
+# Snapshot the Pinecone 'narration-styles' index to a local style store (export), or push a
+# local snapshot back to Pinecone (import). With a snapshot on disk and STYLE_STORE_BACKEND
+# set to 'local' (or 'auto'), the app serves narration styles with zero network I/O.
+#
+#   python scripts/style_store_snapshot.py export [--dir data/style_store]
+#   python scripts/style_store_snapshot.py import [--dir data/style_store]
+import argparse
+import os
+import shutil
+import sys
+from dotenv import load_dotenv
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+dotenv_path = os.path.join(project_root, '.env')
+if os.path.exists(dotenv_path):
+    load_dotenv(dotenv_path)
+
+try:
+    from pinecone import Pinecone
+except ImportError:
+    print("Pinecone client not installed. Please install with 'pip install pinecone'.")
+    sys.exit(1)
+
+from core.style_store import LocalStyleStore, PineconeStyleStore, STYLE_STORE_LOCAL_DIR, copy_style_store
+
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_INDEX_NAME = "narration-styles"
+
+
+def open_pinecone_store() -> PineconeStyleStore | None:
+    if not PINECONE_API_KEY:
+        print("Error: Missing PINECONE_API_KEY."); return None
+    try:
+        pinecone_client = Pinecone(api_key=PINECONE_API_KEY)
+        index_names = [idx_spec.name for idx_spec in pinecone_client.list_indexes().indexes]
+        if PINECONE_INDEX_NAME not in index_names:
+            print(f"Error: Pinecone index '{PINECONE_INDEX_NAME}' not found. Create it with scripts/embed_and_store_styles.py."); return None
+        return PineconeStyleStore(pinecone_client.Index(PINECONE_INDEX_NAME), PINECONE_INDEX_NAME)
+    except Exception as e:
+        print(f"Error connecting to Pinecone: {e}"); return None
+
+def export_snapshot(directory: str) -> int:
+    pinecone_store = open_pinecone_store()
+    if pinecone_store is None: return 0
+    tmp_directory = f"{directory}.export-tmp"
+    if os.path.isdir(tmp_directory): shutil.rmtree(tmp_directory) # Leftover from an interrupted export
+    copied = copy_style_store(pinecone_store, LocalStyleStore(tmp_directory, create=True))
+    if not copied:
+        print(f"Pinecone index '{PINECONE_INDEX_NAME}' has no vectors. Nothing exported."); return 0
+    if os.path.isdir(directory):
+        backup_directory = f"{directory}.bak"
+        if os.path.isdir(backup_directory): shutil.rmtree(backup_directory)
+        os.replace(directory, backup_directory)
+    os.replace(tmp_directory, directory) # Swap in the complete snapshot so readers never see a partial one
+    print(f"Exported {copied} vectors from Pinecone index '{PINECONE_INDEX_NAME}' to '{directory}'.")
+    return copied
+
+def import_snapshot(directory: str) -> int:
+    if not LocalStyleStore.exists(directory):
+        print(f"Error: No local style store snapshot at '{directory}'."); return 0
+    pinecone_store = open_pinecone_store()
+    if pinecone_store is None: return 0
+    copied = copy_style_store(LocalStyleStore(directory), pinecone_store)
+    print(f"Imported {copied} vectors from '{directory}' into Pinecone index '{PINECONE_INDEX_NAME}'.")
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export/import narration style vectors between Pinecone and a local snapshot.")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("--dir", default=STYLE_STORE_LOCAL_DIR, help=f"Local snapshot directory (default: {STYLE_STORE_LOCAL_DIR}).")
+    args = parser.parse_args()
+    if args.action == "export": export_snapshot(args.dir)
+    else: import_snapshot(args.dir)
+
+if __name__ == "__main__":
+    main()